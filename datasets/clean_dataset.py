@@ -1,14 +1,26 @@
 import json
-from typing import List, Dict
-
-def clean_dataset(input_file: str, output_file: str) -> None:
+from typing import Dict, Iterable, List, Optional
+
+def clean_dataset(
+    input_file: str,
+    output_file: str,
+    dedup: bool = True,
+    near_duplicates: bool = True,
+    near_threshold: float = 0.8,
+    collapse_repeats: bool = False,
+) -> None:
     """
     Clean a dataset by validating and processing JSON records from an input file
     and saving the cleaned data to an output file.
 
     Args:
         input_file (str): Path to the input JSONL file containing the dataset
-        output_file (str): Path where the cleaned dataset will be saved
+        output_file (str): Path where the cleaned dataset will be saved; a `.parquet`
+            extension saves it in the columnar format instead of JSONL
+        dedup (bool): Remove duplicate texts, keeping the first occurrence (default: True)
+        near_duplicates (bool): Also remove near duplicates found by MinHash LSH (default: True)
+        near_threshold (float): Jaccard similarity from which two texts are near duplicates (default: 0.8)
+        collapse_repeats (bool): Treat texts differing only in repeated letters as duplicates (default: False)
 
     The function expects each line in the input file to be a valid JSON object
     containing 'InputText' and 'SentimentLabel' fields.
@@ -22,8 +34,18 @@ def clean_dataset(input_file: str, output_file: str) -> None:
         # Clean and validate each entry
         cleaned_data = process_entries(dataset)
 
+        # Drop exact and near duplicates so they neither repeat in training nor leak into the validation split
+        if dedup:
+            cleaned_data = remove_duplicates(cleaned_data, near_duplicates, near_threshold, collapse_repeats)
+
         # Save the cleaned dataset
-        save_dataset(cleaned_data, output_file)
+        if output_file.endswith('.parquet'):
+            # pyarrow is only needed for the columnar format
+            from columnar import save_parquet
+
+            save_parquet(cleaned_data, output_file)
+        else:
+            save_dataset(cleaned_data, output_file)
 
         print(f"Successfully cleaned dataset saved to {output_file}")
         print(f"Processed {len(dataset)} entries, saved {len(cleaned_data)} valid entries")
@@ -48,12 +70,12 @@ def load_dataset(file_path: str) -> List[Dict]:
     with open(file_path, 'r', encoding='utf-8') as file:
         return [json.loads(line) for line in file]
 
-def process_entries(dataset: List[Dict]) -> List[Dict]:
+def process_entries(dataset: Iterable[Dict]) -> List[Dict]:
     """
     Process and validate each entry in the dataset.
 
     Args:
-        dataset (List[Dict]): List of data entries to process
+        dataset (Iterable[Dict]): Data entries to process
 
     Returns:
         List[Dict]: List of validated and cleaned entries
@@ -61,25 +83,85 @@ def process_entries(dataset: List[Dict]) -> List[Dict]:
     cleaned_data = []
     
     for entry in dataset:
-        # Verify required fields exist
-        if not all(key in entry for key in ('InputText', 'SentimentLabel')):
-            print(f"Warning: Missing required fields in entry: {entry}")
-            continue
-
-        # Validate SentimentLabel is a string
-        if not isinstance(entry['SentimentLabel'], str):
-            print(f"Warning: Invalid SentimentLabel type in entry: {entry}")
-            continue
-
-        # Validate InputText is not empty
-        if not entry['InputText'].strip():
-            print(f"Warning: Empty InputText in entry: {entry}")
+        problem = entry_problem(entry)
+        if problem is not None:
+            print(f"Warning: {problem} in entry: {entry}")
             continue
 
         cleaned_data.append(entry)
     
     return cleaned_data
 
+def remove_duplicates(
+    data: List[Dict],
+    near_duplicates: bool = True,
+    threshold: float = 0.8,
+    collapse_repeats: bool = False,
+) -> List[Dict]:
+    """
+    Remove exact and near-duplicate entries and report the training tokens saved.
+
+    Entries are only duplicates of entries with the same label; texts that
+    appear with several labels are kept and listed in the report.
+
+    Args:
+        data (List[Dict]): Validated entries
+        near_duplicates (bool): Also remove near duplicates (default: True)
+        threshold (float): Jaccard similarity from which two texts are near duplicates (default: 0.8)
+        collapse_repeats (bool): Treat texts differing only in repeated letters as duplicates (default: False)
+
+    Returns:
+        List[Dict]: Entries whose text was seen first, in input order
+    """
+    # Near-duplicate detection needs numpy, so plain cleaning runs without it
+    from dedup import dedup_report, deduplicate, estimate_tokens
+
+    kept = []
+    removed_exact = 0
+    removed_near = 0
+    tokens_saved = 0
+    conflicts: List = []
+
+    for entry, reason in deduplicate(data, near_duplicates, threshold, collapse_repeats=collapse_repeats,
+                                     conflicts=conflicts):
+        if reason is None:
+            kept.append(entry)
+            continue
+        if reason.startswith("Exact"):
+            removed_exact += 1
+        else:
+            removed_near += 1
+        tokens_saved += estimate_tokens(entry)
+
+    dedup_report(removed_exact, removed_near, tokens_saved, len(data), conflicts)
+    return kept
+
+def entry_problem(entry: Dict) -> Optional[str]:
+    """
+    Check a single entry.
+
+    Args:
+        entry (Dict): Data entry to check
+
+    Returns:
+        Optional[str]: None if the entry is valid, otherwise the reason it is rejected
+    """
+    # Verify required fields exist
+    if not all(key in entry for key in ('InputText', 'SentimentLabel')):
+        return "Missing required fields"
+
+    # Validate SentimentLabel is a string
+    if not isinstance(entry['SentimentLabel'], str):
+        return "Invalid SentimentLabel type"
+
+    # Validate InputText is a non-empty string
+    if not isinstance(entry['InputText'], str):
+        return "Invalid InputText type"
+    if not entry['InputText'].strip():
+        return "Empty InputText"
+
+    return None
+
 def save_dataset(data: List[Dict], file_path: str) -> None:
     """
     Save the cleaned dataset to a JSONL file.
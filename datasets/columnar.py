@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import json
+from typing import Dict, Iterable, Iterator, List, Optional
+
+ROW_GROUP_SIZE = 100_000
+
+def _require_pyarrow():
+    """Import pyarrow, which is only needed for the columnar format."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet support requires pyarrow: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+def text_hash(text: str) -> int:
+    """
+    Stable 64-bit hash of an input text.
+
+    Args:
+        text (str): Input text
+
+    Returns:
+        int: Unsigned 64-bit hash
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class ParquetDatasetWriter:
+    """
+    Write dataset entries to a compressed Parquet file one row group at a time.
+
+    Entries are buffered until `row_group_size` rows are collected, so memory
+    use stays bounded. Each row gets a sequential `RowId` and a `TextHash` of
+    its `InputText`.
+    """
+
+    def __init__(self, file_path: str, row_group_size: int = ROW_GROUP_SIZE, compression: str = 'zstd'):
+        pa, pq = _require_pyarrow()
+        self._pa = pa
+        self.schema = pa.schema([
+            ("RowId", pa.uint64()),
+            ("InputText", pa.string()),
+            ("SentimentLabel", pa.string()),
+            ("TextHash", pa.uint64()),
+        ])
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._writer = pq.ParquetWriter(file_path, self.schema, compression=compression)
+        self._buffer: List[Dict] = []
+
+    def write(self, entry: Dict) -> None:
+        self._buffer.append(entry)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush()
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        texts = [entry['InputText'] for entry in self._buffer]
+        table = self._pa.Table.from_arrays([
+            self._pa.array(range(self.rows_written, self.rows_written + len(texts)), self._pa.uint64()),
+            self._pa.array(texts, self._pa.string()),
+            self._pa.array([entry['SentimentLabel'] for entry in self._buffer], self._pa.string()),
+            self._pa.array([text_hash(text) for text in texts], self._pa.uint64()),
+        ], schema=self.schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows_written += len(texts)
+        self._buffer = []
+
+def save_parquet(data: Iterable[Dict], file_path: str, row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """
+    Save dataset entries to a Parquet file.
+
+    Args:
+        data (Iterable[Dict]): Entries with 'InputText' and 'SentimentLabel' fields
+        file_path (str): Path where the Parquet file will be saved
+        row_group_size (int): Rows per row group
+
+    Returns:
+        int: Number of rows written
+    """
+    with ParquetDatasetWriter(file_path, row_group_size) as writer:
+        for entry in data:
+            writer.write(entry)
+    return writer.rows_written
+
+def jsonl_to_parquet(jsonl_file: str, parquet_file: str, row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """
+    Convert a JSONL dataset to Parquet, streaming line by line.
+
+    Args:
+        jsonl_file (str): Path to the input JSONL file
+        parquet_file (str): Path where the Parquet file will be saved
+        row_group_size (int): Rows per row group
+
+    Returns:
+        int: Number of rows written
+    """
+    with open(jsonl_file, 'r', encoding='utf-8') as file:
+        return save_parquet((json.loads(line) for line in file if line.strip()), parquet_file, row_group_size)
+
+def open_parquet(file_path: str):
+    """
+    Open a Parquet file through a memory map.
+
+    Column chunks are read from the mapped file on demand, so only the row
+    groups and columns that are accessed are paged in.
+
+    Args:
+        file_path (str): Path to the Parquet file
+
+    Returns:
+        pyarrow.parquet.ParquetFile: File handle exposing metadata and row groups
+    """
+    pa, pq = _require_pyarrow()
+    return pq.ParquetFile(pa.memory_map(file_path, 'r'))
+
+def read_parquet(file_path: str, columns: Optional[List[str]] = None, row_groups: Optional[List[int]] = None):
+    """
+    Read selected columns and row groups of a Parquet dataset.
+
+    Args:
+        file_path (str): Path to the Parquet file
+        columns (Optional[List[str]]): Columns to read (default: all)
+        row_groups (Optional[List[int]]): Row groups to read (default: all)
+
+    Returns:
+        pyarrow.Table: The requested slice
+    """
+    parquet_file = open_parquet(file_path)
+    if row_groups is None:
+        return parquet_file.read(columns=columns)
+    return parquet_file.read_row_groups(row_groups, columns=columns)
+
+def iter_parquet_records(file_path: str, columns: Optional[List[str]] = None, batch_size: int = 10_000) -> Iterator[Dict]:
+    """
+    Stream the rows of a Parquet dataset as dictionaries.
+
+    Args:
+        file_path (str): Path to the Parquet file
+        columns (Optional[List[str]]): Columns to include (default: all)
+        batch_size (int): Rows decoded at a time
+
+    Yields:
+        Dict: One row per entry
+    """
+    for batch in open_parquet(file_path).iter_batches(batch_size=batch_size, columns=columns):
+        yield from batch.to_pylist()
+
+def parquet_stats(file_path: str) -> Dict:
+    """
+    Compute dataset statistics from the label and text columns only.
+
+    Args:
+        file_path (str): Path to the Parquet file
+
+    Returns:
+        Dict: Row and row group counts, label distribution, text length summary and duplicate count
+    """
+    parquet_file = open_parquet(file_path)
+    import pyarrow.compute as pc
+
+    table = parquet_file.read(columns=["InputText", "SentimentLabel", "TextHash"])
+    lengths = pc.utf8_length(table["InputText"])
+    labels = {
+        item["values"]: item["counts"]
+        for item in pc.value_counts(table["SentimentLabel"]).to_pylist()
+    }
+    return {
+        "rows": table.num_rows,
+        "row_groups": parquet_file.num_row_groups,
+        "labels": labels,
+        "text_length": {
+            "min": pc.min(lengths).as_py(),
+            "mean": pc.mean(lengths).as_py(),
+            "max": pc.max(lengths).as_py(),
+        },
+        "duplicate_texts": table.num_rows - pc.count_distinct(table["TextHash"]).as_py(),
+    }
+
+def verify_parquet(file_path: str) -> Optional[str]:
+    """
+    Verify the schema and required fields of a Parquet dataset.
+
+    Args:
+        file_path (str): Path to the Parquet file
+
+    Returns:
+        Optional[str]: None if the file is valid, otherwise the problem found
+    """
+    parquet_file = open_parquet(file_path)
+    import pyarrow.compute as pc
+
+    missing = [name for name in ("InputText", "SentimentLabel") if name not in parquet_file.schema_arrow.names]
+    if missing:
+        return f"Missing columns: {', '.join(missing)}"
+
+    table = parquet_file.read(columns=["InputText", "SentimentLabel"])
+    for name in ("InputText", "SentimentLabel"):
+        if table[name].null_count:
+            return f"{table[name].null_count} rows with a missing {name}"
+    empty = pc.sum(pc.equal(pc.utf8_length(pc.utf8_trim_whitespace(table["InputText"])), 0)).as_py() or 0
+    if empty:
+        return f"{empty} rows with an empty InputText"
+    return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert and inspect Parquet datasets.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="Convert a JSONL dataset to Parquet")
+    convert.add_argument("jsonl_file")
+    convert.add_argument("parquet_file")
+    convert.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    stats = subparsers.add_parser("stats", help="Print statistics of a Parquet dataset")
+    stats.add_argument("parquet_file")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        rows = jsonl_to_parquet(args.jsonl_file, args.parquet_file, args.row_group_size)
+        print(f"Wrote {rows} rows to {args.parquet_file}")
+    else:
+        print(json.dumps(parquet_stats(args.parquet_file), indent=2, ensure_ascii=False))
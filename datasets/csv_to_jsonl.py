@@ -1,8 +1,27 @@
 import csv
+import io
 import json
-from typing import List, Dict, Optional
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
 
-def convert_csv_to_jsonl(csv_file: str, jsonl_file: str, text_column: int = 1, label_column: int = 2) -> Optional[int]:
+MAX_REPORTED_ERRORS = 10
+# Rows rejected for their label are printed one by one as they are read; other problems are sampled
+INVALID_LABEL = "Invalid sentiment label"
+# Range sizes are picked from the file size so every worker gets several ranges, within these bounds
+MIN_CHUNK_BYTES = 1024 * 1024
+CHUNK_BYTES = 64 * 1024 * 1024
+CHUNKS_PER_WORKER = 4
+
+def convert_csv_to_jsonl(
+    csv_file: str,
+    jsonl_file: str,
+    text_column: int = 1,
+    label_column: int = 2,
+    workers: int = 1,
+) -> Optional[int]:
     """
     Convert a CSV file to JSONL format for sentiment analysis.
     
@@ -11,6 +30,7 @@ def convert_csv_to_jsonl(csv_file: str, jsonl_file: str, text_column: int = 1, l
         jsonl_file (str): Path where the JSONL output will be saved
         text_column (int): Index of the column containing the text data (default: 1)
         label_column (int): Index of the column containing the sentiment labels (default: 2)
+        workers (int): Number of processes; above 1 the file is converted in parallel chunks (default: 1)
     
     Returns:
         Optional[int]: Number of records processed successfully, or None if an error occurred
@@ -23,7 +43,13 @@ def convert_csv_to_jsonl(csv_file: str, jsonl_file: str, text_column: int = 1, l
     processed_count = 0
 
     try:
-        with open(csv_file, 'r', encoding='utf-8') as csvfile:
+        if workers > 1:
+            processed_count = convert_csv_to_jsonl_parallel(csv_file, jsonl_file, text_column, label_column, workers)
+            print(f"Successfully converted {processed_count} records to JSONL format")
+            return processed_count
+
+        # newline='' leaves line breaks inside quoted fields as they are, like the parallel conversion
+        with open(csv_file, 'r', encoding='utf-8', newline='') as csvfile:
             # Validate CSV file structure
             csv_reader = csv.reader(csvfile)
             header = next(csv_reader)  # Read header row
@@ -59,31 +85,21 @@ def process_csv_rows(csv_reader: csv.reader, jsonl_file: str, text_column: int,
     """
     processed_count = 0
     errors = []
+    invalid_labels = 0
 
     with open(jsonl_file, 'w', encoding='utf-8') as jsonlfile:
         for row_num, row in enumerate(csv_reader, start=2):  # Start from 2 to account for header
             try:
-                # Validate row structure
-                if len(row) <= max(text_column, label_column):
-                    errors.append(f"Row {row_num}: Invalid number of columns")
+                json_record, problem = row_to_record(row, text_column, label_column)
+                if problem is not None and problem.startswith(INVALID_LABEL):
+                    print(f"Row {row_num}: {problem}")
+                    invalid_labels += 1
                     continue
-
-                # Validate and clean text
-                text = row[text_column].strip()
-                if not text:
-                    errors.append(f"Row {row_num}: Empty text field")
+                if problem is not None:
+                    errors.append(f"Row {row_num}: {problem}")
                     continue
 
-                # Validate and convert sentiment label
-                label = validate_sentiment_label(row[label_column], row_num)
-                if label is None:
-                    continue
-
-                # Create and write JSON record
-                json_record = {
-                    "InputText": text,
-                    "SentimentLabel": label
-                }
+                # Write JSON record
                 jsonlfile.write(json.dumps(json_record, ensure_ascii=False) + '\n')
                 processed_count += 1
 
@@ -91,15 +107,292 @@ def process_csv_rows(csv_reader: csv.reader, jsonl_file: str, text_column: int,
                 errors.append(f"Row {row_num}: Error processing row: {str(e)}")
 
     # Report errors if any occurred
-    if errors:
+    report_errors(errors[:MAX_REPORTED_ERRORS], len(errors), invalid_labels)
+
+    return processed_count
+
+def report_errors(first_errors: List[str], error_count: int, invalid_labels: int = 0) -> None:
+    """
+    Print the first conversion warnings, how many more there were, and how many rows were skipped.
+
+    Args:
+        first_errors (List[str]): First error messages, in row order
+        error_count (int): Total number of errors, not counting invalid labels
+        invalid_labels (int): Number of rows skipped for their label, already printed row by row
+    """
+    if error_count:
         print("\nWarnings during conversion:")
-        for error in errors[:10]:  # Show first 10 errors
+        for error in first_errors[:MAX_REPORTED_ERRORS]:  # Show first 10 errors
             print(error)
-        if len(errors) > 10:
-            print(f"...and {len(errors) - 10} more warnings")
+        if error_count > MAX_REPORTED_ERRORS:
+            print(f"...and {error_count - MAX_REPORTED_ERRORS} more warnings")
+    if error_count or invalid_labels:
+        print(f"Skipped {error_count + invalid_labels} rows ({invalid_labels} with an invalid sentiment label)")
+
+def _read_record(file) -> bytes:
+    """Read one CSV record from a binary file, joining lines until its quotes balance."""
+    record = file.readline()
+    while record.count(b'"') % 2:
+        line = file.readline()
+        if not line:
+            break
+        record += line
+    return record
+
+def chunk_size_for(data_bytes: int, workers: int) -> int:
+    """
+    Size of the byte ranges for a parallel conversion.
+
+    Aims at CHUNKS_PER_WORKER ranges per worker so the pool stays busy while
+    the ranges finish unevenly, within MIN_CHUNK_BYTES and CHUNK_BYTES.
+
+    Args:
+        data_bytes (int): Size of the data section of the file
+        workers (int): Number of processes
+
+    Returns:
+        int: Target size of each range
+    """
+    return min(CHUNK_BYTES, max(MIN_CHUNK_BYTES, data_bytes // (workers * CHUNKS_PER_WORKER)))
+
+def find_record_boundaries(csv_file: str, data_start: int, chunk_bytes: int = CHUNK_BYTES) -> List[int]:
+    """
+    Split the data section of a CSV file into byte ranges that likely start and end on record boundaries.
+
+    Quotes are counted from the start of each range, so a newline only ends a
+    record when the quotes before it in the range are balanced. This keeps
+    quoted newlines inside their record. Counting quotes is a plain byte
+    scan, far cheaper than CSV parsing. A stray quote in an unquoted field can
+    still misplace a boundary, so each range is checked when it is converted
+    (see `_convert_chunk`), and counting restarts at every boundary so the
+    miscount does not carry over to later ranges.
+
+    Args:
+        csv_file (str): Path to the input CSV file
+        data_start (int): Byte offset of the first record after the header
+        chunk_bytes (int): Target size of each range
+
+    Returns:
+        List[int]: Offsets starting with `data_start` and ending with the file size
+    """
+    size = os.path.getsize(csv_file)
+    boundaries = [data_start]
+    with open(csv_file, 'rb') as file:
+        file.seek(data_start)
+        position = data_start
+        while True:
+            target = boundaries[-1] + chunk_bytes
+            if target >= size:
+                break
+            quotes = 0
+            while position < target:
+                block = file.read(min(1024 * 1024, target - position))
+                quotes += block.count(b'"')
+                position += len(block)
+            # Finish the current line, then keep going until the quotes are balanced,
+            # giving up after another range's worth of unbalanced lines
+            while True:
+                line = file.readline()
+                quotes += line.count(b'"')
+                position += len(line)
+                if not line or quotes % 2 == 0 or position >= target + chunk_bytes:
+                    break
+            if position >= size:
+                break
+            boundaries.append(position)
+    boundaries.append(size)
+    return boundaries
+
+def _convert_chunk(
+    task: Tuple[str, int, int, str, int, int, bool],
+) -> Tuple[int, int, List[Tuple[int, str]], List[Tuple[int, str]], int, int]:
+    """
+    Convert one byte range of a CSV file into a JSONL part file.
+
+    The range must start on a record boundary. When its last record is still
+    inside a quoted field at the end of the range, the boundary was misplaced:
+    that record is left out and the returned end offset is where it starts, so
+    the next range is converted again from there. In the last range of the
+    file the unfinished record is kept, as the sequential reader keeps it.
+
+    Returns:
+        Tuple: Records read, records written, every invalid label and the first other errors as
+            (record index in chunk, message), total other errors, and the byte offset where the converted records end
+    """
+    csv_file, start, end, part_file, text_column, label_column, last = task
+    with open(csv_file, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+
+    consumed = 0
+    exhausted = False
+
+    def lines():
+        # Tracks how much text the reader has taken, and whether it asked for more than the range holds
+        nonlocal consumed, exhausted
+        for line in io.StringIO(text, newline=''):
+            consumed += len(line)
+            yield line
+        exhausted = True
+
+    records = 0
+    processed_count = 0
+    invalid_labels: List[Tuple[int, str]] = []
+    first_errors: List[Tuple[int, str]] = []
+    error_count = 0
+    record_end = 0
+    with open(part_file, 'w', encoding='utf-8') as jsonlfile:
+        for row in csv.reader(lines()):
+            if exhausted and not last:
+                # The range ended inside this record
+                break
+            records += 1
+            record_end = consumed
+            try:
+                json_record, problem = row_to_record(row, text_column, label_column)
+            except Exception as e:
+                json_record, problem = None, f"Error processing row: {str(e)}"
+            if problem is not None and problem.startswith(INVALID_LABEL):
+                invalid_labels.append((records - 1, problem))
+                continue
+            if problem is not None:
+                error_count += 1
+                if len(first_errors) < MAX_REPORTED_ERRORS:
+                    first_errors.append((records - 1, problem))
+                continue
+            jsonlfile.write(json.dumps(json_record, ensure_ascii=False) + '\n')
+            processed_count += 1
 
+    converted_end = end if record_end == len(text) else start + len(text[:record_end].encode('utf-8'))
+    return records, processed_count, invalid_labels, first_errors, error_count, converted_end
+
+def convert_csv_to_jsonl_parallel(
+    csv_file: str,
+    jsonl_file: str,
+    text_column: int = 1,
+    label_column: int = 2,
+    workers: Optional[int] = None,
+    chunk_bytes: Optional[int] = None,
+) -> int:
+    """
+    Convert a CSV file to JSONL using a process pool over record-aligned byte ranges.
+
+    Each range is converted to its own part file and the parts are concatenated
+    in file order, so the output is identical to the sequential conversion.
+    Warnings carry the same row numbers as well, since each chunk reports row
+    indexes relative to its start and they are offset by the records before it.
+    Invalid labels are printed row by row as each chunk is appended.
+    A range whose start turns out not to be a record boundary is converted
+    again from where the previous range really ended.
+
+    Args:
+        csv_file (str): Path to the input CSV file
+        jsonl_file (str): Path where the JSONL output will be saved
+        text_column (int): Index of the text column
+        label_column (int): Index of the label column
+        workers (Optional[int]): Number of processes (default: all cores)
+        chunk_bytes (Optional[int]): Target size of each range (default: picked by `chunk_size_for`)
+
+    Returns:
+        int: Number of records processed successfully
+    """
+    with open(csv_file, 'rb') as file:
+        header = next(csv.reader([_read_record(file).decode('utf-8')]), [])
+        data_start = file.tell()
+    if len(header) <= max(text_column, label_column):
+        raise ValueError(f"CSV file doesn't have enough columns. Expected at least {max(text_column, label_column) + 1} columns")
+
+    workers = workers or os.cpu_count() or 1
+    if chunk_bytes is None:
+        chunk_bytes = chunk_size_for(os.path.getsize(csv_file) - data_start, workers)
+    boundaries = find_record_boundaries(csv_file, data_start, chunk_bytes)
+    output_dir = os.path.dirname(os.path.abspath(jsonl_file))
+    with tempfile.TemporaryDirectory(dir=output_dir) as parts_dir:
+        tasks = [
+            (csv_file, start, end, os.path.join(parts_dir, f"part-{index:06d}.jsonl"), text_column, label_column,
+             end == boundaries[-1])
+            for index, (start, end) in enumerate(zip(boundaries, boundaries[1:]))
+        ]
+
+        processed_count = 0
+        rows_before = 0
+        first_errors: List[str] = []
+        error_count = 0
+        invalid_labels = 0
+        expected_start = data_start
+        with ProcessPoolExecutor(workers) as executor, open(jsonl_file, 'wb') as jsonlfile:
+            # map() yields results in task order, so parts are appended in file order
+            for task, result in zip(tasks, executor.map(_convert_chunk, tasks)):
+                if task[1] != expected_start:
+                    # The previous range ended before its boundary, so this one started inside a record
+                    os.remove(task[3])
+                    task = (task[0], expected_start) + task[2:]
+                    result = executor.submit(_convert_chunk, task).result()
+                records, processed, chunk_labels, chunk_errors, chunk_error_count, expected_start = result
+                with open(task[3], 'rb') as part:
+                    shutil.copyfileobj(part, jsonlfile)
+                os.remove(task[3])
+
+                # Start from 2 to account for header
+                for index, problem in chunk_labels:
+                    print(f"Row {rows_before + index + 2}: {problem}")
+                for index, problem in chunk_errors:
+                    if len(first_errors) < MAX_REPORTED_ERRORS:
+                        first_errors.append(f"Row {rows_before + index + 2}: {problem}")
+                processed_count += processed
+                error_count += chunk_error_count
+                invalid_labels += len(chunk_labels)
+                rows_before += records
+
+    report_errors(first_errors, error_count, invalid_labels)
     return processed_count
 
+def row_to_record(row: List[str], text_column: int, label_column: int) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Convert one CSV row to a JSONL record.
+
+    Args:
+        row (List[str]): Parsed CSV row
+        text_column (int): Index of the text column
+        label_column (int): Index of the label column
+
+    Returns:
+        Tuple[Optional[Dict], Optional[str]]: The record and None, or None and the reason the row was rejected
+    """
+    # Validate row structure
+    if len(row) <= max(text_column, label_column):
+        return None, "Invalid number of columns"
+
+    # Validate and clean text
+    text = row[text_column].strip()
+    if not text:
+        return None, "Empty text field"
+
+    # Validate and convert sentiment label
+    label, problem = parse_sentiment_label(row[label_column])
+    if label is None:
+        return None, problem
+
+    return {"InputText": text, "SentimentLabel": label}, None
+
+def parse_sentiment_label(label_str: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Convert a raw sentiment label without printing anything.
+
+    Args:
+        label_str (str): Raw label value from CSV
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: The label ('0' or '1') and None, or None and the reason it is invalid
+    """
+    try:
+        label_int = int(label_str)
+    except ValueError:
+        return None, f"{INVALID_LABEL} format: {label_str}"
+    if label_int not in (0, 1):
+        return None, f"{INVALID_LABEL} value: {label_str} (must be 0 or 1)"
+    return str(label_int), None
+
 def validate_sentiment_label(label_str: str, row_num: int) -> Optional[str]:
     """
     Validate and convert sentiment label to required format.
@@ -111,15 +404,10 @@ def validate_sentiment_label(label_str: str, row_num: int) -> Optional[str]:
     Returns:
         Optional[str]: Validated label as string ('0' or '1') or None if invalid
     """
-    try:
-        label_int = int(label_str)
-        if label_int not in (0, 1):
-            print(f"Row {row_num}: Invalid sentiment label value: {label_str} (must be 0 or 1)")
-            return None
-        return str(label_int)
-    except ValueError:
-        print(f"Row {row_num}: Invalid sentiment label format: {label_str}")
-        return None
+    label, problem = parse_sentiment_label(label_str)
+    if problem is not None:
+        print(f"Row {row_num}: {problem}")
+    return label
 
 if __name__ == "__main__":
     # Example usage
@@ -127,7 +415,7 @@ if __name__ == "__main__":
     output_file = 'csvtojsondata.jsonl'
     
     print(f"Converting {input_file} to JSONL format...")
-    records_processed = convert_csv_to_jsonl(input_file, output_file)
+    records_processed = convert_csv_to_jsonl(input_file, output_file, workers=os.cpu_count() or 1)
     
     if records_processed:
         print(f"Conversion completed: {records_processed} records written to {output_file}")
\ No newline at end of file
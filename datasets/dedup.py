@@ -0,0 +1,462 @@
+import hashlib
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Arabizi digits that stand in for Arabic letters (7 = ح, 5 = خ, 3 = ع, 9 = ق, 2 = ء)
+ARABIZI_DIGITS = {"7": "h", "5": "kh", "3": "a", "9": "q", "2": "a"}
+# Rough Mistral token count for the instruction template around each sample
+PROMPT_OVERHEAD_TOKENS = 20
+CHARS_PER_TOKEN = 3.0
+MAX_REPORTED_CONFLICTS = 10
+# Shingles hashed at once; the hash matrix is num_perm times this many uint64 values
+SHINGLE_CHUNK = 1 << 12
+# Kept texts compared per band key and index run, so very common keys stay cheap
+MAX_BUCKET_CANDIDATES = 64
+# Signature pairs compared at once
+PAIR_CHUNK = 1 << 14
+KEY_MULTIPLIER = 0x9E3779B97F4A7C15
+
+_DIGITS_RE = re.compile("[" + "".join(ARABIZI_DIGITS) + "]")
+_REPEATS_RE = re.compile(r"(.)\1+")
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+def normalize_arabizi(text: str, collapse_repeats: bool = False) -> str:
+    """
+    Normalize spelling variants of a Tunisian Arabizi text for duplicate detection.
+
+    Lowercases, maps letter-like digits (7/5/3/9/2) to Latin letters and reduces
+    punctuation and whitespace to single spaces. Texts with no letters or
+    digits, such as emoji-only comments, are only stripped, so they keep
+    distinct keys instead of all normalizing to "".
+
+    Args:
+        text (str): Input text
+        collapse_repeats (bool): Also collapse repeated characters ("behyyyy" -> "behy"); this merges
+            some distinct words as well ("cool" -> "col"), so it is off by default
+
+    Returns:
+        str: Normalized text
+    """
+    normalized = _DIGITS_RE.sub(lambda match: ARABIZI_DIGITS[match.group(0)], text.lower())
+    if collapse_repeats:
+        normalized = _REPEATS_RE.sub(r"\1", normalized)
+    normalized = _NON_WORD_RE.sub(" ", normalized).strip()
+    return normalized or text.strip()
+
+def text_key(normalized: str) -> int:
+    """64-bit hash of a normalized text, used for exact duplicate detection."""
+    return int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def estimate_tokens(entry: Dict) -> int:
+    """
+    Estimate the training tokens one entry costs, including the prompt template.
+
+    Args:
+        entry (Dict): Entry with 'InputText' and 'SentimentLabel' fields
+
+    Returns:
+        int: Approximate token count
+    """
+    characters = len(entry['InputText']) + len(entry['SentimentLabel'])
+    return PROMPT_OVERHEAD_TOKENS + int(characters / CHARS_PER_TOKEN) + 1
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Pick LSH bands and rows per band whose similarity cutoff (1/b)^(1/r) is closest to `threshold`.
+
+    Args:
+        num_perm (int): Number of MinHash permutations
+        threshold (float): Target Jaccard similarity
+
+    Returns:
+        Tuple[int, int]: Number of bands and rows per band
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+class MinHasher:
+    """
+    Vectorized MinHash signatures over character shingles of normalized texts.
+
+    Shingles are the byte n-grams of the normalized text packed into integers,
+    hashed by `num_perm` random multiply-add-shift functions
+    ((a * x + b) mod 2^64) >> 32, which are pairwise independent for 32-bit keys.
+    Shingles of a whole batch are extracted with a few NumPy operations and
+    hashed in chunks of at most `chunk_shingles`, which bounds the memory of
+    the num_perm x shingles hash matrix.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1,
+                 chunk_shingles: int = SHINGLE_CHUNK):
+        import numpy as np
+
+        if shingle_size > 4:
+            raise ValueError("shingle_size must be at most 4 so shingles fit in 32 bits")
+        self.np = np
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.chunk_shingles = chunk_shingles
+        rng = np.random.default_rng(seed)
+        # Odd multipliers; uint64 arithmetic wraps, which is the mod 2^64
+        self.a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2)
+
+    def _shingles(self, texts: List[str]):
+        """All shingles of a batch, concatenated, and the number each text has."""
+        np = self.np
+        # Texts shorter than one shingle are padded so they still get a signature
+        encoded = [text.encode('utf-8').ljust(self.shingle_size, b' ') for text in texts]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+        counts = lengths - self.shingle_size + 1
+        # Start of every shingle in `data`: each text's offset plus 0..count-1
+        text_starts = np.cumsum(lengths) - lengths
+        shingle_offsets = np.cumsum(counts) - counts
+        positions = np.repeat(text_starts - shingle_offsets, counts) + np.arange(counts.sum())
+        shingles = np.zeros(len(positions), dtype=np.uint64)
+        for offset in range(self.shingle_size):
+            shingles = (shingles << np.uint64(8)) | data[positions + offset]
+        return shingles, counts
+
+    def signatures(self, texts: List[str]):
+        """
+        Compute MinHash signatures for a batch of texts.
+
+        Repeated shingles are not removed: they do not change the minimum.
+
+        Args:
+            texts (List[str]): Texts already passed through normalize_arabizi
+
+        Returns:
+            numpy.ndarray: Array of shape (len(texts), num_perm) with uint32 signatures
+        """
+        np = self.np
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        if not texts:
+            return result
+        shingles, counts = self._shingles(texts)
+        ends = np.cumsum(counts)
+        first = 0
+        while first < len(texts):
+            # As many texts as fit in the chunk budget, and at least one
+            last = max(int(np.searchsorted(ends, ends[first] - counts[first] + self.chunk_shingles, 'right')), first + 1)
+            begin, stop = ends[first] - counts[first], ends[last - 1]
+            chunk = shingles[begin:stop]
+            # In place, so the only large array is the hash matrix itself
+            hashed = np.multiply.outer(self.a, chunk)
+            hashed += self.b[:, None]
+            hashed >>= np.uint64(32)
+            starts = ends[first:last] - counts[first:last] - begin
+            result[first:last] = np.minimum.reduceat(hashed, starts, axis=1).T
+            first = last
+        return result
+
+class NearDuplicateIndex:
+    """
+    Streaming MinHash LSH index.
+
+    Each kept text's signature is split into bands, and each band is hashed
+    to a 64-bit key. A new text sharing a band key with kept texts is compared
+    with them, and it is reported as a near duplicate when the estimated
+    Jaccard similarity of the two signatures reaches `threshold`.
+
+    Keys live in sorted NumPy runs that are merged as they grow (a small
+    log-structured merge), so a whole batch is looked up with `searchsorted`
+    and no Python object is kept per text. Every kept text with the key is a
+    candidate, up to `max_candidates` per band and run.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: Optional[int] = None,
+                 max_candidates: int = MAX_BUCKET_CANDIDATES):
+        import numpy as np
+
+        self.np = np
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        if bands is None:
+            bands, _ = choose_bands(num_perm, threshold)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_candidates = max_candidates
+        self.size = 0
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        # Sorted (band key, kept text) runs, largest first
+        self._runs: List[Tuple] = []
+        rng = np.random.default_rng(2)
+        self._band_salts = rng.integers(1, 1 << 63, bands, dtype=np.uint64)
+
+    def add_batch(self, texts: List[str]) -> List[Optional[int]]:
+        """
+        Check a batch of texts against the index and add those that are not near duplicates.
+
+        Texts are also compared with earlier texts of the same batch, so the
+        result is the same as adding them one at a time.
+
+        Args:
+            texts (List[str]): Normalized texts in stream order
+
+        Returns:
+            List[Optional[int]]: For each text, the index of the kept text it duplicates, or None if it was kept
+        """
+        np = self.np
+        if not texts:
+            return []
+        signatures = self.hasher.signatures(texts)
+        keys = self._band_keys(signatures)
+        count = len(texts)
+        # Earliest matching kept text per row, or -1
+        matches = np.full(count, -1, dtype=np.int64)
+
+        rows, candidates = self._lookup(keys)
+        rows, candidates = self._similar(signatures, rows, self._signatures, candidates)
+        if len(rows):
+            best = np.full(count, np.iinfo(np.int64).max, dtype=np.int64)
+            np.minimum.at(best, rows, candidates)
+            matches[rows] = best[rows]
+
+        # Pairs of rows of this batch that share a band key, earlier row first
+        earlier, later = self._batch_pairs(keys)
+        later, earlier = self._similar(signatures, later, signatures, earlier)
+        duplicate_of_row = np.full(count, -1, dtype=np.int64)
+        if len(later):
+            order = np.lexsort((earlier, later))
+            kept = matches < 0
+            for row, other in zip(later[order].tolist(), earlier[order].tolist()):
+                # A row is compared only with earlier rows that were kept themselves
+                if kept[row] and kept[other]:
+                    kept[row] = False
+                    duplicate_of_row[row] = other
+
+        kept = (matches < 0) & (duplicate_of_row < 0)
+        ids = np.full(count, -1, dtype=np.int64)
+        ids[kept] = self.size + np.arange(int(kept.sum()))
+        intra = duplicate_of_row >= 0
+        matches[intra] = ids[duplicate_of_row[intra]]
+        self._add(signatures[kept], keys[kept], ids[kept])
+        return [None if match < 0 else match for match in matches.tolist()]
+
+    def _band_keys(self, signatures):
+        """64-bit key of every band of every signature, shape (texts, bands)."""
+        np = self.np
+        banded = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        keys = np.broadcast_to(self._band_salts, (len(signatures), self.bands)).copy()
+        with np.errstate(over='ignore'):
+            for row in range(self.rows):
+                keys = keys * np.uint64(KEY_MULTIPLIER) + banded[:, :, row]
+        return keys
+
+    def _expand(self, starts, counts):
+        """Positions starts[i] .. starts[i] + counts[i] - 1 for every i, and the i each belongs to."""
+        np = self.np
+        owners = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(starts, counts) + offsets, owners
+
+    def _lookup(self, keys):
+        """(row, kept text) pairs whose band keys are equal, over all runs."""
+        np = self.np
+        # Sorted queries walk each run front to back, which keeps searchsorted cache friendly
+        order = np.argsort(keys.ravel())
+        queries = keys.ravel()[order]
+        rows, candidates = [], []
+        for run_keys, run_ids in self._runs:
+            left = np.searchsorted(run_keys, queries, 'left')
+            counts = np.minimum(np.searchsorted(run_keys, queries, 'right') - left, self.max_candidates)
+            positions, owners = self._expand(left, counts)
+            rows.append(order[owners] // self.bands)
+            candidates.append(run_ids[positions])
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return self._unique_pairs(np.concatenate(rows), np.concatenate(candidates))
+
+    def _batch_pairs(self, keys):
+        """(earlier row, later row) pairs of a batch that share a band key."""
+        np = self.np
+        flat = keys.ravel()
+        flat_rows = np.repeat(np.arange(len(keys)), self.bands)
+        order = np.lexsort((flat_rows, flat))
+        sorted_keys, sorted_rows = flat[order], flat_rows[order]
+        # Position of the first entry of each entry's key group
+        group_start = np.ones(len(flat), dtype=bool)
+        group_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        first = np.maximum.accumulate(np.where(group_start, np.arange(len(flat)), 0))
+        counts = np.minimum(np.arange(len(flat)) - first, self.max_candidates)
+        positions, owners = self._expand(first, counts)
+        earlier, later = sorted_rows[positions], sorted_rows[owners]
+        distinct = earlier != later
+        return self._unique_pairs(earlier[distinct], later[distinct])
+
+    def _unique_pairs(self, first, second):
+        np = self.np
+        if not len(first):
+            return first.astype(np.int64), second.astype(np.int64)
+        # Both sides are below 2^32 (batch rows and kept texts), so a pair packs into one int64
+        pairs = np.unique((first.astype(np.int64) << 32) | second.astype(np.int64))
+        return pairs >> 32, pairs & 0xFFFFFFFF
+
+    def _similar(self, signatures, rows, other_signatures, others):
+        """The pairs whose estimated Jaccard similarity reaches the threshold, compared in bounded chunks."""
+        np = self.np
+        keep = np.zeros(len(rows), dtype=bool)
+        for begin in range(0, len(rows), PAIR_CHUNK):
+            stop = begin + PAIR_CHUNK
+            equal = signatures[rows[begin:stop]] == other_signatures[others[begin:stop]]
+            keep[begin:stop] = equal.mean(axis=1) >= self.threshold
+        return rows[keep], others[keep]
+
+    def _add(self, signatures, keys, ids) -> None:
+        np = self.np
+        if not len(ids):
+            return
+        needed = self.size + len(ids)
+        if needed > len(self._signatures):
+            # Grow geometrically so appending stays amortized linear
+            grown = np.empty((max(needed, 2 * len(self._signatures)), self.hasher.num_perm), dtype=np.uint32)
+            grown[:self.size] = self._signatures[:self.size]
+            self._signatures = grown
+        self._signatures[self.size:needed] = signatures
+        self.size = needed
+
+        flat = keys.ravel()
+        order = np.argsort(flat, kind='stable')
+        run = (flat[order], np.repeat(ids, self.bands)[order])
+        # Merge with the newest runs while they are not much larger
+        while self._runs and len(self._runs[-1][0]) <= 2 * len(run[0]):
+            run = self._merge(self._runs.pop(), run)
+        self._runs.append(run)
+
+    def _merge(self, older, newer):
+        """Merge two sorted runs in linear time; for equal keys the older ids come first."""
+        np = self.np
+        older_keys, older_ids = older
+        newer_keys, newer_ids = newer
+        total = len(older_keys) + len(newer_keys)
+        positions = np.searchsorted(older_keys, newer_keys, 'right') + np.arange(len(newer_keys))
+        from_newer = np.zeros(total, dtype=bool)
+        from_newer[positions] = True
+        keys = np.empty(total, dtype=older_keys.dtype)
+        ids = np.empty(total, dtype=older_ids.dtype)
+        keys[positions], ids[positions] = newer_keys, newer_ids
+        keys[~from_newer], ids[~from_newer] = older_keys, older_ids
+        return keys, ids
+
+def deduplicate(
+    entries: Iterable[Dict],
+    near_duplicates: bool = True,
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    batch_size: int = 10_000,
+    collapse_repeats: bool = False,
+    conflicts: Optional[List[Tuple[int, int]]] = None,
+) -> Iterator[Tuple[Dict, Optional[str]]]:
+    """
+    Remove exact and near-duplicate entries from a stream.
+
+    Exact duplicates are detected by a hash of the normalized text; near
+    duplicates by MinHash LSH over the texts that survive the exact check.
+    Only entries with the same label are duplicates of each other: the same
+    text under another label is kept and recorded in `conflicts`, so no label
+    is silently dropped. Entries are processed in batches so MinHash
+    signatures are computed with NumPy, and yielded in input order.
+
+    Args:
+        entries (Iterable[Dict]): Entries with 'InputText' and 'SentimentLabel' fields
+        near_duplicates (bool): Also detect near duplicates (default: True)
+        threshold (float): Jaccard similarity from which texts are near duplicates (default: 0.8)
+        num_perm (int): Number of MinHash permutations (default: 64)
+        batch_size (int): Entries per vectorized batch
+        collapse_repeats (bool): Treat texts differing only in repeated letters as equal (default: False)
+        conflicts (Optional[List[Tuple[int, int]]]): Receives (position, position of the first entry with
+            the same normalized text and another label) for every such entry
+
+    Yields:
+        Tuple[Dict, Optional[str]]: Each entry and None if it is kept, or the reason it is a duplicate
+    """
+    # Text key -> (position, label) of its first entry; texts also seen with other labels are in `relabeled`
+    seen: Dict[int, Tuple[int, str]] = {}
+    relabeled: Dict[Tuple[int, str], int] = {}
+    indexes: Dict[str, NearDuplicateIndex] = {}
+    kept_positions: Dict[str, List[int]] = {}
+    position = 0
+
+    def exact_duplicate_of(key: int, label: str, entry_position: int) -> Optional[int]:
+        first = seen.get(key)
+        if first is None:
+            seen[key] = (entry_position, label)
+            return None
+        if first[1] == label:
+            return first[0]
+        if (key, label) in relabeled:
+            return relabeled[key, label]
+        relabeled[key, label] = entry_position
+        if conflicts is not None:
+            conflicts.append((entry_position, first[0]))
+        return None
+
+    def flush(batch: List[Tuple[int, Dict]]) -> Iterator[Tuple[Dict, Optional[str]]]:
+        # Exact duplicates are removed first; only unique texts go through MinHash
+        pending = []
+        normalized = [normalize_arabizi(entry['InputText'], collapse_repeats) for _, entry in batch]
+        labels = [str(entry['SentimentLabel']) for _, entry in batch]
+        for (entry_position, entry), text, label in zip(batch, normalized, labels):
+            duplicate_of = exact_duplicate_of(text_key(text), label, entry_position)
+            if duplicate_of is None:
+                pending.append((entry, None))
+            else:
+                pending.append((entry, f"Exact duplicate of entry {duplicate_of}"))
+
+        if near_duplicates:
+            # One index per label, so texts are only compared with texts of the same label
+            unique: Dict[str, List[int]] = {}
+            for i, (_, reason) in enumerate(pending):
+                if reason is None:
+                    unique.setdefault(labels[i], []).append(i)
+            for label, rows in unique.items():
+                if label not in indexes:
+                    indexes[label] = NearDuplicateIndex(threshold, num_perm)
+                    kept_positions[label] = []
+                matches = indexes[label].add_batch([normalized[i] for i in rows])
+                for i, match in zip(rows, matches):
+                    if match is None:
+                        kept_positions[label].append(batch[i][0])
+                    else:
+                        pending[i] = (pending[i][0], f"Near duplicate of entry {kept_positions[label][match]}")
+        yield from pending
+
+    batch: List[Tuple[int, Dict]] = []
+    for entry in entries:
+        batch.append((position, entry))
+        position += 1
+        if len(batch) == batch_size:
+            yield from flush(batch)
+            batch = []
+    if batch:
+        yield from flush(batch)
+
+def dedup_report(
+    removed_exact: int,
+    removed_near: int,
+    tokens_saved: int,
+    total: int,
+    conflicts: Optional[List[Tuple[int, int]]] = None,
+) -> None:
+    """
+    Print how many duplicates were removed and the training tokens they would have cost.
+
+    Args:
+        removed_exact (int): Exact duplicates removed
+        removed_near (int): Near duplicates removed
+        tokens_saved (int): Estimated tokens of the removed entries, per epoch
+        total (int): Entries checked
+        conflicts (Optional[List[Tuple[int, int]]]): Entries kept although their text was seen with another label
+    """
+    removed = removed_exact + removed_near
+    share = removed / total if total else 0.0
+    print(f"Removed {removed} duplicates ({share:.1%}): {removed_exact} exact, {removed_near} near")
+    print(f"Saved about {tokens_saved} training tokens per epoch")
+    if conflicts:
+        print(f"Kept {len(conflicts)} entries whose text also appears with another label:")
+        for position, first in conflicts[:MAX_REPORTED_CONFLICTS]:
+            print(f"  entry {position} repeats the text of entry {first}")
+        if len(conflicts) > MAX_REPORTED_CONFLICTS:
+            print(f"  ...and {len(conflicts) - MAX_REPORTED_CONFLICTS} more")
@@ -0,0 +1,180 @@
+import argparse
+import bisect
+import math
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from pretokenize import DEFAULT_CONFIG, DEFAULT_CACHE_DIR, pretokenize
+
+# Same default as GPU_CONFIG in src/train_setup.py
+DEFAULT_GPU_CONFIG = "a100:2"
+SEQUENCE_LEN_STEP = 64
+
+def pack_lengths(lengths: Sequence[int], sequence_len: int) -> List[int]:
+    """
+    Pack samples into sequences of `sequence_len` tokens with best-fit decreasing.
+
+    Samples are placed longest first, each into the fullest sequence that still
+    has room for it. Sequences are tracked by remaining capacity rather than one
+    by one, and runs of equal lengths are placed together, so the cost depends on
+    the number of distinct lengths rather than the number of samples. Samples
+    longer than `sequence_len` are truncated to it.
+
+    Args:
+        lengths (Sequence[int]): Token count of every sample
+        sequence_len (int): Capacity of a packed sequence
+
+    Returns:
+        List[int]: Tokens used in each packed sequence
+    """
+    counts = Counter(min(int(length), sequence_len) for length in lengths if length > 0)
+    # Number of open sequences for each remaining capacity, and the capacities in use, sorted
+    open_sequences: Counter = Counter()
+    capacities: List[int] = []
+
+    def move(capacity: int, new_capacity: int, sequences: int) -> None:
+        if capacity in open_sequences:
+            open_sequences[capacity] -= sequences
+            if not open_sequences[capacity]:
+                del open_sequences[capacity]
+                capacities.pop(bisect.bisect_left(capacities, capacity))
+        if new_capacity not in open_sequences:
+            bisect.insort(capacities, new_capacity)
+        open_sequences[new_capacity] += sequences
+
+    for length in sorted(counts, reverse=True):
+        remaining = counts[length]
+        while remaining:
+            index = bisect.bisect_left(capacities, length)
+            capacity = capacities[index] if index < len(capacities) else sequence_len
+            available = open_sequences[capacity] if index < len(capacities) else remaining
+            # The best fit for the next sample stays this sequence until it is full
+            per_sequence = capacity // length
+            full = min(available, remaining // per_sequence)
+            if full:
+                move(capacity, capacity - per_sequence * length, full)
+                remaining -= full * per_sequence
+            else:
+                move(capacity, capacity - remaining * length, 1)
+                remaining = 0
+
+    return [
+        sequence_len - capacity
+        for capacity, sequences in sorted(open_sequences.items())
+        for _ in range(sequences)
+    ]
+
+def optimizer_steps(sequences: int, micro_batch_size: int, gradient_accumulation_steps: int,
+                    num_gpus: int = 1, num_epochs: float = 1) -> int:
+    """
+    Estimate optimizer steps for a number of packed training sequences.
+
+    Args:
+        sequences (int): Packed sequences per epoch
+        micro_batch_size (int): Sequences per GPU per forward pass
+        gradient_accumulation_steps (int): Micro batches per optimizer step
+        num_gpus (int): Data-parallel GPUs
+        num_epochs (float): Number of epochs
+
+    Returns:
+        int: Optimizer steps over all epochs
+    """
+    micro_batches = math.ceil(sequences / (micro_batch_size * num_gpus))
+    return math.ceil(micro_batches / gradient_accumulation_steps * num_epochs)
+
+def packing_plan(lengths: Sequence[int], sequence_len: int) -> Dict:
+    """
+    Plan the packing of samples and measure how much of each sequence is padding.
+
+    Args:
+        lengths (Sequence[int]): Token count of every sample
+        sequence_len (int): Capacity of a packed sequence
+
+    Returns:
+        Dict: Sample, token and sequence counts, fill ratio and waste, with and without packing
+    """
+    bins = pack_lengths(lengths, sequence_len)
+    tokens = sum(bins)
+    samples = sum(1 for length in lengths if length > 0)
+    fill_ratio = tokens / (len(bins) * sequence_len) if bins else 0.0
+    return {
+        'sequence_len': sequence_len,
+        'samples': samples,
+        'tokens': tokens,
+        'sequences': len(bins),
+        'fill_ratio': round(fill_ratio, 4),
+        'waste': round(1 - fill_ratio, 4) if bins else 0.0,
+        # With pad_to_sequence_len and no packing every sample is a full sequence
+        'unpacked_fill_ratio': round(tokens / (samples * sequence_len), 4) if samples else 0.0,
+    }
+
+def suggest_sequence_len(lengths: Sequence[int], max_waste: float, max_sequence_len: int,
+                         step: int = SEQUENCE_LEN_STEP, allow_truncation: bool = False) -> Optional[Dict]:
+    """
+    Find the smallest sequence length, in multiples of `step`, whose packing waste stays below `max_waste`.
+
+    Args:
+        lengths (Sequence[int]): Token count of every sample
+        max_waste (float): Largest acceptable share of padding tokens
+        max_sequence_len (int): Largest sequence length to consider
+        step (int): Granularity of the candidates
+        allow_truncation (bool): Also consider lengths shorter than the longest sample
+
+    Returns:
+        Optional[Dict]: Packing plan of the suggested length, or None if no candidate qualifies
+    """
+    longest = max(lengths, default=0)
+    for sequence_len in range(step, max_sequence_len + 1, step):
+        if sequence_len < longest and not allow_truncation:
+            continue
+        plan = packing_plan(lengths, sequence_len)
+        if plan['waste'] <= max_waste:
+            return plan
+    return None
+
+def gpu_count(gpu_config: str) -> int:
+    """Number of GPUs in a Modal GPU string such as "a100:2"."""
+    _, _, count = gpu_config.partition(':')
+    return int(count) if count else 1
+
+def print_packing_report(plan: Dict, steps: int, suggestion: Optional[Dict], max_waste: float) -> None:
+    """Print a packing plan, the estimated optimizer steps and the suggested sequence length."""
+    print(f"{plan['samples']} samples, {plan['tokens']} tokens packed into {plan['sequences']} sequences "
+          f"of {plan['sequence_len']} tokens")
+    print(f"Fill ratio {plan['fill_ratio']:.2%} (waste {plan['waste']:.2%}); "
+          f"without packing it would be {plan['unpacked_fill_ratio']:.2%}")
+    print(f"Estimated optimizer steps: {steps}")
+    if suggestion is None:
+        print(f"No sequence_len up to {plan['sequence_len']} keeps waste below {max_waste:.0%}")
+    else:
+        print(f"Smallest sequence_len with waste below {max_waste:.0%}: {suggestion['sequence_len']} "
+              f"({suggestion['sequences']} sequences, fill ratio {suggestion['fill_ratio']:.2%})")
+
+if __name__ == "__main__":
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Plan sample packing and measure padding waste before training.")
+    parser.add_argument("dataset_file", nargs="?", default="data.jsonl")
+    parser.add_argument("--config", default=DEFAULT_CONFIG)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--tokenizer", default=None, help="Tokenizer name or path (default: the config's base_model)")
+    parser.add_argument("--max-waste", type=float, default=0.05, help="Target share of padding tokens")
+    parser.add_argument("--num-gpus", type=int, default=gpu_count(os.environ.get("GPU_CONFIG", DEFAULT_GPU_CONFIG)))
+    parser.add_argument("--allow-truncation", action="store_true",
+                        help="Suggest sequence lengths shorter than the longest sample")
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file)
+    lengths = pretokenize(args.dataset_file, args.config, args.cache_dir, tokenizer=args.tokenizer).lengths.tolist()
+
+    plan = packing_plan(lengths, int(config['sequence_len']))
+    # The validation split is held out of training
+    train_sequences = math.ceil(plan['sequences'] * (1 - float(config.get('val_set_size') or 0)))
+    steps = optimizer_steps(train_sequences, int(config['micro_batch_size']),
+                            int(config['gradient_accumulation_steps']), args.num_gpus,
+                            float(config.get('num_epochs') or 1))
+    suggestion = suggest_sequence_len(lengths, args.max_waste, int(config['sequence_len']),
+                                      allow_truncation=args.allow_truncation)
+    print_packing_report(plan, steps, suggestion, args.max_waste)
@@ -0,0 +1,136 @@
+import argparse
+import csv
+import json
+import os
+import time
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from csv_to_jsonl import row_to_record
+from clean_dataset import entry_problem
+from columnar import ParquetDatasetWriter
+from verifydata import verify_entry
+
+def read_csv_rows(csv_file: str, min_columns: int) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Stream the rows of a CSV file after its header.
+
+    Args:
+        csv_file (str): Path to the input CSV file
+        min_columns (int): Number of columns the header must have
+
+    Yields:
+        Tuple[int, List[str]]: Row number in the file (header is row 1) and the parsed row
+    """
+    with open(csv_file, 'r', encoding='utf-8', newline='') as csvfile:
+        csv_reader = csv.reader(csvfile)
+        header = next(csv_reader)
+        if len(header) < min_columns:
+            raise ValueError(f"CSV file doesn't have enough columns. Expected at least {min_columns} columns")
+        yield from enumerate(csv_reader, start=2)
+
+def run_pipeline(
+    csv_file: str,
+    jsonl_file: str,
+    rejects_file: Optional[str] = None,
+    text_column: int = 1,
+    label_column: int = 2,
+    parquet_file: Optional[str] = None,
+) -> Dict:
+    """
+    Convert, clean and verify a CSV dataset in a single streaming pass.
+
+    Rows go through the same checks as csv_to_jsonl.py, clean_dataset.py and
+    verifydata.py, but one at a time, so memory use does not depend on the
+    file size. Rejected rows are written to `rejects_file` with their row number,
+    the stage that rejected them and the reason.
+
+    Args:
+        csv_file (str): Path to the input CSV file
+        jsonl_file (str): Path where the JSONL output will be saved
+        rejects_file (Optional[str]): Path for rejected rows (default: <jsonl_file>.rejects.jsonl)
+        text_column (int): Index of the column containing the text data (default: 1)
+        label_column (int): Index of the column containing the sentiment labels (default: 2)
+        parquet_file (Optional[str]): Also write the accepted rows to this Parquet file
+
+    Returns:
+        Dict: Row counts, rejection reasons and throughput
+    """
+    if rejects_file is None:
+        rejects_file = f"{os.path.splitext(jsonl_file)[0]}.rejects.jsonl"
+
+    started = time.perf_counter()
+    rows_read = 0
+    written = 0
+    # Reasons are counted without their row-specific details to keep the summary bounded
+    rejections: Counter = Counter()
+
+    with (
+        open(jsonl_file, 'w', encoding='utf-8') as jsonlfile,
+        open(rejects_file, 'w', encoding='utf-8') as rejectsfile,
+        ParquetDatasetWriter(parquet_file) if parquet_file else nullcontext() as parquet_writer,
+    ):
+        def reject(row_num: int, stage: str, reason: str, raw) -> None:
+            rejections[f"{stage}: {reason.split(':')[0]}"] += 1
+            rejectsfile.write(json.dumps(
+                {"row": row_num, "stage": stage, "reason": reason, "raw": raw}, ensure_ascii=False
+            ) + '\n')
+
+        for row_num, row in read_csv_rows(csv_file, max(text_column, label_column) + 1):
+            rows_read += 1
+
+            # Stage 1: CSV row to record, with label validation
+            record, problem = row_to_record(row, text_column, label_column)
+            if problem is not None:
+                reject(row_num, "convert", problem, row)
+                continue
+
+            # Stage 2: field checks from clean_dataset.py
+            problem = entry_problem(record)
+            if problem is not None:
+                reject(row_num, "clean", problem, record)
+                continue
+
+            # Stage 3: structure checks from verifydata.py
+            problem = verify_entry(record)
+            if problem is not None:
+                reject(row_num, "verify", problem, record)
+                continue
+
+            jsonlfile.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if parquet_writer is not None:
+                parquet_writer.write(record)
+            written += 1
+
+    elapsed = time.perf_counter() - started
+    megabytes = os.path.getsize(csv_file) / 1e6
+    summary = {
+        "rows_read": rows_read,
+        "rows_written": written,
+        "rows_rejected": sum(rejections.values()),
+        "rejections": dict(rejections.most_common()),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_read / elapsed, 1) if elapsed else None,
+        "mb_per_second": round(megabytes / elapsed, 2) if elapsed else None,
+    }
+
+    print(f"Read {rows_read} rows, wrote {written} to {jsonl_file}, "
+          f"rejected {summary['rows_rejected']} (see {rejects_file})")
+    for reason, count in summary["rejections"].items():
+        print(f"  {reason}: {count}")
+    print(f"Took {elapsed:.2f}s ({summary['rows_per_second']} rows/s, {summary['mb_per_second']} MB/s)")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert, clean and verify a CSV dataset in one pass.")
+    parser.add_argument("input_file", nargs="?", default="TuniziDataset.csv")
+    parser.add_argument("output_file", nargs="?", default="data.jsonl")
+    parser.add_argument("--rejects-file", default=None)
+    parser.add_argument("--text-column", type=int, default=1)
+    parser.add_argument("--label-column", type=int, default=2)
+    parser.add_argument("--parquet-file", default=None, help="Also write accepted rows to this Parquet file")
+    args = parser.parse_args()
+
+    run_pipeline(args.input_file, args.output_file, args.rejects_file, args.text_column, args.label_column,
+                 args.parquet_file)
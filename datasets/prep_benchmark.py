@@ -0,0 +1,426 @@
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext, redirect_stdout
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+# Share of generated rows for each kind of problem the preparation scripts handle
+DEFAULT_RATES = {
+    "bad_label": 0.01,
+    "empty_text": 0.005,
+    "quoted_newline": 0.02,
+    "exact_duplicate": 0.03,
+    "near_duplicate": 0.02,
+}
+BAD_LABELS = ("-1", "2", "", "pos", "1.0", "neutral")
+EMPTY_TEXTS = ("", "   ", "\t")
+WORDS = (
+    "ma7leh", "el", "film", "behi", "barcha", "3ajbetni", "mouch", "5ayeb", "ya3tik", "sa7a", "9a3da",
+    "nheb", "na3ref", "chbik", "wallah", "tounes", "lyoum", "ghodwa", "ya5i", "kifech", "3lech", "bech",
+    "fama", "mafamech", "rabi", "m3a", "7ata", "tawa", "ba3d", "9bal", "mte3", "hedha", "hedhi", "3andi",
+    "el7a9", "mrigel", "fadit", "7keya", "zeda", "w", "ama", "lezem", "nchallah", "bravo", "choufli",
+)
+# Recently generated texts duplicates are drawn from, so memory stays bounded at any size
+RECENT_TEXTS = 10_000
+WRITE_BATCH = 10_000
+# Each stage: the file it reads, the file it writes and the stage that writes its input
+STAGES = {
+    "convert": ("corpus", "converted.jsonl", None),
+    "convert_parallel": ("corpus", "converted_parallel.jsonl", None),
+    "clean": ("converted.jsonl", "cleaned.jsonl", "convert"),
+    "clean_exact": ("converted.jsonl", "cleaned_exact.jsonl", "convert"),
+    "verify": ("cleaned.jsonl", None, "clean"),
+    "pipeline": ("corpus", "pipeline.jsonl", None),
+    "pipeline_parquet": ("corpus", "pipeline.parquet", None),
+    "verify_parquet": ("pipeline.parquet", None, "pipeline_parquet"),
+}
+# Runs shorter than this are dominated by process and import noise and are not compared
+MIN_COMPARE_SECONDS = 0.1
+
+def parse_count(value: str) -> int:
+    """
+    Parse a row count such as "10000", "10k", "2.5M" or "50M".
+
+    Args:
+        value (str): Count, optionally with a k or M suffix
+
+    Returns:
+        int: Number of rows
+    """
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = value[-1:].lower()
+    if suffix in multipliers:
+        return int(float(value[:-1]) * multipliers[suffix])
+    return int(value)
+
+def synthetic_text(rng: random.Random, min_words: int = 3, max_words: int = 25) -> str:
+    """Random Arabizi-like text, with the occasional stretched letter or trailing punctuation."""
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    if rng.random() < 0.2:
+        position = rng.randrange(len(words))
+        words[position] += words[position][-1] * rng.randint(1, 4)
+    text = " ".join(words)
+    return text + rng.choice(("", "", "!", "!!", "...", " ?")) if rng.random() < 0.3 else text
+
+def spelling_variant(text: str, rng: random.Random) -> str:
+    """A copy of a text that normalizes to the same key: other casing, stretched letters or punctuation."""
+    variant = rng.choice((text, text.upper(), text.capitalize(), text + "!!", text.replace("a", "aa")))
+    return f"  {variant} " if rng.random() < 0.2 else variant
+
+def near_variant(text: str, rng: random.Random) -> str:
+    """A copy of a text with one word added, which MinHash flags as a near duplicate once the text is long enough."""
+    words = text.split(" ")
+    words.insert(rng.randrange(len(words) + 1), rng.choice(WORDS))
+    return " ".join(words)
+
+def generate_corpus(csv_file: str, rows: int, seed: int = 0, rates: Optional[Dict[str, float]] = None) -> Dict:
+    """
+    Write a synthetic CSV in the TuniziDataset layout: an index column, InputText and SentimentLabel.
+
+    Rows are generated and written in batches, so any size can be produced
+    with constant memory. A share of the rows is made invalid or redundant
+    the way real scraped data is: bad labels, empty texts, texts with a
+    newline (quoted by the CSV writer), and exact or near duplicates of
+    recent rows. A `<csv_file>.meta.json` file records the settings and what
+    was injected; an existing corpus with the same settings is reused.
+
+    Args:
+        csv_file (str): Path of the CSV file to write
+        rows (int): Number of data rows
+        seed (int): Random seed; the same settings always produce the same file
+        rates (Optional[Dict[str, float]]): Share of rows per problem (default: DEFAULT_RATES)
+
+    Returns:
+        Dict: Settings, injected problem counts, file size and generation time
+    """
+    rates = {**DEFAULT_RATES, **(rates or {})}
+    meta_file = f"{csv_file}.meta.json"
+    settings = {"rows": rows, "seed": seed, "rates": rates}
+    if os.path.exists(csv_file) and os.path.exists(meta_file):
+        with open(meta_file, 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta["settings"] == settings and meta["bytes"] == os.path.getsize(csv_file):
+            print(f"Reusing {csv_file} ({rows} rows)")
+            return meta
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    thresholds = []
+    total = 0.0
+    for kind, rate in rates.items():
+        total += rate
+        thresholds.append((total, kind))
+    injected: Counter = Counter()
+    recent: List[str] = []
+    batch = []
+
+    with open(csv_file, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["", "InputText", "SentimentLabel"])
+        for index in range(rows):
+            roll = rng.random()
+            kind = next((kind for threshold, kind in thresholds if roll < threshold), None)
+            label = rng.choice("01")
+            if kind in ("exact_duplicate", "near_duplicate") and not recent:
+                kind = None
+
+            if kind == "bad_label":
+                text, label = synthetic_text(rng), rng.choice(BAD_LABELS)
+            elif kind == "empty_text":
+                text = rng.choice(EMPTY_TEXTS)
+            elif kind == "quoted_newline":
+                words = synthetic_text(rng).split(" ")
+                words.insert(rng.randrange(1, len(words) + 1), "\n")
+                text = " ".join(words)
+            elif kind == "exact_duplicate":
+                text = spelling_variant(rng.choice(recent), rng)
+            elif kind == "near_duplicate":
+                text = near_variant(rng.choice(recent), rng)
+            else:
+                text = synthetic_text(rng)
+                if len(recent) < RECENT_TEXTS:
+                    recent.append(text)
+                else:
+                    recent[rng.randrange(RECENT_TEXTS)] = text
+            injected[kind or "clean"] += 1
+
+            batch.append((index, text, label))
+            if len(batch) == WRITE_BATCH:
+                writer.writerows(batch)
+                batch = []
+        writer.writerows(batch)
+
+    elapsed = time.perf_counter() - started
+    meta = {
+        "settings": settings,
+        "injected": dict(injected),
+        "bytes": os.path.getsize(csv_file),
+        "seconds": round(elapsed, 3),
+    }
+    with open(meta_file, 'w', encoding='utf-8') as file:
+        json.dump(meta, file, indent=2)
+    print(f"Generated {rows} rows ({meta['bytes'] / 1e6:.1f} MB) in {csv_file} in {elapsed:.1f}s")
+    return meta
+
+def count_rows(file_path: str) -> int:
+    """Number of entries in a JSONL or Parquet file, without parsing them."""
+    if file_path.endswith('.parquet'):
+        from columnar import open_parquet
+
+        return open_parquet(file_path).metadata.num_rows
+    count = 0
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 24), b''):
+            count += block.count(b'\n')
+    return count
+
+def run_stage(stage: str, input_file: str, output_file: Optional[str], workers: int, verbose: bool) -> Dict:
+    """
+    Run one stage in the current process, which should be fresh so its peak RSS is its own.
+
+    Args:
+        stage (str): Name of the stage in STAGES
+        input_file (str): File the stage reads
+        output_file (Optional[str]): File the stage writes
+        workers (int): Processes for convert_parallel
+        verbose (bool): Let the stage print its own output
+
+    Returns:
+        Dict: Seconds, peak RSS of this process and of its workers, and RSS before the stage
+    """
+    # Imports cost the same in every stage, so they are paid before anything is timed
+    from clean_dataset import clean_dataset
+    from csv_to_jsonl import convert_csv_to_jsonl
+    from pipeline import run_pipeline
+    from verifydata import verify_dataset
+    import pyarrow.parquet  # noqa: F401
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    started = time.perf_counter()
+    with nullcontext() if verbose else redirect_stdout(io.StringIO()):
+        if stage == "convert":
+            convert_csv_to_jsonl(input_file, output_file)
+        elif stage == "convert_parallel":
+            convert_csv_to_jsonl(input_file, output_file, workers=workers)
+        elif stage == "clean":
+            clean_dataset(input_file, output_file)
+        elif stage == "clean_exact":
+            clean_dataset(input_file, output_file, near_duplicates=False)
+        elif stage in ("verify", "verify_parquet"):
+            verify_dataset(input_file)
+        elif stage == "pipeline":
+            run_pipeline(input_file, output_file)
+        elif stage == "pipeline_parquet":
+            jsonl_file = f"{os.path.splitext(output_file)[0]}.jsonl"
+            run_pipeline(input_file, jsonl_file, parquet_file=output_file)
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": elapsed,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "baseline_rss_bytes": baseline,
+        "worker_peak_rss_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    }
+
+def with_prerequisites(stages: List[str]) -> List[str]:
+    """The requested stages plus the stages that write their inputs, in STAGES order."""
+    selected = set(stages)
+    for stage in reversed(list(STAGES)):
+        requires = STAGES[stage][2]
+        if stage in selected and requires:
+            selected.add(requires)
+    return [stage for stage in STAGES if stage in selected]
+
+def measure_size(rows: int, stages: List[str], settings: Dict, work_dir: str) -> Dict:
+    """
+    Generate a corpus of `rows` rows and run each stage on it in its own spawned process.
+
+    Returns:
+        Dict: Corpus details and per-stage results
+    """
+    size_dir = os.path.join(work_dir, str(rows))
+    os.makedirs(size_dir, exist_ok=True)
+    corpus_file = os.path.join(work_dir, f"corpus-{rows}-{settings['seed']}.csv")
+    corpus = generate_corpus(corpus_file, rows, settings["seed"], settings["rates"])
+
+    results = {}
+    for stage in with_prerequisites(stages):
+        input_name, output_name, _ = STAGES[stage]
+        input_file = corpus_file if input_name == "corpus" else os.path.join(size_dir, input_name)
+        output_file = os.path.join(size_dir, output_name) if output_name else None
+        if not os.path.exists(input_file):
+            results[stage] = {"error": f"{os.path.basename(input_file)} was not written"}
+            print(f"{stage:>16}: skipped, {results[stage]['error']}")
+            continue
+
+        rows_in = rows if input_name == "corpus" else count_rows(input_file)
+        input_bytes = os.path.getsize(input_file)
+        try:
+            # A fresh interpreter per stage keeps peak RSS from leaking between stages
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                timing = executor.submit(
+                    run_stage, stage, input_file, output_file, settings["workers"], settings["verbose"]
+                ).result()
+        except BrokenProcessPool as e:
+            # Most often the kernel killing a stage that ran out of memory
+            results[stage] = {"error": f"stage process died: {e}"}
+            print(f"{stage:>16}: failed, {results[stage]['error']}")
+            continue
+
+        elapsed = timing["seconds"]
+        result = {
+            "rows_in": rows_in,
+            "rows_out": count_rows(output_file) if output_file and os.path.exists(output_file) else None,
+            "input_bytes": input_bytes,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(rows_in / elapsed, 1) if elapsed else None,
+            "mb_per_second": round(input_bytes / 1e6 / elapsed, 2) if elapsed else None,
+            "peak_rss_bytes": timing["peak_rss_bytes"],
+            # Memory the stage itself added on top of the interpreter and its imports
+            "stage_rss_bytes": timing["peak_rss_bytes"] - timing["baseline_rss_bytes"],
+            "worker_peak_rss_bytes": timing["worker_peak_rss_bytes"],
+        }
+        if output_file and result["rows_out"] is None:
+            result["error"] = f"{output_name} was not written"
+        results[stage] = result
+        print(
+            f"{stage:>16}: {elapsed:8.2f}s, {result['rows_per_second'] or 0:>11,.0f} rows/s, "
+            f"{result['mb_per_second'] or 0:7.1f} MB/s, peak RSS {result['peak_rss_bytes'] / 1e6:7.0f} MB "
+            f"(+{result['stage_rss_bytes'] / 1e6:.0f} MB), {rows_in} -> {result['rows_out'] if output_file else '-'} rows"
+        )
+    return {"corpus": corpus, "stages": results}
+
+def environment() -> Dict:
+    """Versions and machine details recorded with the results, so runs can be compared fairly."""
+    import pyarrow
+
+    return {
+        "python": platform.python_version(),
+        "pyarrow": pyarrow.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def run_benchmarks(sizes: List[int], stages: List[str], settings: Dict, work_dir: Optional[str] = None) -> Dict:
+    """
+    Measure the stages at every corpus size, smallest first.
+
+    Args:
+        sizes (List[int]): Corpus sizes in rows
+        stages (List[str]): Stages to measure; the stages writing their inputs are added
+        settings (Dict): Seed, problem rates, workers and verbosity
+        work_dir (Optional[str]): Keep corpora and outputs here and reuse corpora already generated
+            (default: a temporary directory that is removed afterwards)
+
+    Returns:
+        Dict: Settings, environment and results per size, ready to be written as JSON
+    """
+    root = work_dir or tempfile.mkdtemp(prefix="prep-bench-")
+    os.makedirs(root, exist_ok=True)
+    results = {}
+    try:
+        for rows in sorted(sizes):
+            print(f"\n{rows} rows:")
+            results[str(rows)] = measure_size(rows, stages, settings, root)
+    finally:
+        if work_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "settings": settings,
+        "environment": environment(),
+        "sizes": results,
+    }
+
+def print_scaling(results: Dict) -> None:
+    """Print rows/s of every stage across sizes, to show where a stage stops scaling."""
+    sizes = list(results["sizes"])
+    stages = [stage for stage in STAGES if any(stage in results["sizes"][size]["stages"] for size in sizes)]
+    print("\nRows/s by corpus size:")
+    print(f"{'':>16}" + "".join(f"{size:>14}" for size in sizes))
+    for stage in stages:
+        cells = []
+        for size in sizes:
+            result = results["sizes"][size]["stages"].get(stage, {})
+            cells.append(f"{result['rows_per_second']:>14,.0f}" if result.get("rows_per_second") else f"{'-':>14}")
+        print(f"{stage:>16}" + "".join(cells))
+
+def compare(baseline: Dict, current: Dict, tolerance: float) -> List[str]:
+    """
+    Print the change of throughput and peak memory of every stage between two result files.
+
+    A metric regresses when it is worse by more than `tolerance` (a fraction).
+    Stages that took under MIN_COMPARE_SECONDS in either run are skipped.
+
+    Returns:
+        List[str]: "size/stage/metric" entries that regressed
+    """
+    regressions = []
+    for size, current_size in current["sizes"].items():
+        before_size = baseline["sizes"].get(size, {}).get("stages", {})
+        for stage, result in current_size["stages"].items():
+            before = before_size.get(stage)
+            if not before or "error" in before or "error" in result:
+                continue
+            if min(before["seconds"], result["seconds"]) < MIN_COMPARE_SECONDS:
+                continue
+            for key, higher_is_better in (("rows_per_second", True), ("peak_rss_bytes", False)):
+                change = result[key] / before[key] - 1
+                worse = change < -tolerance if higher_is_better else change > tolerance
+                if worse:
+                    regressions.append(f"{size}/{stage}/{key}")
+                print(f"{size:>10} {stage:>16} {key:>15}: {before[key]:>14,.0f} -> {result[key]:>14,.0f} "
+                      f"({change:+.1%}){'  REGRESSION' if worse else ''}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the dataset preparation scripts on synthetic Arabizi corpora of growing size."
+    )
+    parser.add_argument("--rows", nargs="+", default=["10k", "100k", "1M"],
+                        help="Corpus sizes, e.g. 10k 1M 50M (default: 10k 100k 1M)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--output", default="prep_benchmark.json", help="JSON file for the results")
+    parser.add_argument("--work-dir", help="Keep corpora and outputs here, and reuse corpora already generated")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for convert_parallel")
+    parser.add_argument("--seed", type=int, default=0)
+    for kind, rate in DEFAULT_RATES.items():
+        parser.add_argument(f"--{kind.replace('_', '-')}-rate", type=float, default=rate,
+                            help=f"Share of rows with a {kind.replace('_', ' ')} (default: {rate})")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the scripts being measured")
+    parser.add_argument("--generate-only", help="Only write a corpus of the first --rows size to this CSV file")
+    parser.add_argument("--compare", help="Earlier results to compare with; exits with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change when comparing")
+    args = parser.parse_args()
+
+    rates = {kind: getattr(args, f"{kind}_rate") for kind in DEFAULT_RATES}
+    sizes = [parse_count(size) for size in args.rows]
+    if args.generate_only:
+        generate_corpus(args.generate_only, sizes[0], args.seed, rates)
+        sys.exit(0)
+
+    settings = {"seed": args.seed, "rates": rates, "workers": args.workers, "verbose": args.verbose}
+    results = run_benchmarks(sizes, args.stages, settings, args.work_dir)
+    print_scaling(results)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            regressions = compare(json.load(file), results, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
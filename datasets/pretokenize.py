@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'mistral7b.yml')
+DEFAULT_CACHE_DIR = '.token_cache'
+BATCH_SIZE = 1_000
+HISTOGRAM_BIN = 32
+
+def load_training_config(config_file: str) -> Dict:
+    """
+    Read the settings that decide how samples are tokenized for training.
+
+    Args:
+        config_file (str): Path to the axolotl config (e.g. config/mistral7b.yml)
+
+    Returns:
+        Dict: Tokenizer name, prompt format, added tokens, field names and sequence length
+    """
+    import yaml
+
+    with open(config_file, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file)
+    dataset_type = config['datasets'][0]['type']
+    return {
+        'tokenizer': config.get('tokenizer_config') or config['base_model'],
+        'format': dataset_type['format'],
+        'field_instruction': dataset_type['field_instruction'],
+        'field_output': dataset_type['field_output'],
+        'tokens': list(config.get('tokens') or []),
+        'sequence_len': int(config['sequence_len']),
+    }
+
+def iter_dataset(dataset_file: str) -> Iterator[Dict]:
+    """Stream the entries of a JSONL or Parquet dataset."""
+    if dataset_file.endswith('.parquet'):
+        from columnar import iter_parquet_records
+
+        yield from iter_parquet_records(dataset_file)
+        return
+    with open(dataset_file, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def cache_key(dataset_file: str, settings: Dict) -> str:
+    """
+    Hash the dataset contents together with everything that changes its tokenization.
+
+    Args:
+        dataset_file (str): Path to the dataset
+        settings (Dict): Output of load_training_config
+
+    Returns:
+        str: Hex digest naming the cache entry
+    """
+    digest = hashlib.sha256()
+    tokenization = {key: value for key, value in settings.items() if key != 'sequence_len'}
+    digest.update(json.dumps(tokenization, sort_keys=True).encode('utf-8'))
+    with open(dataset_file, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:24]
+
+def load_tokenizer(settings: Dict):
+    """Load the base tokenizer and register the added prompt tokens as axolotl does."""
+    from transformers import AddedToken, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(settings['tokenizer'], use_fast=True)
+    tokenizer.add_tokens([
+        AddedToken(token, rstrip=False, lstrip=False, normalized=False) for token in settings['tokens']
+    ])
+    return tokenizer
+
+_worker_tokenizer = None
+_worker_settings = None
+
+def _init_worker(settings: Dict) -> None:
+    global _worker_tokenizer, _worker_settings
+    _worker_tokenizer = load_tokenizer(settings)
+    _worker_settings = settings
+
+def _tokenize_batch(entries: List[Dict]):
+    """
+    Tokenize a batch of entries into the training layout: BOS, prompt, label, EOS.
+
+    Returns:
+        Tuple[numpy.ndarray, numpy.ndarray]: Concatenated token ids and the length of each sample
+    """
+    import numpy as np
+
+    tokenizer, settings = _worker_tokenizer, _worker_settings
+    prompts = [settings['format'].format(instruction=entry[settings['field_instruction']]) for entry in entries]
+    outputs = [str(entry[settings['field_output']]) for entry in entries]
+    prompt_ids = tokenizer(prompts, add_special_tokens=True)['input_ids']
+    output_ids = tokenizer(outputs, add_special_tokens=False)['input_ids']
+
+    samples = [prompt + output + [tokenizer.eos_token_id] for prompt, output in zip(prompt_ids, output_ids)]
+    lengths = np.fromiter((len(sample) for sample in samples), dtype=np.int64, count=len(samples))
+    tokens = np.fromiter((token for sample in samples for token in sample), dtype=np.uint32, count=int(lengths.sum()))
+    return tokens, lengths
+
+def _batches(entries: Iterator[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    batch: List[Dict] = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class TokenizedDataset:
+    """
+    Token ids of a tokenized dataset, read through a memory map.
+
+    Sample `i` is `tokens[offsets[i]:offsets[i + 1]]`. Neither array is loaded
+    into memory until it is accessed.
+    """
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as file:
+            self.meta = json.load(file)
+        self.path = path
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        tokens_file = os.path.join(path, 'tokens.bin')
+        # np.memmap cannot map an empty file
+        if os.path.getsize(tokens_file):
+            self.tokens = np.memmap(tokens_file, dtype=self.meta['dtype'], mode='r')
+        else:
+            self.tokens = np.zeros(0, dtype=self.meta['dtype'])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int):
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    @property
+    def lengths(self):
+        """Token count of every sample."""
+        import numpy as np
+
+        return np.diff(self.offsets)
+
+def pretokenize(
+    dataset_file: str,
+    config_file: str = DEFAULT_CONFIG,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    workers: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+    tokenizer: Optional[str] = None,
+) -> TokenizedDataset:
+    """
+    Tokenize a dataset with the base tokenizer, or reuse the cached result.
+
+    Token ids are appended to a flat `tokens.bin` file (uint16 when the vocabulary
+    fits, uint32 otherwise) and `offsets.npy` holds where each sample starts.
+    The entry is stored under `cache_dir/<cache_key>` and only becomes visible
+    once complete, so an interrupted run never leaves a half-written cache.
+
+    Args:
+        dataset_file (str): Path to the cleaned JSONL or Parquet dataset
+        config_file (str): Path to the axolotl config
+        cache_dir (str): Directory holding cache entries
+        workers (Optional[int]): Tokenizer processes (default: all cores)
+        batch_size (int): Samples per tokenizer call
+        tokenizer (Optional[str]): Tokenizer name or path overriding the config's base model
+
+    Returns:
+        TokenizedDataset: The memory-mapped token arrays
+    """
+    import numpy as np
+
+    settings = load_training_config(config_file)
+    if tokenizer is not None:
+        settings['tokenizer'] = tokenizer
+    entry_path = os.path.join(cache_dir, cache_key(dataset_file, settings))
+    if os.path.exists(os.path.join(entry_path, 'meta.json')):
+        print(f"Using cached tokens from {entry_path}")
+        return TokenizedDataset(entry_path)
+
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        vocab_size = len(load_tokenizer(settings))
+        dtype = np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+        lengths: List = []
+
+        with open(os.path.join(tmp_path, 'tokens.bin'), 'wb') as tokens_file, \
+                ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(settings,)) as executor:
+            # map() returns batches in input order, so samples keep their dataset order
+            for tokens, batch_lengths in executor.map(_tokenize_batch, _batches(iter_dataset(dataset_file), batch_size)):
+                tokens.astype(dtype).tofile(tokens_file)
+                lengths.append(batch_lengths)
+
+        lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        np.save(os.path.join(tmp_path, 'offsets.npy'), offsets)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({
+                'dataset_file': os.path.abspath(dataset_file),
+                'settings': settings,
+                'dtype': np.dtype(dtype).name,
+                'vocab_size': vocab_size,
+                'samples': len(lengths),
+                'tokens': int(offsets[-1]),
+            }, file, indent=2)
+
+        # Another run may have finished the same entry in the meantime; both are identical
+        shutil.rmtree(entry_path, ignore_errors=True)
+        os.replace(tmp_path, entry_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    elapsed = time.perf_counter() - started
+    print(f"Tokenized {len(lengths)} samples ({int(offsets[-1])} tokens) in {elapsed:.1f}s into {entry_path}")
+    return TokenizedDataset(entry_path)
+
+def length_report(lengths, sequence_len: int, bin_size: int = HISTOGRAM_BIN) -> Dict:
+    """
+    Summarize sample lengths against the training sequence length.
+
+    Args:
+        lengths (numpy.ndarray): Token count of every sample
+        sequence_len (int): `sequence_len` of the training config
+        bin_size (int): Width of the histogram bins in tokens
+
+    Returns:
+        Dict: Length percentiles, histogram and truncation counts
+    """
+    import numpy as np
+
+    lengths = np.asarray(lengths)
+    if not len(lengths):
+        return {'samples': 0, 'tokens': 0, 'histogram': {}, 'truncated': 0, 'truncated_tokens': 0}
+
+    bins = lengths // bin_size
+    counts = np.bincount(bins)
+    histogram = {
+        f"{index * bin_size}-{(index + 1) * bin_size - 1}": int(count)
+        for index, count in enumerate(counts) if count
+    }
+    overflow = lengths[lengths > sequence_len] - sequence_len
+    return {
+        'samples': int(len(lengths)),
+        'tokens': int(lengths.sum()),
+        'mean': round(float(lengths.mean()), 1),
+        'percentiles': {f"p{q}": int(np.percentile(lengths, q)) for q in (50, 90, 99)},
+        'max': int(lengths.max()),
+        'histogram': histogram,
+        'sequence_len': sequence_len,
+        'truncated': int(len(overflow)),
+        'truncated_tokens': int(overflow.sum()),
+    }
+
+def print_length_report(report: Dict) -> None:
+    """Print a length report with a text histogram."""
+    if not report['samples']:
+        print("No samples.")
+        return
+    print(f"{report['samples']} samples, {report['tokens']} tokens, mean length {report['mean']}, "
+          f"p50 {report['percentiles']['p50']}, p90 {report['percentiles']['p90']}, "
+          f"p99 {report['percentiles']['p99']}, max {report['max']}")
+    widest = max(report['histogram'].values())
+    for label, count in report['histogram'].items():
+        print(f"  {label:>9} {count:>8} {'#' * max(1, round(40 * count / widest))}")
+    share = report['truncated'] / report['samples']
+    print(f"{report['truncated']} samples ({share:.2%}) exceed sequence_len {report['sequence_len']} "
+          f"and lose {report['truncated_tokens']} tokens to truncation")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokenize a dataset on CPU and profile its sequence lengths.")
+    parser.add_argument("dataset_file", nargs="?", default="data.jsonl")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Axolotl config with the prompt format")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--tokenizer", default=None, help="Tokenizer name or path (default: the config's base_model)")
+    args = parser.parse_args()
+
+    dataset = pretokenize(args.dataset_file, args.config, args.cache_dir, args.workers, tokenizer=args.tokenizer)
+    # sequence_len is read from the current config; it is not part of the cache key
+    print_length_report(length_report(dataset.lengths, load_training_config(args.config)['sequence_len']))
@@ -1,27 +1,55 @@
 import json
+from typing import Dict, Optional
 
-def verify_dataset(file_path):
+from columnar import verify_parquet
+
+def verify_entry(entry: Dict) -> Optional[str]:
+    """
+    Verify the structure of a single dataset entry.
+
+    Args:
+        entry (dict): Parsed JSONL entry
+
+    Returns:
+        Optional[str]: None if the entry is valid, otherwise the problem found
+    """
+    # Check if the required keys ('InputText' and 'SentimentLabel') exist in the entry
+    if 'InputText' not in entry or 'SentimentLabel' not in entry:
+        return "Missing keys"
+    return None
+
+def verify_dataset(file_path, verbose=False):
     """
     Verify the content and structure of a JSONL dataset file.
     
     Args:
-        file_path (str): Path to the JSONL file to verify
+        file_path (str): Path to the JSONL (or Parquet) file to verify
+        verbose (bool): Print every valid entry, not only the summary
     """
-    # Load the entire dataset file into memory
-    # Each line is parsed as a JSON object and stored in a list
+    if file_path.endswith('.parquet'):
+        # Columnar files are checked column-wise through a memory map
+        problem = verify_parquet(file_path)
+        print(problem or f"Verified {file_path}")
+        return
+
+    valid_count = 0
+
+    # Stream the file one line at a time so memory use does not grow with its size
     with open(file_path, 'r', encoding='utf-8') as file:
-        dataset = [json.loads(line) for line in file]
-
-    # Iterate through each entry in the dataset to verify its structure
-    for entry in dataset:
-        # Check if the required keys ('InputText' and 'SentimentLabel') exist in each entry
-        if 'InputText' not in entry or 'SentimentLabel' not in entry:
-            # If any required key is missing, print the invalid entry and stop checking
-            print(f"Missing keys in entry: {entry}")
-            break
-        else:
-            # If the entry has all required keys, mark it as valid
-            print(f"Entry is valid: {entry}")
+        for line in file:
+            entry = json.loads(line)
+
+            if verify_entry(entry) is not None:
+                # If any required key is missing, print the invalid entry and stop checking
+                print(f"Missing keys in entry: {entry}")
+                break
+
+            # The entry has all required keys, so it is valid
+            valid_count += 1
+            if verbose:
+                print(f"Entry is valid: {entry}")
+
+    print(f"Verified {valid_count} valid entries in {file_path}")
 
 
 if __name__ == "__main__":
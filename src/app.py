@@ -1,85 +1,63 @@
 import streamlit as st
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from peft import PeftModel, PeftConfig
-import os
-
-def load_model(run_dir: str):
-    """Load the base model and apply the LoRA adapter."""
-    # Full path to the run directory in the mounted volume
-    full_run_dir = os.path.join("/runs", run_dir)
-    adapter_path = os.path.join(full_run_dir, "lora-out")
-    
-    # Debug information
-    st.info(f"""
-    Checking paths:
-    - Run directory: {full_run_dir}
-    - Adapter path: {adapter_path}
-    """)
-    
-    # Verify adapter exists
-    if not os.path.exists(os.path.join(adapter_path, "adapter_config.json")):
-        st.error(f"adapter_config.json not found in {adapter_path}")
-        st.error(f"Contents of {full_run_dir}:")
-        st.error(os.listdir(full_run_dir))
-        raise FileNotFoundError(f"adapter_config.json not found in {adapter_path}")
-
-    # Load the base model
-    base_model_name = "mistralai/Mistral-7B-v0.1"
-    model = AutoModelForCausalLM.from_pretrained(
-        base_model_name,
-        device_map="cpu",  # Use CPU instead of CUDA
-        torch_dtype=torch.float16,
-        low_cpu_mem_usage=True
-    )
-
-    # Load the tokenizer from the base model
-    tokenizer = AutoTokenizer.from_pretrained(base_model_name)
-    tokenizer.pad_token = tokenizer.eos_token  # Set pad token to eos token
-
-    
-    config = PeftConfig.from_pretrained(adapter_path)
-
-    # Resize the token embeddings to match the LoRA adapter's vocabulary size
-    print(f"Resizing token embeddings to match the LoRA adapter (vocab_size=32002)...")
-    model.resize_token_embeddings(32002,mean_resizing=False)  # Resize to match the LoRA adapter
+from inference import generate_text
+from scheduler import scheduler
+from warmup import preloader
 
-    # Load the LoRA adapter
-    model = PeftModel.from_pretrained(model, adapter_path,config=config)    
-    
-
-    return model, tokenizer
+LABEL_NAMES = {"1": "Positive", "-1": "Negative", "0": "Neutral"}
 
 def generate_answer(query: str, run_dir: str):
-    """Generate answer for a given question and query."""
-    # Format the input properly
-    fullinput = """ [INST] Analyze the sentiment of the following text: 
-                    {instruction} [/INST]
-                """.format(instruction=query)
-    
+    """Classify a single text; returns (label, probabilities)."""
     try:
-        # Load the model and tokenizer
-        model, tokenizer = load_model(run_dir)
-        
-        # Tokenize the input
-        inputs = tokenizer.encode(fullinput, return_tensors="pt", padding=True, truncation=True, max_length=512).to("cpu")
-        attention_mask = inputs.ne(tokenizer.pad_token_id).int()  # Create attention mask
-        
-        # Generate output using the model
-        outputs = model.generate(inputs, attention_mask=attention_mask, max_new_tokens=128, use_cache=True)
-        
-        # Decode the generated output
-        raw_answer = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract the actual result (e.g., "1") from the output
-        # Assume the result is always after the `[INST]` formatting
-        processed_answer = raw_answer.split("[/INST]")[-1].strip()  # Remove input and keep the response
-        
-        return processed_answer
+        # Queued with other sessions' requests and scored in a shared micro-batch
+        return scheduler.classify(query, run_dir)
+    except Exception as e:
+        st.error(f"Error during classification: {str(e)}")
+        return f"Error: {str(e)}", {}
+
+def generate_free_text(query: str, run_dir: str) -> str:
+    """Generate a free-form answer for a given query."""
+    try:
+        return generate_text(query, run_dir)
     except Exception as e:
         st.error(f"Error during generation: {str(e)}")
         return f"Error: {str(e)}"
 
+def show_model_status():
+    """List the runs this container preloads, with their state and the memory in use, in the sidebar."""
+    status = preloader.status()
+    if not status["runs"]:
+        return
+    with st.sidebar:
+        st.subheader(f"Models ({status['loaded']}/{status['total']} ready)")
+        st.table({
+            "Run": list(status["runs"]),
+            "State": [run["state"] for run in status["runs"].values()],
+            "Seconds": [run.get("seconds", run.get("elapsed_seconds", "")) for run in status["runs"].values()],
+        })
+        memory = status["memory"]
+        caption = f"Memory: {memory['rss_bytes'] / 1e9:.1f} GB resident"
+        if memory["available_bytes"] is not None:
+            caption += f", {memory['available_bytes'] / 1e9:.1f} GB available"
+        st.caption(caption)
+
+def wait_for_run(run_name: str):
+    """Show the progress of a run that is still being preloaded instead of blocking behind a spinner."""
+    if preloader.state(run_name) not in ("queued", "loading"):
+        return
+    with st.status(f"Loading the model for {run_name}...", expanded=False) as box:
+        while not preloader.wait(run_name, timeout=1.0):
+            run = preloader.status()["runs"][run_name]
+            box.update(label=f"Loading the model for {run_name} ({run['state']}, {run.get('elapsed_seconds', 0):.0f}s)...")
+        box.update(label=f"Model for {run_name} loaded.", state="complete")
+
+def spinner_text(run_name: str) -> str:
+    """Spinner label for a request, which only loads the model itself if preloading did not."""
+    state = preloader.state(run_name)
+    if state == "ready":
+        return "Analyzing sentiment..."
+    if state == "failed":
+        return f"Preloading {run_name} failed; loading its model again before analyzing..."
+    return f"{run_name} is not preloaded; loading its model before analyzing, which can take a few minutes..."
 
 def appmain():
     st.set_page_config(
@@ -91,6 +69,10 @@ def appmain():
     st.title("💭 How does it sound in Tunisian?")
     st.write("Enter text to analyze its sentiment using our fine-tuned Mistral model.")
 
+    # Normally already started by warmup.py; this covers `streamlit run app.py`
+    preloader.start()
+    show_model_status()
+
     # Input section
     with st.form("sentiment_form"):
         text_input = st.text_area(
@@ -105,28 +87,36 @@ def appmain():
             help="This is the identifier of your trained model run"
         )
 
+        mode = st.radio(
+            "Inference mode",
+            ["Label scoring", "Generation"],
+            horizontal=True,
+            help="Label scoring compares the run's labels in one forward pass; generation decodes up to 128 tokens"
+        )
+
         submit_button = st.form_submit_button("Analyze Sentiment")
 
     if submit_button and text_input and run_name:
-        with st.spinner("Analyzing sentiment... Note: this may take up to 15 minutes on the first prompt loading the model."):
+        wait_for_run(run_name)
+        with st.spinner(spinner_text(run_name)):
             try:
-                result = generate_answer(text_input, run_name)
+                probabilities = {}
+                if mode == "Label scoring":
+                    result, probabilities = generate_answer(text_input, run_name)
+                else:
+                    result = generate_free_text(text_input, run_name)
 
-                
-                
                 # Format result
-                if result == "1":
-                    result = "Positive"
-                elif result == "-1":
-                    result = "Negative"
-                elif result == "0":
-                    result = "Neutral"
-                else:
-                    result = result
-                
+                result = LABEL_NAMES.get(result, result)
+
                 st.success("Analysis Complete!")
                 st.subheader("Results")
                 st.write(result)
+                if probabilities:
+                    st.table({
+                        "Label": [LABEL_NAMES.get(label, label) for label in probabilities],
+                        "Probability": [f"{p:.1%}" for p in probabilities.values()],
+                    })
                 
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
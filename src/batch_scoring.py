@@ -0,0 +1,225 @@
+# batch_scoring.py
+import argparse
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Scores a list of texts and returns one (label, probabilities) pair per text
+ScoreFn = Callable[[List[str]], List[Tuple[str, Dict[str, float]]]]
+
+def iter_jsonl_records(path: str, start_offset: int = 0) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    Yield (end_offset, row) for each JSONL line from `start_offset` on.
+
+    `end_offset` is the byte offset just past the record, so it can be stored as
+    a resume point. Blank lines yield a row of None.
+    """
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        for line in iter(f.readline, b""):
+            row = json.loads(line) if line.strip() else None
+            yield f.tell(), row
+
+def iter_csv_records(path: str, start_offset: int = 0, text_column: int = 1) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    Yield (end_offset, row) for each CSV record in the layout read by csv_to_jsonl.py.
+
+    Physical lines are joined until their quotes balance, so quoted newlines stay
+    inside one record and offsets always fall on record boundaries. The header
+    row is skipped when reading from the start of the file.
+    """
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        lines = iter(f.readline, b"")
+        if start_offset == 0:
+            next(lines, None)
+        record = b""
+        for line in lines:
+            record += line
+            if record.count(b'"') % 2:
+                continue
+            fields = next(csv.reader([record.decode("utf-8")]), [])
+            record = b""
+            text = fields[text_column].strip() if len(fields) > text_column else ""
+            yield f.tell(), {"InputText": text} if text else None
+
+def iter_parquet_records(path: str, start_row: int = 0) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    Yield (next_row, row) for each row of a Parquet dataset written by datasets/columnar.py.
+
+    The file is memory-mapped and only the row groups at or after `start_row`
+    are decoded, reading the InputText and RowId columns alone. For Parquet
+    the resume offset is a row index rather than a byte offset.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(pa.memory_map(path, "r"))
+    columns = [name for name in ("RowId", "InputText") if name in parquet_file.schema_arrow.names]
+    first_row = 0
+    for group in range(parquet_file.num_row_groups):
+        group_rows = parquet_file.metadata.row_group(group).num_rows
+        if first_row + group_rows > start_row:
+            rows = parquet_file.read_row_group(group, columns=columns).to_pylist()
+            for index in range(max(start_row - first_row, 0), group_rows):
+                yield first_row + index + 1, rows[index]
+        first_row += group_rows
+
+def iter_records(path: str, start_offset: int = 0, text_column: int = 1):
+    """Pick the record reader from the file extension."""
+    if path.endswith(".csv"):
+        return iter_csv_records(path, start_offset, text_column)
+    if path.endswith(".parquet"):
+        return iter_parquet_records(path, start_offset)
+    return iter_jsonl_records(path, start_offset)
+
+def load_checkpoint(checkpoint_path: str) -> Dict:
+    if not os.path.exists(checkpoint_path):
+        return {"input_offset": 0, "output_offset": 0, "rows": 0, "skipped": 0}
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint_path: str, state: Dict) -> None:
+    # Write then rename, so a kill mid-write leaves the previous checkpoint intact
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def _batches(records, batch_size: int):
+    """Group records into (end_offset, rows, skipped) batches of up to `batch_size` rows."""
+    rows: List[Dict] = []
+    skipped = 0
+    end_offset = None
+    for end_offset, row in records:
+        if row is None or not str(row.get("InputText", "")).strip():
+            skipped += 1
+        else:
+            rows.append(row)
+        if len(rows) == batch_size:
+            yield end_offset, rows, skipped
+            rows, skipped = [], 0
+    if end_offset is not None and (rows or skipped):
+        yield end_offset, rows, skipped
+
+def _scored_batches(batches, score_fn: ScoreFn, executor: Optional[Executor], max_in_flight: int):
+    """Score batches in order, keeping up to `max_in_flight` batches running on the executor."""
+    if executor is None:
+        for end_offset, rows, skipped in batches:
+            texts = [row["InputText"] for row in rows]
+            yield end_offset, rows, skipped, score_fn(texts) if texts else []
+        return
+
+    pending = deque()
+    for end_offset, rows, skipped in batches:
+        texts = [row["InputText"] for row in rows]
+        pending.append((end_offset, rows, skipped, executor.submit(score_fn, texts) if texts else None))
+        if len(pending) >= max_in_flight:
+            end_offset, rows, skipped, future = pending.popleft()
+            yield end_offset, rows, skipped, future.result() if future else []
+    while pending:
+        end_offset, rows, skipped, future = pending.popleft()
+        yield end_offset, rows, skipped, future.result() if future else []
+
+def score_corpus(
+    input_path: str,
+    output_path: str,
+    score_fn: ScoreFn,
+    batch_size: int = 64,
+    text_column: int = 1,
+    executor: Optional[Executor] = None,
+    max_in_flight: int = 1,
+) -> Dict:
+    """
+    Stream a JSONL/CSV/Parquet corpus through `score_fn` and append predictions to a JSONL file.
+
+    Each output line is the input row plus `PredictedLabel` and `Probabilities`.
+    After every batch the output is flushed and a checkpoint with the input
+    offset (a row index for Parquet input) and output byte offset is written
+    next to it (`<output>.ckpt`). A rerun resumes from the checkpoint and drops
+    any output written after it.
+
+    Returns:
+        Dict: Final checkpoint state with scored and skipped row counts
+    """
+    checkpoint_path = f"{output_path}.ckpt"
+    state = load_checkpoint(checkpoint_path)
+    if state["input_offset"]:
+        print(f"Resuming {input_path} at offset {state['input_offset']} ({state['rows']} rows already scored).")
+
+    started = time.perf_counter()
+    scored_now = 0
+    mode = "r+b" if os.path.exists(output_path) else "wb"
+    with open(output_path, mode) as out:
+        out.seek(state["output_offset"])
+        out.truncate()
+
+        records = iter_records(input_path, state["input_offset"], text_column)
+        batches = _batches(records, batch_size)
+        for end_offset, rows, skipped, results in _scored_batches(batches, score_fn, executor, max_in_flight):
+            for row, (label, probabilities) in zip(rows, results):
+                record = {**row, "PredictedLabel": label, "Probabilities": probabilities}
+                out.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            out.flush()
+            os.fsync(out.fileno())
+
+            scored_now += len(rows)
+            state = {
+                "input_offset": end_offset,
+                "output_offset": out.tell(),
+                "rows": state["rows"] + len(rows),
+                "skipped": state["skipped"] + skipped,
+            }
+            save_checkpoint(checkpoint_path, state)
+
+    elapsed = time.perf_counter() - started
+    print(f"Scored {scored_now} rows in {elapsed:.1f}s ({scored_now / max(elapsed, 1e-9):.1f} rows/s); "
+          f"{state['rows']} scored and {state['skipped']} skipped in total.")
+    return state
+
+_worker_run_name = None
+
+def _init_worker(run_name: str, torch_threads: int) -> None:
+    global _worker_run_name
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    _worker_run_name = run_name
+
+def _score_in_worker(texts: List[str]):
+    # Each worker process holds its own model in its registry
+    from inference import classify_batch
+
+    return classify_batch(texts, _worker_run_name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a JSONL/CSV corpus with a trained run.")
+    parser.add_argument("--run-name", required=True, help="Training run name, e.g. axo-2024-01-16-12-34-56-ab")
+    parser.add_argument("--input", required=True, help="JSONL or Parquet file with InputText rows, or a CSV file")
+    parser.add_argument("--output", required=True, help="JSONL file for predictions")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--text-column", type=int, default=1, help="Text column index for CSV input")
+    parser.add_argument("--workers", type=int, default=1, help="Number of scoring processes")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        from inference import classify_batch
+
+        score_corpus(args.input, args.output, lambda texts: classify_batch(texts, args.run_name),
+                     args.batch_size, args.text_column)
+        return
+
+    # Split the cores between workers so their matmuls do not oversubscribe the CPU
+    torch_threads = max(1, (os.cpu_count() or 1) // args.workers)
+    with ProcessPoolExecutor(
+        args.workers, initializer=_init_worker, initargs=(args.run_name, torch_threads)
+    ) as executor:
+        score_corpus(args.input, args.output, _score_in_worker, args.batch_size, args.text_column,
+                     executor=executor, max_in_flight=2 * args.workers)
+
+if __name__ == "__main__":
+    main()
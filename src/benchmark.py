@@ -0,0 +1,373 @@
+# benchmark.py
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "mistral7b.yml")
+BASE_VOCAB_SIZE = 32000
+RUN_NAME = "bench"
+# Runs served from the serving artifacts quantize.py exports, next to the base plus adapter run
+ARTIFACT_RUNS = {"int8": f"{RUN_NAME}-int8", "snapshot": f"{RUN_NAME}-fp16"}
+MODES = ("label", "generate", "batched", "cached", "int8", "snapshot")
+LABELS = ("1", "-1", "0")
+WORDS = (
+    "ma7leh", "el", "film", "barcha", "behi", "khayeb", "mouch", "3ajbni", "ya3tik", "sa7a", "chbik",
+    "ennes", "lyoum", "mte3", "7aja", "mezyen", "ta3ba", "fi", "w", "ama", "kol", "marra", "zeda", "5ater",
+)
+# Keys where a larger value is a regression, and keys where a smaller one is
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "load_seconds")
+HIGHER_IS_BETTER = ("throughput",)
+# Changes of less than this per request or row are timer noise, whatever their relative size
+NOISE_FLOOR_MS = 1.0
+
+def synthetic_texts(count: int, seed: int = 0, min_words: int = 3, max_words: int = 40) -> List[str]:
+    """Arabizi-like texts of varying length built from a fixed word list."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(min_words, max_words))) for _ in range(count)]
+
+def build_tokenizer(output_dir: str, texts: List[str], template: str):
+    """Train a small BPE tokenizer shaped like Mistral's: <unk>/<s>/</s>, a BOS prefix and metaspace pieces."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Metaspace()
+    tokenizer.decoder = decoders.Metaspace()
+    trainer = trainers.BpeTrainer(vocab_size=2000, special_tokens=["<unk>", "<s>", "</s>"], show_progress=False)
+    corpus = [template.format(instruction=text) for text in texts] + [" ".join(LABELS + ("0123456789",))]
+    tokenizer.train_from_iterator(corpus, trainer)
+    tokenizer.post_processor = processors.TemplateProcessing(single="<s> $A", special_tokens=[("<s>", 1)])
+
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", unk_token="<unk>")
+    fast.save_pretrained(output_dir)
+    return fast
+
+def build_fixture(root: str, hidden_size: int = 256, layers: int = 4, seed: int = 0, eval_rows: int = 32) -> str:
+    """
+    Write a randomly initialized Mistral base model, a LoRA run and its serving artifacts under `root`.
+
+    The base model has the real 32000-token vocabulary and the run's adapter
+    the resized 32002 one, with the LoRA rank, alpha, target modules and
+    modules_to_save of config/mistral7b.yml. LoRA B matrices are random too,
+    so the adapter changes the outputs. The int8 and fp16 runs are copies of
+    the run with an exported serving artifact each.
+
+    Returns:
+        str: The runs directory
+    """
+    import torch
+    import yaml
+    from peft import LoraConfig, get_peft_model
+    from transformers import MistralConfig, MistralForCausalLM
+
+    from inference import ADAPTER_DIR, ADAPTER_VOCAB_SIZE, load_tokenizer
+    from lora_merge import merge_lora
+    from quantize import export_serving_model
+
+    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    template = config["datasets"][0]["type"]["format"]
+
+    base_dir = os.path.join(root, "base")
+    runs_dir = os.path.join(root, "runs")
+    run_folder = os.path.join(runs_dir, RUN_NAME)
+    adapter_dir = os.path.join(run_folder, ADAPTER_DIR)
+    os.makedirs(adapter_dir)
+
+    texts = synthetic_texts(2000, seed)
+    build_tokenizer(base_dir, texts, template)
+    torch.manual_seed(seed)
+    heads = max(hidden_size // 32, 4)
+    model = MistralForCausalLM(MistralConfig(
+        vocab_size=BASE_VOCAB_SIZE,
+        hidden_size=hidden_size,
+        # Same proportions as Mistral-7B: 3.5x wide MLP and 4 query heads per key/value head
+        intermediate_size=int(hidden_size * 3.5),
+        num_hidden_layers=layers,
+        num_attention_heads=heads,
+        num_key_value_heads=max(heads // 4, 1),
+        max_position_embeddings=4096,
+        sliding_window=4096,
+    ))
+    model.to(torch.float16).save_pretrained(base_dir)
+
+    # The adapter as axolotl leaves it: resized embeddings saved in full, tokenizer with the prompt tokens
+    tokenizer = load_tokenizer(base_dir)
+    model.resize_token_embeddings(ADAPTER_VOCAB_SIZE, mean_resizing=False)
+    lora = get_peft_model(model, LoraConfig(
+        r=config["lora_r"],
+        lora_alpha=config["lora_alpha"],
+        lora_dropout=config["lora_dropout"],
+        target_modules=config["lora_target_modules"],
+        modules_to_save=config["lora_modules_to_save"],
+        init_lora_weights=False,
+        task_type="CAUSAL_LM",
+    ))
+    lora.save_pretrained(adapter_dir)
+    tokenizer.save_pretrained(adapter_dir)
+
+    config["base_model"] = base_dir
+    config["datasets"][0]["path"] = "data.jsonl"
+    with open(os.path.join(run_folder, "config.yml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+    rng = random.Random(seed)
+    with open(os.path.join(run_folder, "data.jsonl"), "w", encoding="utf-8") as f:
+        for text in texts:
+            f.write(json.dumps({"InputText": text, "SentimentLabel": int(rng.choice(LABELS))}) + "\n")
+
+    merge_lora(base_dir, adapter_dir, os.path.join(adapter_dir, "merged"))
+    for export_format, run in (("int8", ARTIFACT_RUNS["int8"]), ("fp16", ARTIFACT_RUNS["snapshot"])):
+        shutil.copytree(run_folder, os.path.join(runs_dir, run))
+        export_serving_model(run, eval_rows, export_format)
+    return runs_dir
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean of latencies in seconds, reported in milliseconds."""
+    import numpy as np
+
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+def _timed(fn, items) -> List[float]:
+    latencies = []
+    for item in items:
+        started = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def run_mode(mode: str, runs_dir: str, base_dir: str, settings: Dict) -> Dict:
+    """
+    Measure one mode in the current process, which should be fresh so load time and peak RSS are its own.
+
+    Every mode starts from a cold registry. The first request is timed as
+    `first_request_seconds` and excluded from the latency percentiles; in
+    cached mode it is a cache miss, and the measured texts are scored once
+    after it so that they are all memory hits.
+    """
+    import torch
+    # Library imports cost the same in every mode, so they are paid before anything is timed
+    from accelerate import init_empty_weights  # noqa: F401
+    from peft import PeftModel  # noqa: F401
+    from transformers import AutoModelForCausalLM, MistralForCausalLM  # noqa: F401
+
+    import inference
+    from scheduler import MicroBatchScheduler
+    from prediction_cache import PredictionCache
+
+    if settings.get("threads"):
+        torch.set_num_threads(settings["threads"])
+    inference.registry = inference.AdapterRegistry(base_loader=lambda: inference.load_base_model(base_dir))
+    run = ARTIFACT_RUNS.get(mode, RUN_NAME)
+    texts = synthetic_texts(settings["requests"] + 1, seed=settings["seed"] + 1)
+    batch_size = settings["batch_size"]
+    prepare = None
+
+    if mode == "generate":
+        def request(text):
+            inference.generate_text(text, run, max_new_tokens=settings["new_tokens"])
+    elif mode == "batched":
+        texts = synthetic_texts((settings["requests"] + 1) * batch_size, seed=settings["seed"] + 1)
+        texts = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+        def request(batch):
+            inference.classify_batch(batch, run)
+    elif mode == "cached":
+        cache = PredictionCache(persist=False)
+        batch_scheduler = MicroBatchScheduler(cache=cache)
+
+        def request(text):
+            batch_scheduler.classify(text, run)
+
+        def prepare():
+            for text in texts[1:]:
+                request(text)
+    else:
+        def request(text):
+            inference.classify_batch([text], run)
+
+    started = time.perf_counter()
+    request(texts[0])
+    first_request_seconds = time.perf_counter() - started
+    if prepare is not None:
+        prepare()
+    latencies = _timed(request, texts[1:])
+
+    rows = sum(len(batch) for batch in texts[1:]) if mode == "batched" else len(texts) - 1
+    result = {
+        "run": run,
+        "requests": len(latencies),
+        "rows": rows,
+        "load_seconds": round(sum(load["seconds"] for load in inference.registry.cold_starts), 3),
+        "first_request_seconds": round(first_request_seconds, 3),
+        **percentiles(latencies),
+        # Rows per second; a request is one row except in batched mode
+        "throughput": round(rows / sum(latencies), 2),
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "threads": torch.get_num_threads(),
+    }
+    if mode == "cached":
+        result["cache"] = cache.stats()
+    manifest = inference.read_serving_manifest(run)
+    if manifest is not None:
+        result["artifact"] = {"format": manifest["format"], "file_bytes": manifest["file_bytes"],
+                              "accuracy_delta": manifest["accuracy"]["accuracy_delta"],
+                              "agreement": manifest["accuracy"]["agreement"]}
+    return result
+
+def environment() -> Dict:
+    """Versions and machine details recorded with the results, so runs can be compared fairly."""
+    import torch
+    import transformers
+
+    commit = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def run_benchmarks(modes: List[str], settings: Dict, fixture_dir: Optional[str] = None) -> Dict:
+    """
+    Build the fixture and measure each mode in its own spawned process.
+
+    The fixture is built in a spawned process too: Linux carries a process's
+    peak RSS over to the processes it starts, so the modes would otherwise all
+    report the peak of the fixture build.
+
+    Returns:
+        Dict: Settings, environment and per-mode results, ready to be written as JSON
+    """
+    root = fixture_dir or tempfile.mkdtemp(prefix="inference-bench-")
+    runs_dir = os.path.join(root, "runs")
+    # inference.py reads RUNS_DIR when it is first imported, here and in the mode processes
+    os.environ["RUNS_DIR"] = runs_dir
+    try:
+        started = time.perf_counter()
+        if not os.path.isdir(runs_dir):
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                executor.submit(
+                    build_fixture, root, settings["hidden_size"], settings["layers"], settings["seed"],
+                ).result()
+        print(f"Fixture ready in {time.perf_counter() - started:.1f}s.")
+
+        results = {}
+        for mode in modes:
+            # A fresh interpreter per mode keeps load times and peak RSS from leaking between modes
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                results[mode] = executor.submit(run_mode, mode, runs_dir, os.path.join(root, "base"), settings).result()
+            print(
+                f"{mode:>9}: p50 {results[mode]['p50_ms']:.1f} ms, p95 {results[mode]['p95_ms']:.1f} ms, "
+                f"p99 {results[mode]['p99_ms']:.1f} ms, {results[mode]['throughput']:.1f} rows/s, "
+                f"load {results[mode]['load_seconds']:.2f}s, peak RSS {results[mode]['peak_rss_bytes'] / 1e6:.0f} MB"
+            )
+    finally:
+        if fixture_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "settings": settings,
+        "environment": environment(),
+        "modes": results,
+    }
+
+def compare(baseline: Dict, current: Dict, tolerance: float) -> List[str]:
+    """
+    Print the change of every metric between two result files.
+
+    A metric regresses when it is worse by more than `tolerance` (a fraction)
+    and by more than NOISE_FLOOR_MS per request or row, so sub-millisecond
+    cache hits do not flag timer jitter.
+
+    Returns:
+        List[str]: "mode/metric" entries that regressed
+    """
+    regressions = []
+    for mode, result in current["modes"].items():
+        before = baseline["modes"].get(mode)
+        if before is None:
+            continue
+        for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if not before.get(key):
+                continue
+            change = result[key] / before[key] - 1
+            if key == "throughput":
+                delta_ms = (1 / result[key] - 1 / before[key]) * 1000
+            else:
+                delta_ms = (result[key] - before[key]) * (1000 if key == "load_seconds" else 1)
+            if key in LOWER_IS_BETTER:
+                worse = change > tolerance and delta_ms > NOISE_FLOOR_MS
+            else:
+                worse = change < -tolerance and delta_ms > NOISE_FLOOR_MS
+            if worse:
+                regressions.append(f"{mode}/{key}")
+            print(f"{mode:>9} {key:>15}: {before[key]:>10.2f} -> {result[key]:>10.2f} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the serving inference path offline with a tiny random Mistral and LoRA adapter."
+    )
+    parser.add_argument("--output", default="inference_benchmark.json", help="JSON file for the results")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--requests", type=int, default=50, help="Measured requests per mode")
+    parser.add_argument("--batch-size", type=int, default=32, help="Texts per request in batched mode")
+    parser.add_argument("--new-tokens", type=int, default=16, help="Tokens generated per request in generate mode")
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads (default: torch's own choice)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixture-dir", help="Build the model fixture here and keep it, or reuse it if present")
+    parser.add_argument("--compare", help="Earlier results to compare with; exits with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown when comparing")
+    args = parser.parse_args()
+
+    # Nothing may reach the Hugging Face Hub
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+    settings = {
+        "requests": args.requests,
+        "batch_size": args.batch_size,
+        "new_tokens": args.new_tokens,
+        "hidden_size": args.hidden_size,
+        "layers": args.layers,
+        "threads": args.threads,
+        "seed": args.seed,
+    }
+    results = run_benchmarks(args.modes, settings, args.fixture_dir)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
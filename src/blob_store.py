@@ -0,0 +1,138 @@
+# blob_store.py
+import hashlib
+import json
+import os
+import shutil
+import zlib
+from typing import Dict, Iterator, Tuple
+
+BLOBS_DIR = ".blobs"
+CHUNK_BYTES = 8 * 1024 * 1024
+COMPRESSION_LEVEL = 6
+DATA_FILE = "data"
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_compressed_chunks(path: str, chunk_bytes: int = CHUNK_BYTES) -> Iterator[Tuple[int, bytes]]:
+    """Yield (index, zlib-compressed chunk) for consecutive `chunk_bytes` slices of a file."""
+    with open(path, "rb") as f:
+        for index, block in enumerate(iter(lambda: f.read(chunk_bytes), b"")):
+            yield index, zlib.compress(block, COMPRESSION_LEVEL)
+
+class BlobStore:
+    """
+    Content-addressed store of dataset files in a directory.
+
+    A blob lives in `<root>/<sha256>/`: its compressed chunks while it is being
+    uploaded, then the decompressed `data` file and a `manifest.json`, which
+    is written last and marks the blob as complete. On Modal the root is
+    `/runs/.blobs`; any local directory works the same way for testing.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def blob_dir(self, digest: str) -> str:
+        return os.path.join(self.root, digest)
+
+    def data_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir(digest), DATA_FILE)
+
+    def manifest_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir(digest), "manifest.json")
+
+    def has(self, digest: str) -> bool:
+        return os.path.exists(self.manifest_path(digest))
+
+    def manifest(self, digest: str) -> Dict:
+        with open(self.manifest_path(digest), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put_chunk(self, digest: str, index: int, data: bytes) -> None:
+        chunk_dir = os.path.join(self.blob_dir(digest), "chunks")
+        os.makedirs(chunk_dir, exist_ok=True)
+        with open(os.path.join(chunk_dir, f"{index:06d}.zz"), "wb") as f:
+            f.write(data)
+
+    def seal(self, digest: str, chunks: int, suffix: str) -> Dict:
+        """
+        Assemble uploaded chunks into the blob's data file and mark it complete.
+
+        The data is hashed while it is decompressed; on a mismatch the chunks
+        are discarded so the next upload starts over.
+        """
+        blob_dir = self.blob_dir(digest)
+        chunk_dir = os.path.join(blob_dir, "chunks")
+        tmp_path = f"{self.data_path(digest)}.tmp"
+        actual = hashlib.sha256()
+        size = 0
+        compressed = 0
+        with open(tmp_path, "wb") as out:
+            for index in range(chunks):
+                with open(os.path.join(chunk_dir, f"{index:06d}.zz"), "rb") as f:
+                    data = f.read()
+                block = zlib.decompress(data)
+                actual.update(block)
+                out.write(block)
+                size += len(block)
+                compressed += len(data)
+
+        if actual.hexdigest() != digest:
+            shutil.rmtree(blob_dir, ignore_errors=True)
+            raise ValueError(f"Uploaded blob does not match its digest {digest} (got {actual.hexdigest()})")
+
+        os.replace(tmp_path, self.data_path(digest))
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        manifest = {"digest": digest, "suffix": suffix, "size": size, "compressed_size": compressed, "chunks": chunks}
+        with open(self.manifest_path(digest), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        return manifest
+
+    def link(self, digest: str, dest: str) -> str:
+        """
+        Make `dest` refer to a blob's data, with a relative symlink or a copy where symlinks are not supported.
+
+        Returns:
+            str: "symlink" or "copy"
+        """
+        if os.path.lexists(dest):
+            os.remove(dest)
+        target = os.path.relpath(self.data_path(digest), os.path.dirname(os.path.abspath(dest)))
+        try:
+            os.symlink(target, dest)
+            return "symlink"
+        except OSError:
+            shutil.copyfile(self.data_path(digest), dest)
+            return "copy"
+
+def upload_file(path: str, store, chunk_bytes: int = CHUNK_BYTES) -> str:
+    """
+    Upload a file to a blob store unless a blob with the same contents is already there.
+
+    `store` needs `has`, `put_chunk` and `seal` with the signatures of BlobStore,
+    so a client that forwards them to a remote store works as well.
+
+    Returns:
+        str: Digest of the file
+    """
+    digest = file_digest(path)
+    if store.has(digest):
+        print(f"Dataset {path} is already stored as blob {digest[:12]}; skipping upload.")
+        return digest
+
+    size = os.path.getsize(path)
+    sent = 0
+    chunks = 0
+    for index, data in iter_compressed_chunks(path, chunk_bytes):
+        store.put_chunk(digest, index, data)
+        sent += len(data)
+        chunks += 1
+    store.seal(digest, chunks, os.path.splitext(path)[1])
+    print(f"Uploaded {path} as blob {digest[:12]}: {size / 1e6:.1f} MB sent as {sent / 1e6:.1f} MB in {chunks} chunks.")
+    return digest
@@ -0,0 +1,775 @@
+# inference.py
+import gc
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+RUNS_DIR = os.environ.get("RUNS_DIR", "/runs")
+BASE_MODEL_NAME = "mistralai/Mistral-7B-v0.1"
+ADAPTER_DIR = "lora-out"
+ADAPTER_WEIGHT_FILES = ("adapter_model.safetensors", "adapter_model.bin")
+# Vocabulary of the trained adapters: the base vocabulary plus the two prompt tokens
+ADAPTER_VOCAB_SIZE = 32002
+SERVING_DIR = "serving"
+SERVING_MODEL_FILE = "model.pt"
+SERVING_SNAPSHOT_FILE = "model.safetensors"
+SERVING_MANIFEST_FILE = "manifest.json"
+# Softmax temperature fitted on validation rows by quantize.py, in the run folder
+LABEL_CALIBRATION_FILE = "label_calibration.json"
+# Serving artifact formats written by quantize.py
+INT8_FORMAT = "torch-dynamic-int8"
+SNAPSHOT_FORMAT = "safetensors-fp16"
+SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+GB = 1024 ** 3
+
+# Must match the `format` and `tokens` entries used at training time (config/mistral7b.yml);
+# the template is only a fallback for run configs without a `format`
+PROMPT_TEMPLATE = "[INST] Analyze the sentiment of the following text:\n{instruction} [/INST]"
+PROMPT_TOKENS = ["[INST]", " [/INST]"]
+MAX_PROMPT_TOKENS = 512
+
+def adapter_path_for(run_dir: str) -> str:
+    """Return the LoRA adapter directory of a run in the mounted volume."""
+    return os.path.join(RUNS_DIR, run_dir, ADAPTER_DIR)
+
+def adapter_fingerprint(adapter_path: str) -> str:
+    """
+    Fingerprint an adapter from its config contents and the size/mtime of its weights.
+
+    Hashing the weights themselves would cost a full read of the adapter on every
+    request, so the weight files only contribute their stat information.
+    """
+    config_path = os.path.join(adapter_path, "adapter_config.json")
+    if not os.path.exists(config_path):
+        run_folder = os.path.dirname(adapter_path)
+        contents = os.listdir(run_folder) if os.path.isdir(run_folder) else []
+        raise FileNotFoundError(
+            f"adapter_config.json not found in {adapter_path} (contents of {run_folder}: {contents})"
+        )
+
+    digest = hashlib.sha256()
+    with open(config_path, "rb") as f:
+        digest.update(f.read())
+    for name in ADAPTER_WEIGHT_FILES:
+        path = os.path.join(adapter_path, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+def load_tokenizer(source: str = BASE_MODEL_NAME):
+    """Load a tokenizer with the prompt tokens registered the same way axolotl did."""
+    from transformers import AddedToken, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(source, use_fast=True)
+    tokenizer.pad_token = tokenizer.eos_token  # Set pad token to eos token
+
+    # Tokens that are already registered (a tokenizer saved by axolotl) are left unchanged
+    tokenizer.add_tokens([
+        AddedToken(token, rstrip=False, lstrip=False, normalized=False) for token in PROMPT_TOKENS
+    ])
+    return tokenizer
+
+def load_base_model(model_name: str = BASE_MODEL_NAME):
+    """Load the base model and tokenizer, resized to the adapters' vocabulary."""
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    print(f"Loading base model {model_name}.")
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        device_map="cpu",  # Use CPU instead of CUDA
+        torch_dtype=torch.float16,
+        low_cpu_mem_usage=True
+    )
+    tokenizer = load_tokenizer(model_name)
+
+    # Resize the token embeddings to match the LoRA adapters' vocabulary size
+    print(f"Resizing token embeddings to match the LoRA adapter (vocab_size={ADAPTER_VOCAB_SIZE})...")
+    model.resize_token_embeddings(ADAPTER_VOCAB_SIZE, mean_resizing=False)
+
+    return model, tokenizer
+
+def serving_path_for(run_dir: str) -> str:
+    """Return the folder of a run's quantized serving artifact in the mounted volume."""
+    return os.path.join(RUNS_DIR, run_dir, SERVING_DIR)
+
+def read_serving_manifest(run_dir: str) -> Optional[dict]:
+    path = os.path.join(serving_path_for(run_dir), SERVING_MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def serving_fingerprint(run_dir: str) -> Optional[str]:
+    """
+    Fingerprint of a run's quantized serving artifact, or None if it has no usable one.
+
+    An artifact is skipped when it was exported from an older adapter, and an
+    int8 artifact also when it was exported with other torch/transformers
+    versions than the installed ones, since it is a pickled module. Set
+    SERVING_ARTIFACTS=false to always serve base plus adapter.
+    """
+    if os.environ.get("SERVING_ARTIFACTS", "true").lower() != "true":
+        return None
+    manifest = read_serving_manifest(run_dir)
+    if manifest is None:
+        return None
+
+    import torch
+    import transformers
+
+    if manifest["adapter_fingerprint"] != adapter_fingerprint(adapter_path_for(run_dir)):
+        print(f"Ignoring the serving artifact of {run_dir}: it was exported from an older adapter.")
+        return None
+    if manifest["format"] == INT8_FORMAT and (
+        (manifest["torch_version"], manifest["transformers_version"]) != (torch.__version__, transformers.__version__)
+    ):
+        print(
+            f"Ignoring the serving artifact of {run_dir}: exported with torch {manifest['torch_version']} "
+            f"and transformers {manifest['transformers_version']}."
+        )
+        return None
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:16]
+
+def load_safetensors_mmap(path: str) -> dict:
+    """
+    Read a safetensors file as tensors backed by a private memory map of it.
+
+    Nothing is read up front: pages are faulted in from the page cache as the
+    tensors are first used. The mapping is copy-on-write, so the file is never
+    modified and unmodified pages are not copied into process memory.
+    """
+    import mmap
+    import struct
+    import torch
+
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header_size = struct.unpack("<Q", buffer[:8])[0]
+    header = json.loads(buffer[8:8 + header_size])
+    header.pop("__metadata__", None)
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        if end == start:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        # Each tensor keeps a reference to the map, which stays open as long as any of them is alive
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=(end - start) // dtype.itemsize, offset=8 + header_size + start)
+        tensors[name] = tensor.view(info["shape"])
+    return tensors
+
+def load_snapshot_model(path: str):
+    """
+    Load a merged, resized safetensors snapshot with its weights memory-mapped rather than copied.
+
+    The model is built without allocating parameters and the mapped tensors
+    are assigned in place. If that fails, the snapshot is loaded with
+    from_pretrained instead.
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    try:
+        from accelerate import init_empty_weights
+
+        with init_empty_weights(include_buffers=False):
+            model = AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(path))
+        # Tied weights are stored once, so they are restored by tie_weights() rather than strictly loaded
+        model.load_state_dict(load_safetensors_mmap(os.path.join(path, SERVING_SNAPSHOT_FILE)), strict=False, assign=True)
+        model.tie_weights()
+        missing = [name for name, param in model.named_parameters() if param.is_meta]
+        if missing:
+            raise ValueError(f"no weights for {missing[:5]}")
+    except Exception as e:
+        print(f"Memory-mapped load of {path} failed ({e}); loading it with from_pretrained.")
+        model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch.float16, low_cpu_mem_usage=True)
+    return model
+
+def load_serving_model(run_dir: str):
+    """Load a run's serving artifact, int8 or safetensors snapshot, and its tokenizer."""
+    import torch
+
+    path = serving_path_for(run_dir)
+    manifest = read_serving_manifest(run_dir)
+    if manifest["format"] == SNAPSHOT_FORMAT:
+        print(f"Loading merged serving snapshot from {path}.")
+        model = load_snapshot_model(path)
+    else:
+        print(f"Loading quantized serving model from {path}.")
+        # The int8 artifact is a whole pickled module written by quantize.py, not a plain state dict
+        model = torch.load(os.path.join(path, SERVING_MODEL_FILE), map_location="cpu", weights_only=False)
+    model.eval()
+    return model, load_tokenizer(path)
+
+def adapter_memory_bytes(model, adapter_name: str) -> int:
+    """Size of the LoRA matrices and saved modules that belong to one adapter."""
+    marker = f".{adapter_name}."
+    return sum(
+        param.numel() * param.element_size()
+        for name, param in model.named_parameters()
+        if marker in name
+    )
+
+class AdapterRegistry:
+    """
+    Process-wide registry holding one base model with hot-swappable LoRA adapters.
+
+    Adapters are keyed by run name and adapter fingerprint and kept in
+    least-recently-used order; beyond `max_adapters` resident adapters or
+    `budget_bytes` of adapter weights the oldest ones are detached. The base
+    model is loaded once, so memory grows with adapter size only.
+
+    Runs with a quantized serving artifact (see quantize.py) are served from
+    that artifact instead; up to `max_serving_models` of them stay loaded.
+    """
+
+    def __init__(
+        self,
+        max_adapters: Optional[int] = None,
+        budget_bytes: Optional[int] = None,
+        base_loader=load_base_model,
+        max_serving_models: Optional[int] = None,
+        serving_loader=load_serving_model,
+    ):
+        if max_adapters is None:
+            max_adapters = int(os.environ.get("MAX_RESIDENT_ADAPTERS", "8"))
+        if budget_bytes is None:
+            budget_bytes = int(float(os.environ.get("MODEL_REGISTRY_BUDGET_GB", "8")) * GB)
+        if max_serving_models is None:
+            max_serving_models = int(os.environ.get("MAX_RESIDENT_SERVING_MODELS", "1"))
+        self.max_adapters = max_adapters
+        self.budget_bytes = budget_bytes
+        self.max_serving_models = max(max_serving_models, 1)
+        self.hits = 0
+        self.misses = 0
+        # Most recent model loads: what was loaded for which run and how long it took
+        self.cold_starts: deque = deque(maxlen=100)
+        self._base_loader = base_loader
+        self._model = None
+        self._tokenizer = None
+        self._adapters: "OrderedDict[Tuple[str, str], Tuple[str, int]]" = OrderedDict()
+        self._serving_loader = serving_loader
+        # (run, artifact fingerprint) -> (model, tokenizer) of runs served from a quantized artifact
+        self._serving: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._active_key = None
+        # Per-adapter derived state (e.g. prefix key/values), dropped when the adapter is detached
+        self._adapter_caches: Dict[Tuple[str, str], dict] = {}
+        # Adapter switching mutates the shared model, so forward passes hold this lock too
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def use(self, run_dir: str):
+        """Activate a run's adapter or serving artifact and yield (model, tokenizer) while holding the model."""
+        serving = serving_fingerprint(run_dir)
+        with self._lock:
+            if serving is not None:
+                key = (run_dir, f"serving-{serving}")
+                self._activate_serving(key)
+                yield self._serving[key]
+            else:
+                key = (run_dir, adapter_fingerprint(adapter_path_for(run_dir)))
+                self._activate(key)
+                yield self._model, self._tokenizer
+
+    def active_cache(self) -> dict:
+        """Cache dict of the adapter activated by the enclosing `use()` block."""
+        return self._adapter_caches.setdefault(self._active_key, {})
+
+    # These copy the dicts in one call instead of taking the lock, which is held for
+    # a whole model load, so health checks answer while a run is loading
+
+    def resident_runs(self):
+        return [run_dir for run_dir, _ in list(self._adapters)] + [run_dir for run_dir, _ in list(self._serving)]
+
+    def resident_bytes(self) -> int:
+        return sum(size for _, size in list(self._adapters.values()))
+
+    def _activate(self, key) -> None:
+        self._active_key = key
+        if key in self._adapters:
+            self.hits += 1
+            self._adapters.move_to_end(key)
+            self._model.set_adapter(self._adapters[key][0])
+            return
+
+        self.misses += 1
+        run_dir, fingerprint = key
+        # Module names may not contain dots, which run names are free to use
+        adapter_name = f"{run_dir}-{fingerprint}".replace(".", "_")
+        adapter_path = adapter_path_for(run_dir)
+        print(f"Attaching adapter {adapter_name} from {adapter_path}.")
+
+        if self._model is None:
+            from peft import PeftModel
+
+            base_model, self._tokenizer = self._timed_load("base model", run_dir, self._base_loader)
+            self._model = PeftModel.from_pretrained(base_model, adapter_path, adapter_name=adapter_name)
+        else:
+            self._model.load_adapter(adapter_path, adapter_name=adapter_name)
+        self._model.set_adapter(adapter_name)
+        self._model.eval()
+
+        # An older fingerprint of the same run is stale now that the adapter changed on disk
+        for stale in [k for k in self._adapters if k[0] == run_dir]:
+            self._detach(stale)
+
+        self._adapters[key] = (adapter_name, adapter_memory_bytes(self._model, adapter_name))
+        self._evict()
+
+    def _activate_serving(self, key) -> None:
+        self._active_key = key
+        if key in self._serving:
+            self.hits += 1
+            self._serving.move_to_end(key)
+            return
+
+        self.misses += 1
+        # Unload stale and least recently used artifacts before loading, since each takes several GB
+        for stale in [k for k in self._serving if k[0] == key[0]]:
+            self._unload_serving(stale)
+        while len(self._serving) >= self.max_serving_models:
+            self._unload_serving(next(iter(self._serving)))
+        self._serving[key] = self._timed_load("serving artifact", key[0], self._serving_loader, key[0])
+
+    def _timed_load(self, kind: str, run_dir: str, loader, *args):
+        started = time.perf_counter()
+        loaded = loader(*args)
+        seconds = time.perf_counter() - started
+        self.cold_starts.append({"kind": kind, "run": run_dir, "seconds": round(seconds, 2), "time": round(time.time())})
+        print(f"Cold start: loaded the {kind} for {run_dir} in {seconds:.1f}s.")
+        return loaded
+
+    def _unload_serving(self, key) -> None:
+        self._serving.pop(key)
+        self._adapter_caches.pop(key, None)
+        print(f"Unloading serving model of {key[0]}.")
+        gc.collect()
+
+    def _evict(self) -> None:
+        # The most recently attached adapter is active and is never detached
+        while len(self._adapters) > 1 and (
+            len(self._adapters) > self.max_adapters
+            or sum(size for _, size in self._adapters.values()) > self.budget_bytes
+        ):
+            self._detach(next(iter(self._adapters)))
+
+    def _detach(self, key) -> None:
+        adapter_name, _ = self._adapters.pop(key)
+        self._adapter_caches.pop(key, None)
+        print(f"Detaching adapter {adapter_name}.")
+        self._model.delete_adapter(adapter_name)
+        gc.collect()
+
+# Imported modules outlive Streamlit reruns, so this registry is shared by every session
+registry = AdapterRegistry()
+
+def use_model(run_dir: str):
+    """Context manager yielding (model, tokenizer) with the run's adapter active."""
+    return registry.use(run_dir)
+
+def build_prompt(text: str, template: str = PROMPT_TEMPLATE) -> str:
+    """Format an input text with the training prompt template."""
+    return template.format(instruction=text)
+
+def load_run_config(run_dir: str) -> dict:
+    """Read the axolotl config that was written into the run folder at launch."""
+    import yaml
+
+    with open(os.path.join(RUNS_DIR, run_dir, "config.yml"), "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def _label_sort_key(label: str):
+    try:
+        return (0, int(label), label)
+    except ValueError:
+        return (1, 0, label)
+
+def _serving_metadata(run_dir: str, fingerprint: str) -> Optional[dict]:
+    # Labels and template stored at export time spare reading the config and scanning the dataset
+    manifest = read_serving_manifest(run_dir)
+    if manifest is not None and manifest.get("adapter_fingerprint") == fingerprint and "labels" in manifest:
+        return manifest
+    return None
+
+def label_calibration_path(run_dir: str) -> str:
+    return os.path.join(RUNS_DIR, run_dir, LABEL_CALIBRATION_FILE)
+
+def read_label_calibration(run_dir: str, fingerprint: str) -> Optional[float]:
+    """Fitted softmax temperature of a run, or None if it was never calibrated for this adapter."""
+    path = label_calibration_path(run_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        calibration = json.load(f)
+    if calibration.get("adapter_fingerprint") != fingerprint:
+        return None
+    return float(calibration["temperature"])
+
+def _calibration_stamp(run_dir: str) -> Optional[int]:
+    try:
+        return os.stat(label_calibration_path(run_dir)).st_mtime_ns
+    except OSError:
+        return None
+
+@lru_cache(maxsize=64)
+def _label_settings(run_dir: str, fingerprint: str, calibration_stamp: Optional[int]) -> Tuple[Tuple[str, ...], float]:
+    calibrated = read_label_calibration(run_dir, fingerprint) if calibration_stamp is not None else None
+    metadata = _serving_metadata(run_dir, fingerprint)
+    if metadata is not None:
+        return tuple(metadata["labels"]), calibrated or float(metadata["temperature"])
+
+    config = load_run_config(run_dir)
+    temperature = calibrated or float(config.get("label_temperature") or 1.0)
+    if config.get("sentiment_labels"):
+        return tuple(str(label) for label in config["sentiment_labels"]), temperature
+
+    # Fall back to the distinct labels of the dataset the run was trained on
+    labels = set()
+    dataset_path = os.path.join(RUNS_DIR, run_dir, config["datasets"][0]["path"])
+    if dataset_path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        # Only the label column is read from the memory-mapped file
+        column = pq.ParquetFile(pa.memory_map(dataset_path, "r")).read(columns=["SentimentLabel"])["SentimentLabel"]
+        labels.update(str(label) for label in pc.unique(column).to_pylist())
+    else:
+        with open(dataset_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    labels.add(str(json.loads(line)["SentimentLabel"]))
+    return tuple(sorted(labels, key=_label_sort_key)), temperature
+
+def run_label_settings(run_dir: str) -> Tuple[Tuple[str, ...], float]:
+    """
+    Return the closed label set and softmax temperature for a run.
+
+    Labels come from the run's serving artifact when it has one, then from
+    `sentiment_labels` in the run config when set, otherwise from the run's
+    dataset. The temperature is the one fitted by `quantize.py` when the run
+    was calibrated, else `label_temperature` from the config, else 1.0
+    (uncalibrated softmax scores). Results are cached until the adapter or
+    the calibration changes.
+    """
+    return _label_settings(run_dir, adapter_fingerprint(adapter_path_for(run_dir)), _calibration_stamp(run_dir))
+
+@lru_cache(maxsize=64)
+def _prompt_template(run_dir: str, fingerprint: str) -> str:
+    metadata = _serving_metadata(run_dir, fingerprint)
+    if metadata is not None:
+        return metadata["template"]
+
+    config = load_run_config(run_dir)
+    return config["datasets"][0].get("type", {}).get("format") or PROMPT_TEMPLATE
+
+def run_prompt_template(run_dir: str) -> str:
+    """Return the prompt `format` the run was trained with, so serving cannot drift from training."""
+    return _prompt_template(run_dir, adapter_fingerprint(adapter_path_for(run_dir)))
+
+def label_token_ids(tokenizer, labels, template: str = PROMPT_TEMPLATE) -> List[List[int]]:
+    """
+    Tokenize each label as the continuation of a prompt.
+
+    Labels are encoded after a probe prompt rather than on their own, so the
+    token boundaries match what the model saw after ` [/INST]` during training.
+    """
+    probe = build_prompt("", template)
+    prefix = tokenizer(probe).input_ids
+    candidates = []
+    for label in labels:
+        full = tokenizer(probe + label).input_ids
+        if full[:len(prefix)] != prefix or len(full) == len(prefix):
+            raise ValueError(f"Label {label!r} does not tokenize as a continuation of the prompt")
+        candidates.append(full[len(prefix):])
+    return candidates
+
+def length_buckets(lengths: List[int], token_budget: int) -> List[List[int]]:
+    """
+    Group sequence indices into batches of similar length.
+
+    Indices are sorted by length and added to a batch until its padded size
+    (batch size times longest sequence) would exceed `token_budget`, so padding
+    waste stays small. A sequence longer than the budget gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for index in order:
+        # Lengths are ascending, so the newest index sets the padded width
+        if current and (len(current) + 1) * lengths[index] > token_budget:
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+def _logits_to_keep_kwargs(model, count: int) -> dict:
+    # Newer transformers only project the last `count` positions through lm_head
+    import inspect
+
+    # Serving artifacts are plain models rather than PeftModels
+    base_model = model.get_base_model() if hasattr(model, "get_base_model") else model
+    parameters = inspect.signature(base_model.forward).parameters
+    for name in ("logits_to_keep", "num_logits_to_keep"):
+        if name in parameters:
+            return {name: count}
+    return {}
+
+class PrefixCache:
+    """
+    Key/value states of the prompt text before `{instruction}`, computed once per adapter.
+
+    Every prompt of a run starts with the same instruction prefix, so batches
+    only need to run the text-specific suffix on top of these states.
+    """
+
+    def __init__(self, model, tokenizer, template: str):
+        import torch
+
+        prefix_text = template.split("{instruction}")[0]
+        self.input_ids = tokenizer(prefix_text).input_ids
+        with torch.inference_mode():
+            past = model(input_ids=torch.tensor([self.input_ids]), use_cache=True).past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            self.layers = past.to_legacy_cache()
+        elif hasattr(past, "layers"):
+            # transformers 5 caches keep per-layer objects and dropped the legacy tuple format
+            self.layers = tuple((layer.keys, layer.values) for layer in past.layers)
+        else:
+            self.layers = past
+
+    def __len__(self) -> int:
+        return len(self.input_ids)
+
+    def suffix(self, ids: List[int]) -> Optional[List[int]]:
+        """Return the tokens after the prefix, or None if the prompt tokenized differently."""
+        if len(ids) > len(self.input_ids) and ids[:len(self.input_ids)] == self.input_ids:
+            return ids[len(self.input_ids):]
+        return None
+
+    def expand(self, batch_size: int):
+        """Fresh cache object for one batch; the stored prefix tensors are never modified."""
+        from transformers import DynamicCache
+
+        layers = tuple(
+            (key.expand(batch_size, -1, -1, -1), value.expand(batch_size, -1, -1, -1))
+            for key, value in self.layers
+        )
+        if hasattr(DynamicCache, "from_legacy_cache"):
+            return DynamicCache.from_legacy_cache(layers)
+        return DynamicCache(layers)
+
+def prefix_cache_for(model, tokenizer, template: str) -> PrefixCache:
+    """Return the prefix cache of the active adapter, computing it on first use."""
+    cache = registry.active_cache()
+    if template not in cache:
+        cache[template] = PrefixCache(model, tokenizer, template)
+    return cache[template]
+
+def _forward_tail(model, rows: List[List[int]], pad_token_id: int, tail: int, prefix: Optional[PrefixCache] = None):
+    """
+    Run one left-padded forward pass and return the logits of the last `tail` positions.
+
+    With a prefix cache, `rows` hold only the tokens after the prefix and the
+    padding sits between the cached prefix and each row.
+    """
+    import torch
+
+    width = max(len(ids) for ids in rows)
+    input_ids = torch.full((len(rows), width), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+    for row, ids in enumerate(rows):
+        input_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, width - len(ids):] = 1
+    # Positions count real tokens only, so left padding does not shift them
+    position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+
+    past_key_values = None
+    if prefix is not None:
+        position_ids = position_ids + len(prefix)
+        attention_mask = torch.cat([torch.ones((len(rows), len(prefix)), dtype=torch.long), attention_mask], dim=-1)
+        past_key_values = prefix.expand(len(rows))
+
+    logits = model(
+        input_ids=input_ids,
+        attention_mask=attention_mask,
+        position_ids=position_ids,
+        past_key_values=past_key_values,
+        **_logits_to_keep_kwargs(model, tail),
+    ).logits
+    return torch.log_softmax(logits[:, -tail:].float(), dim=-1)
+
+def encode_prompts(tokenizer, prompts: List[str], max_length: int = MAX_PROMPT_TOKENS) -> List[List[int]]:
+    """Tokenize prompts in bulk, truncating the text but always keeping the closing ` [/INST]`."""
+    encoded = tokenizer(prompts, add_special_tokens=True).input_ids
+    return [ids if len(ids) <= max_length else ids[:max_length - 1] + ids[-1:] for ids in encoded]
+
+def score_label_batch(
+    model,
+    tokenizer,
+    prompts: List[str],
+    labels,
+    temperature: float = 1.0,
+    token_budget: Optional[int] = None,
+    template: str = PROMPT_TEMPLATE,
+    prefix: Optional[PrefixCache] = None,
+) -> List[Dict[str, float]]:
+    """
+    Score a closed label set for many prompts with batched forward passes.
+
+    Each label's score is the summed log-probability of its tokens following
+    the prompt. Single-token labels are read from the prompt's next-token
+    distribution; multi-token labels are scored as prompt + label sequences.
+    Sequences are grouped into length buckets under `token_budget` padded
+    tokens per pass, and with a `prefix` cache only the tokens after the
+    shared instruction prefix are run. Probabilities are a softmax over the
+    label set scaled by `temperature`, returned in input order.
+    """
+    import torch
+
+    if token_budget is None:
+        token_budget = int(os.environ.get("INFERENCE_TOKEN_BUDGET", "4096"))
+    candidates = label_token_ids(tokenizer, labels, template)
+    encoded = encode_prompts(tokenizer, prompts)
+    scores = torch.empty((len(prompts), len(candidates)))
+
+    single_token = all(len(ids) == 1 for ids in candidates)
+    if single_token:
+        rows = encoded
+        tail = 1
+        first_tokens = torch.tensor([ids[0] for ids in candidates])
+    else:
+        rows = [ids + label_ids for ids in encoded for label_ids in candidates]
+        tail = max(len(ids) for ids in candidates) + 1
+
+    # Rows that do not start with the cached prefix tokens (unusual merges at the
+    # boundary) are run in full in their own buckets
+    groups: Dict[bool, List[int]] = {True: [], False: []}
+    trimmed = []
+    for index, ids in enumerate(rows):
+        suffix = prefix.suffix(ids) if prefix is not None else None
+        groups[suffix is not None].append(index)
+        trimmed.append(suffix if suffix is not None else ids)
+
+    with torch.inference_mode():
+        for cached, indices in groups.items():
+            for bucket in length_buckets([len(trimmed[i]) for i in indices], token_budget):
+                batch = [indices[i] for i in bucket]
+                logprobs = _forward_tail(
+                    model, [trimmed[i] for i in batch], tokenizer.pad_token_id, tail, prefix if cached else None
+                )
+                if single_token:
+                    scores[batch] = logprobs[:, -1, first_tokens]
+                    continue
+                for row, index in enumerate(batch):
+                    prompt_index, label_index = divmod(index, len(candidates))
+                    label_ids = candidates[label_index]
+                    # The label's k tokens are the last k positions, predicted one step earlier
+                    start = tail - len(label_ids) - 1
+                    scores[prompt_index, label_index] = sum(
+                        logprobs[row, start + i, token] for i, token in enumerate(label_ids)
+                    )
+
+    probabilities = torch.softmax(scores / temperature, dim=-1)
+    return [
+        {label: float(p) for label, p in zip(labels, row)}
+        for row in probabilities
+    ]
+
+def apply_temperature(probabilities: List[Dict[str, float]], temperature: float) -> List[Dict[str, float]]:
+    """Rescale label probabilities scored at temperature 1.0 to another temperature."""
+    import torch
+
+    if not probabilities or temperature == 1.0:
+        return probabilities
+    labels = list(probabilities[0])
+    logprobs = torch.tensor([[p[label] for label in labels] for p in probabilities]).clamp_min(1e-30).log()
+    return [
+        {label: float(p) for label, p in zip(labels, row)}
+        for row in torch.softmax(logprobs / temperature, dim=-1)
+    ]
+
+def fit_temperature(probabilities: List[Dict[str, float]], targets: List[str]) -> Tuple[float, float, float]:
+    """
+    Fit the softmax temperature that minimizes the negative log-likelihood of the true labels.
+
+    `probabilities` must be scored at temperature 1.0; their logs serve as the
+    logits, since a softmax is unchanged by per-row constants. Rows whose
+    label is outside the label set are skipped.
+
+    Returns:
+        Tuple[float, float, float]: The temperature, and the mean NLL before and after scaling
+    """
+    import torch
+
+    labels = list(probabilities[0]) if probabilities else []
+    pairs = [(p, labels.index(target)) for p, target in zip(probabilities, targets) if target in labels]
+    if len(labels) < 2 or not pairs:
+        return 1.0, 0.0, 0.0
+    logits = torch.tensor([[p[label] for label in labels] for p, _ in pairs]).clamp_min(1e-30).log()
+    target = torch.tensor([index for _, index in pairs])
+
+    # Optimized in log space so the temperature stays positive
+    log_temperature = torch.zeros((), requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_temperature], lr=0.1, max_iter=200)
+
+    def closure():
+        optimizer.zero_grad()
+        loss = torch.nn.functional.cross_entropy(logits / log_temperature.exp(), target)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    temperature = float(log_temperature.detach().exp())
+    with torch.no_grad():
+        before = float(torch.nn.functional.cross_entropy(logits, target))
+        after = float(torch.nn.functional.cross_entropy(logits / temperature, target))
+    return temperature, before, after
+
+def classify_batch(
+    texts: List[str],
+    run_dir: str,
+    token_budget: Optional[int] = None,
+    use_prefix_cache: bool = True,
+) -> List[Tuple[str, Dict[str, float]]]:
+    """Return (label, probabilities) for each text, in input order."""
+    if not texts:
+        return []
+    labels, temperature = run_label_settings(run_dir)
+    template = run_prompt_template(run_dir)
+    prompts = [build_prompt(text, template) for text in texts]
+    with use_model(run_dir) as (model, tokenizer):
+        prefix = prefix_cache_for(model, tokenizer, template) if use_prefix_cache else None
+        results = score_label_batch(
+            model, tokenizer, prompts, labels, temperature, token_budget, template, prefix
+        )
+    return [(max(probabilities, key=probabilities.get), probabilities) for probabilities in results]
+
+def classify(text: str, run_dir: str) -> Tuple[str, Dict[str, float]]:
+    """Return the most likely label of a text and the probabilities of all labels."""
+    return classify_batch([text], run_dir)[0]
+
+def generate_text(text: str, run_dir: str, max_new_tokens: int = 128) -> str:
+    """Generate a free-form completion for a text and return only the response."""
+    import torch
+
+    with use_model(run_dir) as (model, tokenizer):
+        inputs = tokenizer(build_prompt(text, run_prompt_template(run_dir)), return_tensors="pt")
+        with torch.inference_mode():
+            outputs = model.generate(**inputs, max_new_tokens=max_new_tokens, use_cache=True)
+    return tokenizer.decode(outputs[0, inputs.input_ids.shape[1]:], skip_special_tokens=True).strip()
@@ -0,0 +1,206 @@
+# lora_merge.py
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Tuple
+
+ADAPTER_PREFIX = "base_model.model."
+# Files of the base model that describe rather than hold weights
+BASE_METADATA_FILES = ("generation_config.json",)
+TOKENIZER_FILES = (
+    "tokenizer.json", "tokenizer.model", "tokenizer_config.json", "special_tokens_map.json", "added_tokens.json",
+)
+
+def base_shards(base_dir: str) -> List[str]:
+    """Safetensors shard file names of a base model, in index order."""
+    index_path = os.path.join(base_dir, "model.safetensors.index.json")
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            weight_map = json.load(f)["weight_map"]
+        return sorted(set(weight_map.values()))
+    if os.path.exists(os.path.join(base_dir, "model.safetensors")):
+        return ["model.safetensors"]
+    raise FileNotFoundError(f"No safetensors weights in {base_dir} (contents: {os.listdir(base_dir)})")
+
+def _base_key(adapter_key: str) -> str:
+    """Map an adapter tensor name to the base model name it belongs to."""
+    key = adapter_key[len(ADAPTER_PREFIX):] if adapter_key.startswith(ADAPTER_PREFIX) else adapter_key
+    # Older PEFT versions keep the wrapper and adapter names in saved keys
+    return key.replace(".modules_to_save.default", "").replace(".modules_to_save", "").replace(".default.", ".")
+
+def _pattern_value(module: str, patterns: Dict[str, float], default: float) -> float:
+    for pattern, value in patterns.items():
+        if re.match(rf"(.*\.)?{pattern}$", module):
+            return value
+    return default
+
+def load_adapter(adapter_dir: str):
+    """
+    Read a PEFT LoRA adapter into per-module factors and replacement tensors.
+
+    Returns:
+        Tuple[Dict, Dict, Dict]: {base weight name: (A, B, scale)}, {base weight name: saved tensor}
+        for modules_to_save, and the adapter config
+    """
+    import torch
+    from safetensors.torch import load_file
+
+    with open(os.path.join(adapter_dir, "adapter_config.json")) as f:
+        config = json.load(f)
+    if config.get("use_dora"):
+        raise ValueError("DoRA adapters are not supported by the streaming merge; use MERGE_BACKEND=axolotl")
+
+    weights_path = os.path.join(adapter_dir, "adapter_model.safetensors")
+    if os.path.exists(weights_path):
+        tensors = load_file(weights_path)
+    else:
+        tensors = torch.load(os.path.join(adapter_dir, "adapter_model.bin"), map_location="cpu", weights_only=True)
+    factors: Dict[str, Dict] = {}
+    replacements = {}
+    for adapter_key, tensor in tensors.items():
+        key = _base_key(adapter_key)
+        match = re.match(r"(.*)\.lora_([AB])\.weight$", key)
+        if match:
+            factors.setdefault(match.group(1), {})[match.group(2)] = tensor
+        else:
+            replacements[key] = tensor
+
+    lora = {}
+    for module, pair in factors.items():
+        rank = _pattern_value(module, config.get("rank_pattern") or {}, config["r"])
+        alpha = _pattern_value(module, config.get("alpha_pattern") or {}, config["lora_alpha"])
+        scale = alpha / rank ** 0.5 if config.get("use_rslora") else alpha / rank
+        lora[f"{module}.weight"] = (pair["A"], pair["B"], scale)
+    return lora, replacements, config
+
+def merge_tensor(weight, a, b, scale: float, fan_in_fan_out: bool = False):
+    """W + scale * B @ A, computed in float32 and cast back to the weight's dtype."""
+    delta = (b.float() @ a.float()) * scale
+    if fan_in_fan_out:
+        delta = delta.T
+    return (weight.float() + delta).to(weight.dtype)
+
+def merge_lora(base_dir: str, adapter_dir: str, output_dir: str) -> Dict:
+    """
+    Merge a LoRA adapter into a base model one safetensors shard at a time.
+
+    Each shard is opened through a memory map. Its tensors are merged with
+    their LoRA deltas or replaced by the adapter's saved modules (the resized
+    embed_tokens and lm_head), then written out before the next shard is
+    read. Peak memory is about one shard plus the adapter. The config's
+    vocab_size follows the replaced embeddings, and the adapter's tokenizer
+    files are copied alongside.
+
+    Returns:
+        Dict: Counts of merged, replaced and copied tensors, and the elapsed time
+    """
+    from safetensors import safe_open
+    from safetensors.torch import save_file
+
+    started = time.perf_counter()
+    lora, replacements, adapter_config = load_adapter(adapter_dir)
+    fan_in_fan_out = adapter_config.get("fan_in_fan_out", False)
+    os.makedirs(output_dir, exist_ok=True)
+
+    merged, replaced, copied = 0, 0, 0
+    weight_map = {}
+    total_size = 0
+    for shard in base_shards(base_dir):
+        tensors = {}
+        with safe_open(os.path.join(base_dir, shard), framework="pt") as f:
+            metadata = f.metadata() or {"format": "pt"}
+            for key in f.keys():
+                tensor = f.get_tensor(key)
+                if key in replacements:
+                    tensor = replacements[key].to(tensor.dtype)
+                    replaced += 1
+                elif key in lora:
+                    a, b, scale = lora[key]
+                    tensor = merge_tensor(tensor, a, b, scale, fan_in_fan_out)
+                    merged += 1
+                else:
+                    copied += 1
+                tensors[key] = tensor.contiguous()
+                weight_map[key] = shard
+                total_size += tensor.numel() * tensor.element_size()
+        save_file(tensors, os.path.join(output_dir, shard), metadata=metadata)
+        print(f"Merged shard {shard} ({len(tensors)} tensors).")
+        del tensors
+
+    missing = sorted((set(lora) | set(replacements)) - set(weight_map))
+    if missing:
+        raise ValueError(f"Adapter weights without a base tensor: {missing[:5]}")
+
+    if len(weight_map) and os.path.exists(os.path.join(base_dir, "model.safetensors.index.json")):
+        with open(os.path.join(output_dir, "model.safetensors.index.json"), "w") as f:
+            json.dump({"metadata": {"total_size": total_size}, "weight_map": weight_map}, f, indent=2)
+
+    with open(os.path.join(base_dir, "config.json")) as f:
+        model_config = json.load(f)
+    embed = replacements.get("model.embed_tokens.weight")
+    if embed is not None:
+        model_config["vocab_size"] = embed.shape[0]
+    with open(os.path.join(output_dir, "config.json"), "w") as f:
+        json.dump(model_config, f, indent=2)
+    for name in BASE_METADATA_FILES:
+        if os.path.exists(os.path.join(base_dir, name)):
+            shutil.copyfile(os.path.join(base_dir, name), os.path.join(output_dir, name))
+    for name in TOKENIZER_FILES:
+        for source in (adapter_dir, os.path.dirname(os.path.normpath(adapter_dir)), base_dir):
+            if os.path.exists(os.path.join(source, name)):
+                shutil.copyfile(os.path.join(source, name), os.path.join(output_dir, name))
+                break
+
+    summary = {"merged": merged, "replaced": replaced, "copied": copied,
+               "seconds": round(time.perf_counter() - started, 1)}
+    print(f"Merged {merged} LoRA weights, replaced {replaced} saved modules and copied {copied} tensors "
+          f"into {output_dir} in {summary['seconds']}s.")
+    return summary
+
+def verify_merge(base_dir: str, adapter_dir: str, merged_dir: str, atol: float = 1e-2) -> Tuple[bool, float]:
+    """
+    Compare a streamed merge with PEFT's merge_and_unload.
+
+    This loads the whole model, so it is meant for small test models such as a
+    randomly initialized Mistral config.
+
+    Returns:
+        Tuple[bool, float]: Whether all tensors match within `atol`, and the largest difference
+    """
+    import torch
+    from peft import PeftModel
+    from safetensors import safe_open
+    from transformers import AutoModelForCausalLM
+
+    model = AutoModelForCausalLM.from_pretrained(base_dir, torch_dtype=torch.float32)
+    with open(os.path.join(adapter_dir, "adapter_config.json")) as f:
+        modules_to_save = json.load(f).get("modules_to_save") or []
+    if modules_to_save:
+        with safe_open(os.path.join(adapter_dir, "adapter_model.safetensors"), framework="pt") as f:
+            vocab_size = next(f.get_slice(key).get_shape()[0] for key in f.keys() if "embed_tokens" in key)
+        model.resize_token_embeddings(vocab_size, mean_resizing=False)
+    expected = PeftModel.from_pretrained(model, adapter_dir).merge_and_unload().state_dict()
+
+    largest = 0.0
+    for shard in base_shards(merged_dir):
+        with safe_open(os.path.join(merged_dir, shard), framework="pt") as f:
+            for key in f.keys():
+                difference = (f.get_tensor(key).float() - expected[key].float()).abs().max().item()
+                largest = max(largest, difference)
+    return largest <= atol, largest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge a LoRA adapter into its base model shard by shard on CPU.")
+    parser.add_argument("base_dir", help="Base model folder with safetensors shards")
+    parser.add_argument("adapter_dir", help="Folder with adapter_config.json and adapter_model.safetensors")
+    parser.add_argument("output_dir")
+    parser.add_argument("--verify", action="store_true", help="Compare with PEFT's merge (loads the whole model)")
+    args = parser.parse_args()
+
+    merge_lora(args.base_dir, args.adapter_dir, args.output_dir)
+    if args.verify:
+        ok, largest = verify_merge(args.base_dir, args.adapter_dir, args.output_dir)
+        print(f"{'Matches' if ok else 'Differs from'} PEFT merge_and_unload (largest difference {largest:.2e}).")
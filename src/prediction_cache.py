@@ -0,0 +1,265 @@
+# prediction_cache.py
+import atexit
+import hashlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import inference
+
+Prediction = Tuple[str, Dict[str, float]]
+
+# Each container writes its own shard, <cache dir>/<run>/<shard>.sqlite, so commits never overwrite each other
+CACHE_DIR = os.environ.get("PREDICTION_CACHE_DIR", os.path.join(inference.RUNS_DIR, ".prediction-cache"))
+SHARD_SUFFIX = ".sqlite"
+
+def normalize_text(text: str) -> str:
+    """Canonical form of an input: NFKC, trimmed, with whitespace runs collapsed to one space."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+def _fingerprint(run_dir: str) -> str:
+    """Fingerprint of what produces a run's predictions: its adapter, serving artifact and label temperature."""
+    adapter = inference.adapter_fingerprint(inference.adapter_path_for(run_dir))
+    # int8 and fp16 artifacts predict slightly differently from base plus adapter
+    serving = inference.serving_fingerprint(run_dir)
+    _, temperature = inference.run_label_settings(run_dir)
+    return f"{adapter}-{serving or 'adapter'}-{temperature:g}"
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _open_volume(name: str):
+    import modal
+
+    return modal.Volume.from_name(name, create_if_missing=True)
+
+class PredictionCache:
+    """
+    Two-tier cache of predictions keyed by run, model fingerprint and normalized text.
+
+    The model fingerprint covers the adapter, the serving artifact in use and
+    the label temperature. It is computed once per run per `sync_seconds`
+    rather than on every lookup. The first tier is an in-process LRU of
+    `max_entries` predictions. The second is SQLite under `cache_dir`, one
+    shard per container and run (`<cache_dir>/<run>/<shard>.sqlite`); a miss
+    in this container's shard is looked up in the other containers' shards.
+
+    With a `volume` (any object with commit() and reload(), such as a Modal
+    Volume mounted at `cache_dir`), every `sync_seconds` and at exit the
+    shards are closed, this container's writes are committed and the other
+    containers' commits are reloaded, so warm containers share hits. The
+    volume holds nothing but the cache, because Modal refuses to reload a
+    volume with open files and serving keeps model files on /runs open.
+    Shards untouched for `max_shard_days` are deleted. Rows written for
+    another fingerprint are dropped when a run's shard is opened, so
+    retraining or re-exporting a run invalidates its cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        persist: Optional[bool] = None,
+        cache_dir: Optional[str] = None,
+        volume=None,
+        sync_seconds: Optional[float] = None,
+        max_shard_days: Optional[float] = None,
+    ):
+        if max_entries is None:
+            max_entries = int(os.environ.get("PREDICTION_CACHE_SIZE", "10000"))
+        if persist is None:
+            persist = os.environ.get("PREDICTION_CACHE_PERSIST", "true").lower() == "true"
+        if volume is None and persist and os.environ.get("PREDICTION_CACHE_VOLUME"):
+            volume = _open_volume(os.environ["PREDICTION_CACHE_VOLUME"])
+        if sync_seconds is None:
+            sync_seconds = float(os.environ.get("PREDICTION_CACHE_SYNC_SECONDS", "60"))
+        if max_shard_days is None:
+            max_shard_days = float(os.environ.get("PREDICTION_CACHE_SHARD_DAYS", "7"))
+        self.max_entries = max_entries
+        self.persist = persist
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.volume = volume
+        self.sync_seconds = sync_seconds
+        self.max_shard_days = max_shard_days
+        # Modal sets MODAL_TASK_ID per container
+        self.shard = os.environ.get("MODAL_TASK_ID") or f"{socket.gethostname()}-{os.getpid()}"
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.syncs = 0
+        self._memory: "OrderedDict[Tuple[str, str, str], Prediction]" = OrderedDict()
+        self._fingerprints: Dict[str, Tuple[float, str]] = {}
+        # run -> (fingerprint, own shard, other containers' shards)
+        self._shards: Dict[str, Tuple[str, sqlite3.Connection, List[sqlite3.Connection]]] = {}
+        self._lock = threading.Lock()
+        self._sync_thread: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+    def get(self, run_dir: str, text: str) -> Optional[Prediction]:
+        """Look up the prediction for an already normalized text."""
+        fingerprint = self._fingerprint(run_dir)
+        key = (run_dir, fingerprint, text)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+            row = None
+            if self.persist:
+                _, own, others = self._open_shards(run_dir, fingerprint)
+                query = "SELECT label, probabilities FROM predictions WHERE fingerprint = ? AND text_hash = ?"
+                args = (fingerprint, _text_hash(text))
+                row = own.execute(query, args).fetchone()
+                if row is None:
+                    for other in others:
+                        row = other.execute(query, args).fetchone()
+                        if row is not None:
+                            self.shared_hits += 1
+                            break
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            prediction = (row[0], json.loads(row[1]))
+            self._remember(key, prediction)
+            return prediction
+
+    def put_many(self, run_dir: str, texts: List[str], predictions: List[Prediction]) -> None:
+        """Store predictions for already normalized texts in both tiers."""
+        fingerprint = self._fingerprint(run_dir)
+        with self._lock:
+            for text, prediction in zip(texts, predictions):
+                self._remember((run_dir, fingerprint, text), prediction)
+            if not self.persist:
+                return
+            _, connection, _ = self._open_shards(run_dir, fingerprint)
+            now = time.time()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (fingerprint, _text_hash(text), text, label, json.dumps(probabilities), now)
+                        for text, (label, probabilities) in zip(texts, predictions)
+                    ],
+                )
+
+    def sync(self) -> None:
+        """
+        Close the shards, commit this container's writes and reload the others' commits.
+
+        Shards are reopened on the next lookup, and fingerprints are recomputed.
+        """
+        with self._lock:
+            self._close_shards()
+            self._fingerprints.clear()
+            if self.volume is not None:
+                try:
+                    self.volume.commit()
+                    self.volume.reload()
+                except Exception as e:
+                    print(f"Prediction cache sync failed: {e}")
+            self.syncs += 1
+
+    def close(self) -> None:
+        """Stop syncing and commit what this container wrote one last time."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join()
+        if self.persist:
+            self.sync()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "syncs": self.syncs,
+            }
+
+    def _fingerprint(self, run_dir: str) -> str:
+        now = time.monotonic()
+        cached = self._fingerprints.get(run_dir)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        fingerprint = _fingerprint(run_dir)
+        self._fingerprints[run_dir] = (now + self.sync_seconds, fingerprint)
+        return fingerprint
+
+    def _remember(self, key, prediction: Prediction) -> None:
+        self._memory[key] = prediction
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _open_shards(self, run_dir: str, fingerprint: str) -> Tuple[str, sqlite3.Connection, List[sqlite3.Connection]]:
+        shards = self._shards.get(run_dir)
+        if shards is not None and shards[0] == fingerprint:
+            return shards
+        if shards is not None:
+            # A new fingerprint for the run: reopen so stale rows are purged
+            for connection in [shards[1], *shards[2]]:
+                connection.close()
+        self._start_syncing()
+
+        run_cache_dir = os.path.join(self.cache_dir, run_dir)
+        os.makedirs(run_cache_dir, exist_ok=True)
+        own_name = f"{self.shard}{SHARD_SUFFIX}"
+        own = sqlite3.connect(os.path.join(run_cache_dir, own_name), timeout=30, check_same_thread=False)
+        with own:
+            own.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "fingerprint TEXT, text_hash TEXT, text TEXT, label TEXT, probabilities TEXT, created REAL, "
+                "PRIMARY KEY (fingerprint, text_hash))"
+            )
+            own.execute("DELETE FROM predictions WHERE fingerprint != ?", (fingerprint,))
+
+        others = []
+        expired = time.time() - self.max_shard_days * 86400
+        for name in sorted(os.listdir(run_cache_dir)):
+            path = os.path.join(run_cache_dir, name)
+            if name == own_name or not name.endswith(SHARD_SUFFIX):
+                continue
+            if os.path.getmtime(path) < expired:
+                # Left behind by a container that has not written for a long time
+                os.remove(path)
+                continue
+            others.append(sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False))
+        shards = (fingerprint, own, others)
+        self._shards[run_dir] = shards
+        return shards
+
+    def _close_shards(self) -> None:
+        for _, own, others in self._shards.values():
+            for connection in [own, *others]:
+                connection.close()
+        self._shards.clear()
+
+    def _start_syncing(self) -> None:
+        if self._sync_thread is not None or self._closed.is_set():
+            return
+        self._sync_thread = threading.Thread(target=self._sync_loop, name="prediction-cache-sync", daemon=True)
+        self._sync_thread.start()
+        atexit.register(self.close)
+
+    def _sync_loop(self) -> None:
+        while not self._closed.wait(self.sync_seconds):
+            self.sync()
+
+# Shared by every Streamlit session and API request in the process
+prediction_cache = PredictionCache()
@@ -0,0 +1,87 @@
+# preproc_cache.py
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+PREPROC_CACHE_DIR = ".preprocessed"
+# Config entries that change what axolotl.cli.preprocess writes
+PREPROC_CONFIG_KEYS = ("base_model", "tokenizer_config", "tokens", "datasets", "sequence_len", "sample_packing")
+
+def preprocessing_key(config: Dict, data_digest: str) -> str:
+    """Fingerprint of the dataset contents and the preprocessing-relevant config entries."""
+    relevant = {key: config.get(key) for key in PREPROC_CONFIG_KEYS}
+    digest = hashlib.sha256(data_digest.encode())
+    digest.update(json.dumps(relevant, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:24]
+
+class PreprocCache:
+    """
+    Shared cache of `dataset_prepared_path` folders written by axolotl's preprocess step.
+
+    Each entry is `<root>/<key>/prepared` plus an `entry.json` holding its last
+    use time. Beyond `max_entries` entries the least recently used ones are
+    deleted.
+    """
+
+    def __init__(self, root: str, max_entries: Optional[int] = None):
+        if max_entries is None:
+            max_entries = int(os.environ.get("PREPROC_CACHE_SIZE", "8"))
+        self.root = root
+        self.max_entries = max_entries
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _touch(self, key: str) -> None:
+        with open(os.path.join(self._entry_path(key), "entry.json"), "w", encoding="utf-8") as f:
+            json.dump({"key": key, "last_used": time.time()}, f)
+
+    def entries(self) -> List[Dict]:
+        """Complete entries, least recently used first."""
+        if not os.path.isdir(self.root):
+            return []
+        entries = []
+        for key in os.listdir(self.root):
+            path = os.path.join(self.root, key, "entry.json")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    entries.append(json.load(f))
+        return sorted(entries, key=lambda entry: entry["last_used"])
+
+    def restore(self, key: str, prepared_path: str) -> bool:
+        """
+        Copy a cached prepared dataset to `prepared_path` if one exists for `key`.
+
+        Returns:
+            bool: True on a cache hit
+        """
+        cached = os.path.join(self._entry_path(key), "prepared")
+        if not os.path.exists(os.path.join(self._entry_path(key), "entry.json")):
+            return False
+        shutil.rmtree(prepared_path, ignore_errors=True)
+        shutil.copytree(cached, prepared_path)
+        self._touch(key)
+        return True
+
+    def store(self, key: str, prepared_path: str) -> None:
+        """Add a prepared dataset to the cache and evict the least recently used entries beyond the bound."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        try:
+            shutil.copytree(prepared_path, os.path.join(tmp_path, "prepared"))
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        # entry.json is written last, so an interrupted store is never seen as a hit
+        self._touch(key)
+
+        entries = self.entries()
+        for entry in entries[:max(len(entries) - self.max_entries, 0)]:
+            print(f"Evicting preprocessed dataset {entry['key']} from the cache.")
+            shutil.rmtree(self._entry_path(entry["key"]), ignore_errors=True)
@@ -0,0 +1,324 @@
+# quantize.py
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Tuple
+
+from inference import (
+    ADAPTER_VOCAB_SIZE,
+    BASE_MODEL_NAME,
+    INT8_FORMAT,
+    RUNS_DIR,
+    SERVING_MANIFEST_FILE,
+    SERVING_MODEL_FILE,
+    SERVING_SNAPSHOT_FILE,
+    SNAPSHOT_FORMAT,
+    PrefixCache,
+    adapter_fingerprint,
+    adapter_path_for,
+    apply_temperature,
+    build_prompt,
+    fit_temperature,
+    label_calibration_path,
+    load_run_config,
+    load_tokenizer,
+    run_label_settings,
+    run_prompt_template,
+    score_label_batch,
+    serving_path_for,
+)
+
+EVAL_ROWS = 500
+# --format choices and the artifact format each one writes
+EXPORT_FORMATS = {"int8": INT8_FORMAT, "fp16": SNAPSHOT_FORMAT}
+
+def merged_path_for(run_dir: str) -> str:
+    """Folder the merge step writes the run's merged model to."""
+    return os.path.join(adapter_path_for(run_dir), "merged")
+
+def load_reference_model(run_dir: str):
+    """
+    Load a run's model in float32 with the adapter merged in.
+
+    The merged model from the training run is used when it exists; otherwise
+    the adapter is merged into the base model in memory.
+
+    Returns:
+        Tuple: (model, tokenizer, source), where source is "merged" or "base+adapter"
+    """
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    merged_path = merged_path_for(run_dir)
+    if os.path.exists(os.path.join(merged_path, "config.json")):
+        print(f"Loading merged model from {merged_path}.")
+        model = AutoModelForCausalLM.from_pretrained(merged_path, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        has_tokenizer = os.path.exists(os.path.join(merged_path, "tokenizer_config.json"))
+        tokenizer = load_tokenizer(merged_path if has_tokenizer else BASE_MODEL_NAME)
+        return model.eval(), tokenizer, "merged"
+
+    from peft import PeftModel
+
+    print(f"No merged model in {merged_path}; merging the adapter into {BASE_MODEL_NAME}.")
+    model = AutoModelForCausalLM.from_pretrained(BASE_MODEL_NAME, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    model.resize_token_embeddings(ADAPTER_VOCAB_SIZE, mean_resizing=False)
+    model = PeftModel.from_pretrained(model, adapter_path_for(run_dir)).merge_and_unload()
+    return model.eval(), load_tokenizer(), "base+adapter"
+
+def quantize_model(model):
+    """
+    Quantize the model's linear layers to int8 in place, with per-channel weight scales.
+
+    Activations are quantized on the fly for each matmul. lm_head stays in
+    float32: label probabilities are read straight from its logits.
+    """
+    import torch
+    from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic
+
+    qconfig_spec = {
+        name: per_channel_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, torch.nn.Linear) and name != "lm_head"
+    }
+    return quantize_dynamic(model, qconfig_spec, dtype=torch.qint8, inplace=True)
+
+def model_bytes(model) -> int:
+    """Bytes held by a model's parameters and buffers, including packed int8 weights."""
+    import torch
+
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    for module in model.modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            weight, bias = module.weight(), module.bias()
+            total += weight.numel() * weight.element_size()
+            if bias is not None:
+                total += bias.numel() * bias.element_size()
+            if weight.qscheme() in (torch.per_channel_affine, torch.per_channel_symmetric):
+                # A float64 scale and int64 zero point per output channel
+                total += weight.q_per_channel_scales().numel() * 16
+    return total
+
+def validation_rows(run_dir: str, limit: int = EVAL_ROWS) -> List[Tuple[str, str]]:
+    """
+    Return (text, label) pairs from the tail of the run's dataset, sized by its `val_set_size`.
+
+    Axolotl shuffles before splitting off its validation set, so these are
+    held-out-sized rows of the same distribution rather than the exact rows
+    it evaluated on. At most `limit` rows are returned.
+    """
+    config = load_run_config(run_dir)
+    dataset_path = os.path.join(RUNS_DIR, run_dir, config["datasets"][0]["path"])
+    if dataset_path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        rows = pq.read_table(dataset_path, columns=["InputText", "SentimentLabel"]).to_pylist()
+    else:
+        with open(dataset_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    val_set_size = config.get("val_set_size") or 0.05
+    count = int(val_set_size) if val_set_size >= 1 else max(1, int(len(rows) * val_set_size))
+    return [(row["InputText"], str(row["SentimentLabel"])) for row in rows[-count:][:limit]]
+
+def evaluate(model, tokenizer, run_dir: str, rows: List[Tuple[str, str]]) -> Tuple[List[Dict[str, float]], float]:
+    """
+    Score the label set of a run for each row with one model.
+
+    Scores are uncalibrated (temperature 1.0), so a temperature can be fitted
+    on them and applied afterwards with `apply_temperature`.
+
+    Returns:
+        Tuple[List[Dict[str, float]], float]: Label probabilities per row, and the seconds spent scoring
+    """
+    labels, _ = run_label_settings(run_dir)
+    template = run_prompt_template(run_dir)
+    started = time.perf_counter()
+    prefix = PrefixCache(model, tokenizer, template)
+    prompts = [build_prompt(text, template) for text, _ in rows]
+    results = score_label_batch(model, tokenizer, prompts, labels, 1.0, template=template, prefix=prefix)
+    return results, time.perf_counter() - started
+
+def calibrate(run_dir: str, fingerprint: str, rows: List[Tuple[str, str]], reference: List[Dict[str, float]]) -> Dict:
+    """
+    Fit the run's softmax temperature on the float32 scores of validation rows and store it in the run folder.
+
+    The rows come from `validation_rows`, which axolotl may also have trained
+    on, so the fitted temperature can lean towards overconfidence.
+
+    Returns:
+        Dict: The calibration written to label_calibration.json
+    """
+    temperature, nll_before, nll_after = fit_temperature(reference, [label for _, label in rows])
+    calibration = {
+        "adapter_fingerprint": fingerprint,
+        "temperature": round(temperature, 4),
+        "rows": len(rows),
+        "nll_uncalibrated": round(nll_before, 4),
+        "nll_calibrated": round(nll_after, 4),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    path = label_calibration_path(run_dir)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+    print(
+        f"Calibrated {run_dir} on {len(rows)} validation rows: temperature {calibration['temperature']}, "
+        f"NLL {calibration['nll_uncalibrated']:.4f} -> {calibration['nll_calibrated']:.4f}"
+    )
+    return calibration
+
+def calibrate_run(run_dir: str, eval_rows: int = EVAL_ROWS) -> Dict:
+    """Score validation rows with the run's float32 model and fit its temperature, without exporting."""
+    fingerprint = adapter_fingerprint(adapter_path_for(run_dir))
+    model, tokenizer, _ = load_reference_model(run_dir)
+    rows = validation_rows(run_dir, eval_rows)
+    print(f"Scoring {len(rows)} validation rows with the float32 model.")
+    reference, _ = evaluate(model, tokenizer, run_dir, rows)
+    return calibrate(run_dir, fingerprint, rows, reference)
+
+def accuracy_report(
+    rows: List[Tuple[str, str]],
+    reference: List[Dict[str, float]],
+    serving: List[Dict[str, float]],
+    reference_seconds: float,
+    serving_seconds: float,
+) -> Dict:
+    """Accuracy of both models on the rows, how often they agree, and how far their probabilities differ."""
+    def predicted(probabilities):
+        return max(probabilities, key=probabilities.get)
+
+    count = max(len(rows), 1)
+    reference_accuracy = sum(predicted(p) == label for p, (_, label) in zip(reference, rows)) / count
+    serving_accuracy = sum(predicted(p) == label for p, (_, label) in zip(serving, rows)) / count
+    deltas = [abs(r[label] - q[label]) for r, q in zip(reference, serving) for label in r]
+    return {
+        "rows": len(rows),
+        "reference_accuracy": round(reference_accuracy, 4),
+        "serving_accuracy": round(serving_accuracy, 4),
+        "accuracy_delta": round(serving_accuracy - reference_accuracy, 4),
+        "agreement": round(sum(predicted(r) == predicted(q) for r, q in zip(reference, serving)) / count, 4),
+        "mean_probability_delta": round(sum(deltas) / max(len(deltas), 1), 4),
+        "max_probability_delta": round(max(deltas, default=0.0), 4),
+        "reference_seconds_per_row": round(reference_seconds / count, 4),
+        "serving_seconds_per_row": round(serving_seconds / count, 4),
+    }
+
+def export_serving_model(run_dir: str, eval_rows: int = EVAL_ROWS, export_format: str = "int8") -> Dict:
+    """
+    Export a CPU serving artifact of a run into /runs/<run>/serving/.
+
+    The run's model is loaded in float32 and scored on validation rows, then
+    converted and scored again. With "int8" the linear layers are quantized
+    and the module is pickled. With "fp16" the merged, resized weights are
+    saved as a safetensors snapshot that serving memory-maps. Either way the
+    folder also holds the tokenizer and a manifest with the label metadata and
+    the accuracy report. The float32 scores also calibrate the run's softmax
+    temperature (see `calibrate`), and both reports use it. The manifest is
+    written last and the folder is swapped in whole, so readers never see a
+    partial export.
+
+    Returns:
+        Dict: The manifest
+    """
+    import torch
+    import transformers
+    from safetensors.torch import save_model
+
+    fingerprint = adapter_fingerprint(adapter_path_for(run_dir))
+    model, tokenizer, source = load_reference_model(run_dir)
+    labels, _ = run_label_settings(run_dir)
+    rows = validation_rows(run_dir, eval_rows)
+    print(f"Scoring {len(rows)} validation rows with the float32 model.")
+    reference, reference_seconds = evaluate(model, tokenizer, run_dir, rows)
+    reference_bytes = model_bytes(model)
+    calibration = calibrate(run_dir, fingerprint, rows, reference)
+    temperature = calibration["temperature"]
+    reference = apply_temperature(reference, temperature)
+
+    if export_format == "int8":
+        quantize_model(model)
+    else:
+        # Parameters only: float32 buffers such as the rotary frequencies stay as serving builds them
+        for param in model.parameters():
+            param.data = param.data.half()
+    print(f"Scoring {len(rows)} validation rows with the {export_format} model.")
+    serving, serving_seconds = evaluate(model, tokenizer, run_dir, rows)
+    serving = apply_temperature(serving, temperature)
+
+    serving_path = serving_path_for(run_dir)
+    tmp_path = f"{serving_path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    if export_format == "int8":
+        model_file = SERVING_MODEL_FILE
+        torch.save(model, os.path.join(tmp_path, model_file))
+    else:
+        model_file = SERVING_SNAPSHOT_FILE
+        # save_model stores tied weights once; the loader ties them again
+        save_model(model, os.path.join(tmp_path, model_file), metadata={"format": "pt"})
+        model.config.save_pretrained(tmp_path)
+    tokenizer.save_pretrained(tmp_path)
+
+    manifest = {
+        "format": EXPORT_FORMATS[export_format],
+        "source": source,
+        "adapter_fingerprint": fingerprint,
+        "torch_version": torch.__version__,
+        "transformers_version": transformers.__version__,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "labels": list(labels),
+        "temperature": temperature,
+        "calibration": calibration,
+        "template": run_prompt_template(run_dir),
+        "reference_bytes": reference_bytes,
+        "model_bytes": model_bytes(model),
+        "file_bytes": os.path.getsize(os.path.join(tmp_path, model_file)),
+        "accuracy": accuracy_report(rows, reference, serving, reference_seconds, serving_seconds),
+    }
+    with open(os.path.join(tmp_path, SERVING_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(serving_path, ignore_errors=True)
+    os.replace(tmp_path, serving_path)
+    print_export_report(run_dir, manifest)
+    return manifest
+
+def print_export_report(run_dir: str, manifest: Dict) -> None:
+    accuracy = manifest["accuracy"]
+    name = manifest["format"]
+    print(f"Serving artifact of {run_dir} ({name}, from the {manifest['source']} model):")
+    print(f"  weights: {manifest['reference_bytes'] / 1e9:.2f} GB float32 -> {manifest['model_bytes'] / 1e9:.2f} GB {name}")
+    print(
+        f"  accuracy on {accuracy['rows']} validation rows: {accuracy['reference_accuracy']:.1%} float32, "
+        f"{accuracy['serving_accuracy']:.1%} {name} ({accuracy['accuracy_delta']:+.1%})"
+    )
+    print(
+        f"  agreement {accuracy['agreement']:.1%}, probability delta mean {accuracy['mean_probability_delta']:.4f} "
+        f"/ max {accuracy['max_probability_delta']:.4f}"
+    )
+    print(
+        f"  scoring time per row: {accuracy['reference_seconds_per_row'] * 1000:.1f} ms float32, "
+        f"{accuracy['serving_seconds_per_row'] * 1000:.1f} ms {name}"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a CPU serving artifact of a training run.")
+    parser.add_argument("run_dir", help="Run name in the runs volume (set RUNS_DIR if it is not mounted at /runs)")
+    parser.add_argument("--eval-rows", type=int, default=EVAL_ROWS, help="Validation rows scored with both models")
+    parser.add_argument(
+        "--format", choices=sorted(EXPORT_FORMATS), default="int8",
+        help="int8: quantized pickled module; fp16: merged safetensors snapshot loaded through a memory map",
+    )
+    parser.add_argument(
+        "--calibrate-only", action="store_true",
+        help="Only fit the run's softmax temperature on the validation rows and store it in the run folder",
+    )
+    args = parser.parse_args()
+    if args.calibrate_only:
+        calibrate_run(args.run_dir, args.eval_rows)
+    else:
+        export_serving_model(args.run_dir, args.eval_rows, args.format)
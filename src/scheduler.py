@@ -0,0 +1,183 @@
+# scheduler.py
+import asyncio
+import os
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from inference import classify_batch, registry
+from prediction_cache import PredictionCache, normalize_text, prediction_cache
+from warmup import Preloader, preloader
+
+class MicroBatchScheduler:
+    """
+    Queue classification requests and run them as micro-batches.
+
+    A background thread runs an asyncio loop that takes the first queued
+    request, keeps collecting requests for up to `max_wait_ms` or until
+    `max_batch_size` are waiting, then runs one batched pass per run. Callers
+    from any thread or event loop get a future for their own result. With a
+    prediction `cache`, texts are normalized first and cache hits resolve
+    immediately without entering the queue.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        classify_fn=classify_batch,
+        cache: Optional[PredictionCache] = None,
+    ):
+        if max_batch_size is None:
+            max_batch_size = int(os.environ.get("MICROBATCH_MAX_SIZE", "32"))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "10"))
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = 0
+        self.batch_sizes: Counter = Counter()
+        self._classify_fn = classify_fn
+        self._cache = cache
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_loop, name="microbatch-scheduler", daemon=True)
+                self._thread.start()
+        self._started.wait()
+
+    def submit(self, text: str, run_name: str) -> Future:
+        """Queue a text and return a future resolving to (label, probabilities)."""
+        self.start()
+        future: Future = Future()
+        if self._cache is not None:
+            text = normalize_text(text)
+            cached = self._cache.get(run_name, text)
+            if cached is not None:
+                future.set_result(cached)
+                return future
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (text, run_name, future))
+        return future
+
+    def classify(self, text: str, run_name: str) -> Tuple[str, Dict[str, float]]:
+        """Blocking variant of `submit` for threaded callers such as Streamlit sessions."""
+        return self.submit(text, run_name).result()
+
+    async def classify_async(self, text: str, run_name: str) -> Tuple[str, Dict[str, float]]:
+        """Awaitable variant of `submit` usable from any event loop."""
+        return await asyncio.wrap_future(self.submit(text, run_name))
+
+    def stats(self) -> Dict:
+        batches = sum(self.batch_sizes.values())
+        batched = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "batches": batches,
+            "mean_batch_size": batched / batches if batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "cache": self._cache.stats() if self._cache is not None else None,
+        }
+
+    def _run_loop(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._loop.create_task(self._worker())
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.requests += len(batch)
+            self.batch_sizes[len(batch)] += 1
+            # The forward pass runs off the loop so new requests keep queueing meanwhile
+            await loop.run_in_executor(None, self._run_batch, batch)
+
+    def _run_batch(self, batch: List[Tuple[str, str, Future]]) -> None:
+        by_run = defaultdict(list)
+        for text, run_name, future in batch:
+            if future.set_running_or_notify_cancel():
+                by_run[run_name].append((text, future))
+
+        # Each run has its own adapter, so requests are batched per run
+        for run_name, items in by_run.items():
+            try:
+                results = self._classify_fn([text for text, _ in items], run_name)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            if self._cache is not None:
+                self._cache.put_many(run_name, [text for text, _ in items], results)
+            for (_, future), result in zip(items, results):
+                future.set_result(result)
+
+# Shared by every Streamlit session and API request in the process
+scheduler = MicroBatchScheduler(
+    cache=prediction_cache if os.environ.get("PREDICTION_CACHE", "true").lower() == "true" else None
+)
+
+def create_api(batch_scheduler: MicroBatchScheduler = scheduler, run_preloader: Preloader = preloader):
+    """Build a FastAPI app exposing the scheduler as a JSON endpoint, and start preloading runs."""
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import JSONResponse
+    from pydantic import BaseModel
+
+    class ClassifyRequest(BaseModel):
+        run_name: str
+        texts: List[str]
+
+    api = FastAPI(title="Tunisian Arabizi sentiment analysis")
+
+    @api.post("/classify")
+    async def classify_texts(request: ClassifyRequest):
+        try:
+            results = await asyncio.gather(
+                *(batch_scheduler.classify_async(text, request.run_name) for text in request.texts)
+            )
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        return {
+            "run_name": request.run_name,
+            "results": [
+                {"label": label, "probabilities": probabilities}
+                for label, probabilities in results
+            ],
+        }
+
+    @api.get("/stats")
+    async def stats():
+        # Model load times let cold starts be tracked across deployments
+        return {**batch_scheduler.stats(), "cold_starts": list(registry.cold_starts)}
+
+    @api.get("/health")
+    async def health():
+        """Liveness with preload progress and memory use; always 200 while the process is up."""
+        return run_preloader.status()
+
+    @api.get("/ready")
+    async def ready():
+        """200 once every preloaded run is ready or failed, 503 while any is still queued or loading."""
+        status = run_preloader.status()
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+    run_preloader.start()
+    return api
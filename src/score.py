@@ -0,0 +1,50 @@
+# score.py
+from concurrent.futures import ThreadPoolExecutor
+
+from .train_setup import (
+    app,
+    training_image,
+    volume_manager,
+    HOURS,
+)
+
+VOLUME_CONFIG = volume_manager.get_volume_config()
+
+@app.function(
+    image=training_image,
+    cpu=8.0,
+    memory=32768,
+    volumes=VOLUME_CONFIG,
+    timeout=2 * HOURS,
+    container_idle_timeout=300,
+)
+def score_batch(run_name: str, texts: list):
+    from .inference import classify_batch
+
+    # Warm containers keep the run in the registry, so only the first batch loads it
+    return classify_batch(texts, run_name)
+
+@app.local_entrypoint()
+def main(
+    run_name: str,
+    input: str,
+    output: str,
+    batch_size: int = 64,
+    text_column: int = 1,
+    concurrency: int = 4,
+):
+    from .batch_scoring import score_corpus
+
+    # Remote calls spend their time waiting, so threads are enough to keep several containers busy
+    with ThreadPoolExecutor(concurrency) as executor:
+        state = score_corpus(
+            input,
+            output,
+            lambda texts: score_batch.remote(run_name, texts),
+            batch_size=batch_size,
+            text_column=text_column,
+            executor=executor,
+            max_in_flight=2 * concurrency,
+        )
+
+    print(f"Predictions for {state['rows']} rows written to {output}")
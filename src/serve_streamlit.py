@@ -26,14 +26,25 @@ from modal import Secret, Volume
 # Define volume configuration
 runs_volume = Volume.from_name("training-runs-vol", create_if_missing=True)
 pretrained_volume = Volume.from_name("pretrained-models-vol", create_if_missing=True)
+# Holds only the prediction cache, which serving containers commit and reload on a cadence
+PREDICTION_CACHE_VOLUME = "prediction-cache-vol"
+PREDICTION_CACHE_DIR = "/prediction-cache"
+prediction_cache_volume = Volume.from_name(PREDICTION_CACHE_VOLUME, create_if_missing=True)
 
 streamlit_script_local_path = Path(__file__).parent / "app.py"
 streamlit_script_remote_path = "/root/app.py"
+serving_modules_local_dir = Path(__file__).parent
 
 image = (
     modal.Image.debian_slim(python_version="3.12.6")
-    .run_commands("python -m pip install numpy pandas peft streamlit torch 'transformers>=4.45.1' vllm")
+    .run_commands("python -m pip install numpy pandas peft streamlit torch 'transformers>=4.45.1' vllm fastapi")
     .add_local_file(streamlit_script_local_path, streamlit_script_remote_path, copy=True)
+    # Modules imported by app.py are placed next to it
+    .add_local_file(serving_modules_local_dir / "inference.py", "/root/inference.py", copy=True)
+    .add_local_file(serving_modules_local_dir / "scheduler.py", "/root/scheduler.py", copy=True)
+    .add_local_file(serving_modules_local_dir / "prediction_cache.py", "/root/prediction_cache.py", copy=True)
+    .add_local_file(serving_modules_local_dir / "quantize.py", "/root/quantize.py", copy=True)
+    .add_local_file(serving_modules_local_dir / "warmup.py", "/root/warmup.py", copy=True)
     .entrypoint([])
 )
 
@@ -42,7 +53,11 @@ def get_secrets():
     return [
         Secret.from_name("my-huggingface-secret"),
         Secret.from_dict({
-            "ALLOW_WANDB": os.environ.get("ALLOW_WANDB", "false")
+            "ALLOW_WANDB": os.environ.get("ALLOW_WANDB", "false"),
+            # Comma-separated runs each container loads at startup
+            "PRELOAD_RUNS": os.environ.get("PRELOAD_RUNS", ""),
+            "PREDICTION_CACHE_DIR": PREDICTION_CACHE_DIR,
+            "PREDICTION_CACHE_VOLUME": PREDICTION_CACHE_VOLUME,
         }),
     ]
 
@@ -60,15 +75,99 @@ if not streamlit_script_local_path.exists():
     allow_concurrent_inputs=100,
     volumes={
         "/runs": runs_volume,
-        "/pretrained": pretrained_volume
+        "/pretrained": pretrained_volume,
+        PREDICTION_CACHE_DIR: prediction_cache_volume,
     }
 )
 @modal.web_server(8000)
 def run():
     target = shlex.quote(streamlit_script_remote_path)
-    cmd = f"streamlit run {target} --server.port 8000 --server.enableCORS=false --server.enableXsrfProtection=false"
+    # warmup.py starts loading PRELOAD_RUNS before handing over to `streamlit run` in the same process
+    cmd = f"python /root/warmup.py {target} --server.port 8000 --server.enableCORS=false --server.enableXsrfProtection=false"
     subprocess.Popen(cmd, shell=True)
 
+# ## JSON API
+#
+# Services can classify texts without the UI. Requests are queued and scored in
+# micro-batches; `GET /stats` reports queue depth, the batch size distribution
+# and prediction cache hits. `GET /health` reports the progress of preloading
+# PRELOAD_RUNS and memory use, and `GET /ready` returns 503 until it is done.
+#
+# ```shell
+# curl -X POST $URL/classify -H 'Content-Type: application/json' \
+#     -d '{"run_name": "axo-...", "texts": ["ma7leh el film"]}'
+# ```
+
+@app.function(
+    keep_warm=1,
+    container_idle_timeout=600,
+    allow_concurrent_inputs=100,
+    volumes={
+        "/runs": runs_volume,
+        "/pretrained": pretrained_volume,
+        PREDICTION_CACHE_DIR: prediction_cache_volume,
+    }
+)
+@modal.asgi_app()
+def api():
+    from scheduler import create_api
+
+    return create_api()
+
+# ## Serving artifacts
+#
+# A run can be exported once into `/runs/<run>/serving/`, which the app and the
+# API then load instead of the fp16 base model plus adapter: an int8 CPU model
+# (`--export-format int8`) or a merged, resized fp16 safetensors snapshot that
+# is memory-mapped on load (`--export-format fp16`). The export scores
+# validation rows against the float32 model and prints the accuracy delta; it
+# is also stored in `serving/manifest.json`. It runs in this image so a pickled
+# int8 model matches the serving torch/transformers versions.
+#
+# ```shell
+# modal run src/serve_streamlit.py::export_serving --run-name axo-... --export-format fp16
+# ```
+
+@app.function(
+    cpu=8.0,
+    memory=65536,
+    timeout=2 * 60 * 60,
+    volumes={
+        "/runs": runs_volume,
+        "/pretrained": pretrained_volume
+    }
+)
+def export_serving(run_name: str, eval_rows: int = 500, export_format: str = "int8"):
+    from quantize import export_serving_model
+
+    runs_volume.reload()
+    manifest = export_serving_model(run_name, eval_rows, export_format)
+    runs_volume.commit()
+    return manifest["accuracy"]
+
+# Exporting also fits the softmax temperature of the run's label probabilities.
+# To calibrate a run that is served as base plus adapter without exporting:
+#
+# ```shell
+# modal run src/serve_streamlit.py::calibrate_labels --run-name axo-...
+# ```
+
+@app.function(
+    cpu=8.0,
+    memory=65536,
+    timeout=2 * 60 * 60,
+    volumes={
+        "/runs": runs_volume,
+        "/pretrained": pretrained_volume
+    }
+)
+def calibrate_labels(run_name: str, eval_rows: int = 500):
+    from quantize import calibrate_run
+
+    runs_volume.reload()
+    calibration = calibrate_run(run_name, eval_rows)
+    runs_volume.commit()
+    return calibration
 
 # ## Iterate and Deploy
 
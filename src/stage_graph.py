@@ -0,0 +1,94 @@
+# stage_graph.py
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+class Stage(NamedTuple):
+    """A step of the launch pipeline; `fn` is called with the results of `deps`, in order."""
+    name: str
+    fn: Callable[..., Any]
+    deps: Sequence[str] = ()
+
+def run_stages(
+    stages: List[Stage],
+    executor: Optional[Executor] = None,
+    timings: Optional[Dict[str, Dict]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Dict]]:
+    """
+    Run stages as soon as their dependencies finish, independent ones concurrently.
+
+    Stages run on `executor` (a thread pool by default, which suits stages that
+    mostly wait on remote calls). If a stage fails, no further stages are
+    started, running ones are waited for, and the first error is raised.
+    Pass a `timings` dict to keep the timings of a failed run as well.
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Dict]]: Result and timing of every stage that ran
+    """
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("Stage names must be unique")
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {missing}")
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=len(stages) or 1)
+
+    started = time.perf_counter()
+    results: Dict[str, Any] = {}
+    timings = {} if timings is None else timings
+    pending = {stage.name for stage in stages}
+    running = {}
+    error = None
+
+    def timed(stage: Stage, args):
+        begin = time.perf_counter()
+        try:
+            return stage.fn(*args)
+        finally:
+            timings[stage.name] = {
+                "start": round(begin - started, 3),
+                "seconds": round(time.perf_counter() - begin, 3),
+                "deps": list(stage.deps),
+            }
+
+    try:
+        while pending or running:
+            if error is None:
+                for name in sorted(pending):
+                    stage = by_name[name]
+                    if all(dep in results for dep in stage.deps):
+                        pending.discard(name)
+                        args = [results[dep] for dep in stage.deps]
+                        running[executor.submit(timed, stage, args)] = name
+            if not running:
+                if error is None and pending:
+                    raise ValueError(f"Stages have a dependency cycle: {sorted(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                    timings[name]["status"] = "ok"
+                except Exception as e:
+                    timings[name]["status"] = f"failed: {e}"
+                    error = error or e
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+
+    if error is not None:
+        raise error
+    return results, timings
+
+def write_stage_timings(path: str, timings: Dict[str, Dict]) -> None:
+    """Save stage timings as JSON, ordered by start time."""
+    ordered = dict(sorted(timings.items(), key=lambda item: item[1]["start"]))
+    with open(path, "w") as f:
+        json.dump(ordered, f, indent=2)
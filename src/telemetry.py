@@ -0,0 +1,209 @@
+# telemetry.py
+import argparse
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+METRICS_FILE = "metrics.jsonl"
+# Written only by the launch function, which keeps running while other containers own the run folder
+LAUNCH_METRICS_FILE = "launch_metrics.jsonl"
+# How often a measured block samples the resident set size of the process
+RSS_SAMPLE_SECONDS = 0.05
+
+def bytes_written() -> int:
+    """
+    Bytes this process and its finished subprocesses have written to storage so far.
+
+    /proc/self/io already includes reaped children, which covers commands run
+    through subprocess; elsewhere the output block counts are used.
+    """
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 512 * sum(resource.getrusage(who).ru_oublock for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+def _statm_rss_bytes(pid: str) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def current_rss_bytes() -> int:
+    """
+    Resident set size of this process right now.
+
+    Read from /proc/self/statm; elsewhere the lifetime peak is the best
+    available figure.
+    """
+    try:
+        return _statm_rss_bytes("self")
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux
+        return 1024 * resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def process_tree_rss_bytes(pid: int) -> int:
+    """Summed resident set size of a process and all its descendants, or 0 where /proc is unavailable."""
+    children: Dict[str, List[str]] = defaultdict(list)
+    try:
+        entries = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name in parentheses may contain spaces; the parent pid follows the state
+                children[f.read().rsplit(")", 1)[1].split()[1]].append(entry)
+        except (OSError, IndexError):
+            continue
+
+    total = 0
+    pending = [str(pid)]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, ()))
+        try:
+            total += _statm_rss_bytes(pid)
+        except OSError:
+            # The process exited while the tree was walked
+            continue
+    return total
+
+def call_with_peak_rss(args: List[str], **kwargs) -> Tuple[int, int]:
+    """
+    Run a command like subprocess.call and also return the peak RSS of its process tree.
+
+    The RSS of the command and its descendants is summed every
+    RSS_SAMPLE_SECONDS, so it covers only this command, unlike ru_maxrss,
+    which Linux carries over from the launching process. Pages shared between
+    the processes are counted once per process.
+
+    Returns:
+        Tuple[int, int]: Exit code and peak resident set size in bytes
+    """
+    process = subprocess.Popen(args, **kwargs)
+    peak = 0
+    try:
+        while True:
+            peak = max(peak, process_tree_rss_bytes(process.pid))
+            try:
+                return process.wait(timeout=RSS_SAMPLE_SECONDS), peak
+            except subprocess.TimeoutExpired:
+                continue
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+
+def record_metric(run_folder: str, stage: str, step: str, metrics_file: str = METRICS_FILE, **fields) -> None:
+    """Append one metric line to the run's metrics.jsonl, or to another `metrics_file` in the run folder."""
+    os.makedirs(run_folder, exist_ok=True)
+    with open(os.path.join(run_folder, metrics_file), "a") as f:
+        f.write(json.dumps({"time": round(time.time(), 3), "stage": stage, "step": step, **fields}) + "\n")
+
+@contextmanager
+def measure(run_folder: str, stage: str, step: str, metrics_file: str = METRICS_FILE):
+    """
+    Record wall time, peak RSS and bytes written of a block as a metric line.
+
+    The peak is the largest RSS of this process sampled every
+    RSS_SAMPLE_SECONDS while the block runs, so it belongs to this block
+    rather than to whatever ran before it; spikes shorter than the interval
+    can be missed. Extra fields can be added to the dict the block receives,
+    such as `child_peak_rss_bytes` from `call_with_peak_rss`. The line is
+    written even if the block raises, with `ok` set to false.
+    """
+    fields = {}
+    started = time.perf_counter()
+    written = bytes_written()
+    peak = [current_rss_bytes()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            peak[0] = max(peak[0], current_rss_bytes())
+
+    sampler = threading.Thread(target=sample, name=f"rss-{stage}-{step}", daemon=True)
+    sampler.start()
+    ok = False
+    try:
+        yield fields
+        ok = True
+    finally:
+        done.set()
+        sampler.join()
+        record_metric(
+            run_folder,
+            stage,
+            step,
+            metrics_file,
+            seconds=round(time.perf_counter() - started, 3),
+            peak_rss_bytes=max(peak[0], current_rss_bytes()),
+            bytes_written=bytes_written() - written,
+            ok=ok,
+            **fields,
+        )
+
+def load_metrics(run_folder: str) -> List[Dict]:
+    """Metric lines of a run, from both the stage containers and the launch function."""
+    metrics = []
+    for name in (METRICS_FILE, LAUNCH_METRICS_FILE):
+        path = os.path.join(run_folder, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                metrics.extend(json.loads(line) for line in f if line.strip())
+    return metrics
+
+def summarize(metrics: List[Dict]) -> Dict[str, Dict]:
+    """
+    Total seconds and bytes written, and the largest peak RSS, per stage/step.
+
+    A step's peak RSS is the larger of its own process's and its subprocess's.
+    """
+    summary: Dict[str, Dict] = defaultdict(lambda: {"seconds": 0.0, "bytes_written": 0, "peak_rss_bytes": 0})
+    for metric in metrics:
+        totals = summary[f"{metric['stage']}/{metric['step']}"]
+        totals["seconds"] += metric.get("seconds", 0.0)
+        totals["bytes_written"] += metric.get("bytes_written", 0)
+        totals["peak_rss_bytes"] = max(
+            totals["peak_rss_bytes"], metric.get("peak_rss_bytes", 0), metric.get("child_peak_rss_bytes", 0),
+        )
+    return dict(summary)
+
+def compare_runs(run_folders: List[str]) -> None:
+    """Print one row per stage/step with the time, bytes written and peak RSS of each run."""
+    summaries = {os.path.basename(os.path.normpath(folder)): summarize(load_metrics(folder)) for folder in run_folders}
+    steps = sorted({step for summary in summaries.values() for step in summary})
+    if not steps:
+        print("No metrics found.")
+        return
+
+    width = max(len(step) for step in steps)
+    print(f"{'stage/step':<{width}}  " + "  ".join(f"{run:>30}" for run in summaries))
+    for step in steps:
+        cells = []
+        for summary in summaries.values():
+            totals = summary.get(step)
+            cell = (
+                f"{totals['seconds']:.1f}s {totals['bytes_written'] / 1e9:.2f}GB {totals['peak_rss_bytes'] / 1e9:.2f}GB"
+                if totals else "-"
+            )
+            cells.append(f"{cell:>30}")
+        print(f"{step:<{width}}  " + "  ".join(cells))
+    print("Columns per run: wall time, bytes written, peak RSS.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the telemetry of training runs.")
+    parser.add_argument(
+        "run_folders", nargs="+",
+        help="Run folders with a metrics.jsonl, e.g. fetched with `modal volume get training-runs-vol <run>`",
+    )
+    args = parser.parse_args()
+    compare_runs(args.run_folders)
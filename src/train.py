@@ -13,9 +13,19 @@ from .train_setup import (
     GPU_CONFIG,
     SINGLE_GPU_CONFIG,
     run_cmd,
+    log_call_link,
+    pretrained_marker_path,
+    TOKENIZER_PATTERNS,
 )
+from .blob_store import BLOBS_DIR, BlobStore, upload_file
+from .preproc_cache import PREPROC_CACHE_DIR, PreprocCache, preprocessing_key
+from .stage_graph import Stage, run_stages, write_stage_timings
+from .telemetry import LAUNCH_METRICS_FILE, measure, record_metric
+from .volume_sync import VolumeSync
 
 VOLUME_CONFIG = volume_manager.get_volume_config()
+BLOB_STORE_ROOT = f"/runs/{BLOBS_DIR}"
+PREPROC_CACHE_ROOT = f"/runs/{PREPROC_CACHE_DIR}"
 
 @app.function(
     image=training_image,
@@ -23,20 +33,19 @@ VOLUME_CONFIG = volume_manager.get_volume_config()
     volumes=VOLUME_CONFIG,
     timeout=24 * HOURS,
 )
-def train(run_folder: str, output_dir: str):
+def train(run_folder: str, output_dir: str, generation: int = None):
     import torch
     print(f"Starting training run in {run_folder}.")
     print(f"Using {torch.cuda.device_count()} {torch.cuda.get_device_name()} GPU(s).")
 
     ALLOW_WANDB = os.environ.get("ALLOW_WANDB", "false").lower() == "true"
     cmd = f"accelerate launch -m axolotl.cli.train ./config.yml {'--wandb_mode disabled' if not ALLOW_WANDB else ''}"
-    run_cmd(cmd, run_folder, VOLUME_CONFIG)
+    generation = run_cmd(cmd, run_folder, VOLUME_CONFIG, stage="train", generation=generation)
 
     # Kick off CPU job to merge the LoRA weights into base model
-    merge_handle = merge.spawn(run_folder, output_dir)
-    with open(f"{run_folder}/logs.txt", "a") as f:
-        f.write(f"<br>merge: https://modal.com/logs/call/{merge_handle.object_id}\n")
-        print(f"Beginning merge {merge_handle.object_id}.")
+    merge_fn = merge if os.environ.get("MERGE_BACKEND", "native") == "axolotl" else merge_cpu
+    merge_handle = merge_fn.spawn(run_folder, output_dir, generation)
+    print(f"Beginning merge {merge_handle.object_id}.")
     return merge_handle
 
 @app.function(
@@ -45,21 +54,36 @@ def train(run_folder: str, output_dir: str):
     volumes=VOLUME_CONFIG,
     timeout=24 * HOURS,
 )
-def preproc_data(run_folder: str):
+def preproc_data(run_folder: str, preproc_key: str = None, generation: int = None) -> int:
+    import yaml
+
     print("Preprocessing data.")
-    run_cmd(
+    generation = run_cmd(
         "python -W ignore:::torch.nn.modules.module -m axolotl.cli.preprocess ./config.yml",
         run_folder,
-        VOLUME_CONFIG
+        VOLUME_CONFIG,
+        stage="preproc",
+        generation=generation,
+        pretrained_part="tokenizer",
     )
 
+    # Share the prepared dataset with later runs on the same data and settings
+    if preproc_key:
+        with open(f"{run_folder}/config.yml") as f:
+            prepared_path = yaml.safe_load(f)["dataset_prepared_path"]
+        with measure(run_folder, "preproc", "cache_store"):
+            PreprocCache(PREPROC_CACHE_ROOT).store(preproc_key, f"{run_folder}/{prepared_path}")
+        with measure(run_folder, "preproc", "volume_commit"):
+            VOLUME_CONFIG["/runs"].commit()
+    return generation
+
 @app.function(
     image=training_image,
     gpu=SINGLE_GPU_CONFIG,
     volumes=VOLUME_CONFIG,
     timeout=24 * HOURS,
 )
-def merge(run_folder: str, output_dir: str):
+def merge(run_folder: str, output_dir: str, generation: int = None):
     import shutil
 
     output_path = Path(run_folder) / output_dir
@@ -69,34 +93,67 @@ def merge(run_folder: str, output_dir: str):
         print(f"Merge from {output_path}")
 
     MERGE_CMD = f"accelerate launch -m axolotl.cli.merge_lora ./config.yml --lora_model_dir='{output_dir}'"
-    run_cmd(MERGE_CMD, run_folder, VOLUME_CONFIG)
+    run_cmd(MERGE_CMD, run_folder, VOLUME_CONFIG, stage="merge", generation=generation)
 
-    VOLUME_CONFIG["/runs"].commit()
+@app.function(
+    image=training_image,
+    cpu=8.0,
+    memory=32768,
+    volumes=VOLUME_CONFIG,
+    timeout=4 * HOURS,
+)
+def merge_cpu(run_folder: str, output_dir: str, generation: int = None):
+    import shutil
+    import yaml
+    from huggingface_hub import snapshot_download
+
+    from .lora_merge import merge_lora
+
+    runs_sync = VolumeSync(VOLUME_CONFIG["/runs"])
+    with measure(run_folder, "merge", "volume_reload"):
+        runs_sync.reload(run_folder, generation)
+        with open(f"{run_folder}/config.yml") as f:
+            base_model = yaml.safe_load(f)["base_model"]
+        VolumeSync(VOLUME_CONFIG["/pretrained"]).reload(required=[pretrained_marker_path(base_model)])
+    log_call_link(run_folder, "merge")
+
+    output_path = Path(run_folder) / output_dir
+    shutil.rmtree(output_path / "merged", ignore_errors=True)
+    print(f"Merge from {output_path} on CPU, one shard at a time")
+
+    # Same output folder as axolotl.cli.merge_lora
+    with measure(run_folder, "merge", "streaming_merge") as fields:
+        base_dir = snapshot_download(base_model, local_files_only=True)
+        fields.update(merge_lora(base_dir, str(output_path), str(output_path / "merged")))
+
+    with measure(run_folder, "merge", "volume_commit"):
+        runs_sync.commit(run_folder)
 
 @app.function(
     image=training_image,
     timeout=30 * MINUTES,
     volumes=VOLUME_CONFIG
 )
-def launch(config_raw: dict, data_raw: str, run_to_resume: str, preproc_only: bool):
+def launch(config_raw: str, data_digest: str, run_to_resume: str, preproc_only: bool):
     import yaml
     from huggingface_hub import snapshot_download
 
-    # Ensure the base model is downloaded
     config = yaml.safe_load(config_raw)
     model_name = config["base_model"]
 
-    try:
-        snapshot_download(model_name, local_files_only=True)
-        print(f"Volume contains {model_name}.")
-    except FileNotFoundError:
-        print(f"Downloading {model_name} ...")
-        snapshot_download(model_name)
+    store = BlobStore(BLOB_STORE_ROOT)
+    # A warm container may predate the upload; a fresh one already sees the blob
+    runs_sync = VolumeSync(VOLUME_CONFIG["/runs"])
+    runs_sync.reload(required=[store.manifest_path(data_digest)])
+    data_manifest = store.manifest(data_digest)
 
-        print("Committing /pretrained directory...")
-        VOLUME_CONFIG["/pretrained"].commit()
+    # Point the config at Parquet datasets so axolotl reads them as parquet
+    if data_manifest["suffix"] == ".parquet":
+        dataset = config["datasets"][0]
+        dataset["path"] = f"{os.path.splitext(dataset['path'])[0]}.parquet"
+        dataset["ds_type"] = "parquet"
+        config_raw = yaml.safe_dump(config, sort_keys=False, allow_unicode=True)
 
-    # Write config and data into a training subfolder
     time_string = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
     run_name = (
         f"axo-{time_string}-{secrets_lib.token_hex(2)}"
@@ -104,40 +161,144 @@ def launch(config_raw: dict, data_raw: str, run_to_resume: str, preproc_only: bo
         else run_to_resume
     )
     run_folder = f"/runs/{run_name}"
-    os.makedirs(run_folder, exist_ok=True)
-
-    print(f"Preparing training run in {run_folder}.")
-    with (
-        open(f"{run_folder}/config.yml", "w") as config_file,
-        open(f"{run_folder}/{config['datasets'][0]['path']}", "w") as data_file,
-    ):
-        config_file.write(config_raw)
-        data_file.write(data_raw)
-    VOLUME_CONFIG["/runs"].commit()
 
-    if preproc_only:
-        print("Spawning container for data preprocessing.")
-        launch_handle = preproc_data.spawn(run_folder)
-    else:
+    def download(part: str, allow_patterns=None):
+        # Ensure the base model is downloaded; the marker is only written once every file is there
+        marker = pretrained_marker_path(model_name, part)
+        VolumeSync(VOLUME_CONFIG["/pretrained"]).reload(required=[marker])
+        if os.path.exists(marker):
+            print(f"Volume contains the {part} files of {model_name}.")
+            return
+        print(f"Downloading the {part} files of {model_name} ...")
+        with measure(run_folder, "launch", f"download_{part}", LAUNCH_METRICS_FILE):
+            snapshot_download(model_name, allow_patterns=allow_patterns)
+        Path(marker).touch()
+
+        print("Committing /pretrained directory...")
+        with measure(run_folder, "launch", f"pretrained_commit_{part}", LAUNCH_METRICS_FILE):
+            VOLUME_CONFIG["/pretrained"].commit()
+
+    def download_tokenizer():
+        download("tokenizer", TOKENIZER_PATTERNS)
+
+    def download_model(_tokenizer):
+        download("model")
+
+    def stage_data():
+        # Write config and data into a training subfolder
+        os.makedirs(run_folder, exist_ok=True)
+        print(f"Preparing training run in {run_folder}.")
+        with open(f"{run_folder}/config.yml", "w") as config_file:
+            config_file.write(config_raw)
+        # The run folder only references the shared dataset blob
+        how = store.link(data_digest, f"{run_folder}/{config['datasets'][0]['path']}")
+        print(f"Dataset blob {data_digest[:12]} linked into the run folder ({how}).")
+
+        # Reuse the prepared dataset of an earlier run with the same data and preprocessing settings
+        preproc_key = None
+        preproc_cached = False
+        if config.get("dataset_prepared_path"):
+            preproc_key = preprocessing_key(config, data_digest)
+            prepared_path = f"{run_folder}/{config['dataset_prepared_path']}"
+            preproc_cached = PreprocCache(PREPROC_CACHE_ROOT).restore(preproc_key, prepared_path)
+            if preproc_cached:
+                print(f"Reusing preprocessed dataset {preproc_key} from the cache.")
+        generation = runs_sync.commit(run_folder)[run_folder]
+        return preproc_key, preproc_cached, generation
+
+    def preprocess(_tokenizer, staged):
+        # Preprocessing only needs the tokenizer, committed to /pretrained before the weights
+        preproc_key, preproc_cached, generation = staged
+        if preproc_cached:
+            return None if preproc_only else generation
         print("Spawning container for data preprocessing.")
-        preproc_handle = preproc_data.spawn(run_folder)
-        with open(f"{run_folder}/logs.txt", "w") as f:
-            lbl = "preproc"
-            f.write(f"{lbl}: https://modal.com/logs/call/{preproc_handle.object_id}")
+        preproc_handle = preproc_data.spawn(run_folder, preproc_key, generation)
+        if preproc_only:
+            return preproc_handle
         # wait for preprocessing to finish
-        preproc_handle.get()
+        return preproc_handle.get()
 
+    def start_training(_model, generation):
         # Start training run
         print("Spawning container for training.")
-        launch_handle = train.spawn(run_folder, config["output_dir"])
+        return train.spawn(run_folder, config["output_dir"], generation)
 
-    with open(f"{run_folder}/logs.txt", "w") as f:
-        lbl = "train" if not preproc_only else "preproc"
-        f.write(f"{lbl}: https://modal.com/logs/call/{launch_handle.object_id}")
-    VOLUME_CONFIG["/runs"].commit()
+    # Downloading the weights overlaps with staging the data and preprocessing it.
+    # Preprocessing waits for the much smaller tokenizer download, so it never reads a partial snapshot.
+    stages = [
+        Stage("download_tokenizer", download_tokenizer),
+        Stage("download_model", download_model, ["download_tokenizer"]),
+        Stage("stage_data", stage_data),
+        Stage("preprocess", preprocess, ["download_tokenizer", "stage_data"]),
+    ]
+    if not preproc_only:
+        stages.append(Stage("train", start_training, ["download_model", "preprocess"]))
+
+    # Once stage_data has committed, the preproc and train containers own the run folder: they
+    # reload it, append to metrics.jsonl and logs.txt, and commit it with the next generation.
+    # Launch only writes files those containers never touch, and commits without the
+    # folder's manifest, so its commit cannot overwrite their lines or their generation.
+    timings = {}
+    try:
+        results, _ = run_stages(stages, timings=timings)
+    finally:
+        if os.path.isdir(run_folder):
+            write_stage_timings(f"{run_folder}/stage_timings.json", timings)
+            for name, timing in timings.items():
+                record_metric(
+                    run_folder, "launch", name, LAUNCH_METRICS_FILE,
+                    seconds=timing["seconds"], ok=timing.get("status") == "ok",
+                )
+            VOLUME_CONFIG["/runs"].commit()
+    print("Stage timings: " + ", ".join(f"{name} {timing['seconds']:.1f}s" for name, timing in timings.items()))
+
+    launch_handle = results["preprocess"] if preproc_only else results["train"]
+    if launch_handle is not None:
+        print(f"{'preproc' if preproc_only else 'train'}: https://modal.com/logs/call/{launch_handle.object_id}")
 
     return run_name, launch_handle
 
+@app.function(
+    image=training_image,
+    timeout=30 * MINUTES,
+    volumes=VOLUME_CONFIG
+)
+def blob_has(digest: str) -> bool:
+    VOLUME_CONFIG["/runs"].reload()
+    return BlobStore(BLOB_STORE_ROOT).has(digest)
+
+@app.function(
+    image=training_image,
+    timeout=30 * MINUTES,
+    volumes=VOLUME_CONFIG
+)
+def blob_put_chunk(digest: str, index: int, data: bytes):
+    BlobStore(BLOB_STORE_ROOT).put_chunk(digest, index, data)
+    VOLUME_CONFIG["/runs"].commit()
+
+@app.function(
+    image=training_image,
+    timeout=30 * MINUTES,
+    volumes=VOLUME_CONFIG
+)
+def blob_seal(digest: str, chunks: int, suffix: str):
+    VOLUME_CONFIG["/runs"].reload()
+    manifest = BlobStore(BLOB_STORE_ROOT).seal(digest, chunks, suffix)
+    VOLUME_CONFIG["/runs"].commit()
+    return manifest
+
+class RemoteBlobStore:
+    """Client for the blob store on the /runs volume, forwarding each call to a Modal function."""
+
+    def has(self, digest: str) -> bool:
+        return blob_has.remote(digest)
+
+    def put_chunk(self, digest: str, index: int, data: bytes):
+        blob_put_chunk.remote(digest, index, data)
+
+    def seal(self, digest: str, chunks: int, suffix: str):
+        return blob_seal.remote(digest, chunks, suffix)
+
 @app.local_entrypoint()
 def main(
     config: str,
@@ -146,21 +307,23 @@ def main(
     preproc_only: bool = False,
     run_to_resume: str = None,
 ):
-    # Read config and data source files with UTF-8 encoding
-    with (
-        open(config, "r", encoding="utf-8") as cfg,
-        open(data, "r", encoding="utf-8") as dat
-    ):
-        run_name, launch_handle = launch.remote(
-            cfg.read(), dat.read(), run_to_resume, preproc_only
-        )
+    # Read config with UTF-8 encoding
+    with open(config, "r", encoding="utf-8") as cfg:
+        config_raw = cfg.read()
+
+    # Upload the dataset only if the volume does not hold it yet
+    data_digest = upload_file(data, RemoteBlobStore())
+
+    run_name, launch_handle = launch.remote(
+        config_raw, data_digest, run_to_resume, preproc_only
+    )
 
     # Write a local reference to the run location
     with open(".last_run_name", "w", encoding="utf-8") as f:
         f.write(run_name)
 
-    # Wait for the training run to finish
-    merge_handle = launch_handle.get()
+    # Wait for the training run to finish; a cached preprocessing-only run has nothing to wait for
+    merge_handle = launch_handle.get() if launch_handle is not None else None
     if merge_lora and not preproc_only:
         merge_handle.get()
 
@@ -168,5 +331,5 @@ def main(
     print(f"To inspect outputs, run `modal volume ls training-runs-vol {run_name}`")
     if not preproc_only:
         print(
-            f"To run sample inference, run `modal run -q src.inference --run-name {run_name}`"
+            f"To score a corpus, run `modal run src.score --run-name {run_name} --input <file> --output <file>`"
         )
\ No newline at end of file
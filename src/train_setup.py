@@ -6,6 +6,9 @@ from typing import Union, Dict
 import modal
 from modal import Image, Secret, Volume
 
+from .telemetry import call_with_peak_rss, measure
+from .volume_sync import VolumeSync
+
 MINUTES = 60
 HOURS = 60 * MINUTES
 
@@ -58,7 +61,8 @@ def get_secrets():
     return [
         Secret.from_name("my-huggingface-secret"),
         Secret.from_dict({
-            "ALLOW_WANDB": os.environ.get("ALLOW_WANDB", "false")
+            "ALLOW_WANDB": os.environ.get("ALLOW_WANDB", "false"),
+            "MERGE_BACKEND": os.environ.get("MERGE_BACKEND", "native"),
         }),
     ]
 
@@ -72,17 +76,75 @@ app = modal.App(
     secrets=secrets,
 )
 
-def run_cmd(cmd: str, run_folder: str, volume_config: dict):
-    """Run a command inside a folder, with Modal Volume reloading before and commit on success."""
-    import subprocess
+# Files preprocessing needs from the base model; the weights are only needed to train and merge
+TOKENIZER_PATTERNS = ["*.json", "*.model", "*.txt"]
+
+def pretrained_marker_path(model_name: str, part: str = "model") -> str:
+    """
+    Marker file in a model's cache folder, written once `part` is fully downloaded.
+
+    `part` is "tokenizer" (the TOKENIZER_PATTERNS files) or "model" (everything).
+    The marker is written after the download and committed with it, so a
+    container that sees it also sees every file, unlike a snapshot folder,
+    which exists as soon as the first file is downloaded.
+    """
+    return f"/pretrained/models--{model_name.replace('/', '--')}/.complete-{part}"
+
+def log_call_link(run_folder: str, label: str) -> None:
+    """
+    Append this container's Modal log link to the run's logs.txt.
+
+    Each stage writes its own link while it owns the run folder, between its
+    reload and its commit, so no other container appends to the file meanwhile.
+    """
+    with open(f"{run_folder}/logs.txt", "a") as f:
+        f.write(f"{label}: https://modal.com/logs/call/{modal.current_function_call_id()}\n")
+
+def run_cmd(
+    cmd: str,
+    run_folder: str,
+    volume_config: dict,
+    stage: str = "cmd",
+    generation: int = None,
+    pretrained_part: str = "model",
+) -> int:
+    """
+    Run a command inside a folder, syncing Modal Volumes before and after it.
+
+    The runs volume is reloaded unless the run folder is already at `generation`,
+    and the pretrained volume unless `pretrained_part` ("tokenizer" or "model")
+    of the run's base model is marked complete; it is an error if it still is
+    not after the reload. After a
+    successful command the runs volume is committed if the run folder changed.
+    Reload, command and commit are each recorded in the run's metrics.jsonl under `stage`,
+    and the container's log link is added to logs.txt.
+
+    Returns:
+        int: Generation of the run folder after the commit
+    """
+    import yaml
+
+    runs_sync = VolumeSync(volume_config["/runs"])
 
     # Ensure volumes contain latest files
-    volume_config["/pretrained"].reload()
-    volume_config["/runs"].reload()
+    with measure(run_folder, stage, "volume_reload") as fields:
+        fields["runs_reloaded"] = runs_sync.reload(run_folder, generation)
+        with open(f"{run_folder}/config.yml") as f:
+            base_model = yaml.safe_load(f)["base_model"]
+        marker = pretrained_marker_path(base_model, pretrained_part)
+        fields["pretrained_reloaded"] = VolumeSync(volume_config["/pretrained"]).reload(required=[marker])
+    if not os.path.exists(marker):
+        raise RuntimeError(f"The {pretrained_part} files of {base_model} are not fully downloaded to /pretrained yet")
+    log_call_link(run_folder, stage)
 
     # Propagate errors from subprocess
-    if exit_code := subprocess.call(cmd.split(), cwd=run_folder):
+    with measure(run_folder, stage, "subprocess") as fields:
+        fields["cmd"] = cmd
+        exit_code, fields["child_peak_rss_bytes"] = call_with_peak_rss(cmd.split(), cwd=run_folder)
+        fields["exit_code"] = exit_code
+    if exit_code:
         exit(exit_code)
 
     # Commit writes to volume
-    volume_config["/runs"].commit()
\ No newline at end of file
+    with measure(run_folder, stage, "volume_commit"):
+        return runs_sync.commit(run_folder)[run_folder]
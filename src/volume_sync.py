@@ -0,0 +1,165 @@
+# volume_sync.py
+import hashlib
+import json
+import os
+import shutil
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_FILE = ".sync_manifest.json"
+# Larger files (checkpoints, weights) are compared by size and mtime only
+HASH_MAX_BYTES = 64 * 1024 * 1024
+
+class Volume(ABC):
+    """The part of a Modal Volume the sync layer uses."""
+
+    @abstractmethod
+    def reload(self) -> None:
+        """Make changes committed elsewhere visible in this container."""
+
+    @abstractmethod
+    def commit(self) -> None:
+        """Publish the changes made in this container."""
+
+class LocalVolume(Volume):
+    """
+    Local stand-in for a Modal Volume: `mount_dir` is this container's view of `remote_dir`.
+
+    commit() mirrors the mount into the remote directory and reload() the other
+    way round, so code written against Modal's reload/commit semantics can be
+    tested on a plain filesystem.
+    """
+
+    def __init__(self, remote_dir: str, mount_dir: str):
+        self.remote_dir = remote_dir
+        self.mount_dir = mount_dir
+        self.reloads = 0
+        self.commits = 0
+        os.makedirs(remote_dir, exist_ok=True)
+        self.reload()
+        self.reloads = 0
+
+    def reload(self) -> None:
+        self.reloads += 1
+        shutil.rmtree(self.mount_dir, ignore_errors=True)
+        shutil.copytree(self.remote_dir, self.mount_dir)
+
+    def commit(self) -> None:
+        self.commits += 1
+        shutil.rmtree(self.remote_dir, ignore_errors=True)
+        shutil.copytree(self.mount_dir, self.remote_dir)
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def scan_folder(folder: str, previous: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+    """
+    Record size, mtime and (for files up to HASH_MAX_BYTES) the hash of every file in a folder.
+
+    Hashes are reused from `previous` for files whose size and mtime are unchanged.
+    """
+    previous = previous or {}
+    files = {}
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            relpath = os.path.relpath(path, folder)
+            if relpath == MANIFEST_FILE or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            known = previous.get(relpath)
+            if known and known["size"] == entry["size"] and known["mtime_ns"] == entry["mtime_ns"]:
+                entry["sha256"] = known.get("sha256")
+            elif stat.st_size <= HASH_MAX_BYTES:
+                entry["sha256"] = file_sha256(path)
+            files[relpath] = entry
+    return files
+
+def changed_files(old: Dict[str, Dict], new: Dict[str, Dict]) -> List[str]:
+    """Files added, removed or modified between two scans; equal hashes mean unchanged despite a new mtime."""
+    changed = []
+    for relpath in sorted(set(old) | set(new)):
+        before, after = old.get(relpath), new.get(relpath)
+        if before is None or after is None:
+            changed.append(relpath)
+        elif after.get("sha256") is not None and after.get("sha256") == before.get("sha256"):
+            continue
+        elif (before["size"], before["mtime_ns"]) != (after["size"], after["mtime_ns"]):
+            changed.append(relpath)
+    return changed
+
+class VolumeSync:
+    """
+    Reload and commit a volume only when the folders being worked on need it.
+
+    Each synced folder keeps a manifest of its files and a generation number
+    that grows with every commit that changed it. A container that is told
+    which generation to expect skips the reload when its mount already has it,
+    and commit() skips the volume commit when no watched folder changed.
+    Modal commits a whole volume at once, so the manifests decide whether to
+    commit, not which files are sent.
+    """
+
+    def __init__(self, volume: Volume):
+        self.volume = volume
+
+    @staticmethod
+    def read_manifest(folder: str) -> Dict:
+        path = os.path.join(folder, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {"generation": 0, "files": {}}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def generation(self, folder: str) -> int:
+        return self.read_manifest(folder)["generation"]
+
+    def reload(self, folder: Optional[str] = None, expected_generation: Optional[int] = None,
+               required: Iterable[str] = ()) -> bool:
+        """
+        Reload unless the mount is known to be current.
+
+        The mount is current when `folder` is at `expected_generation` or later, or,
+        without a folder, when every path in `required` exists. With neither, the
+        volume is always reloaded.
+
+        Returns:
+            bool: Whether the volume was reloaded
+        """
+        required = list(required)
+        if folder is not None and expected_generation is not None:
+            if self.generation(folder) >= expected_generation:
+                return False
+        elif required:
+            if all(os.path.exists(path) for path in required):
+                return False
+        self.volume.reload()
+        return True
+
+    def commit(self, *folders: str) -> Dict[str, int]:
+        """
+        Commit the volume if any of `folders` changed since its last sync.
+
+        Returns:
+            Dict[str, int]: Generation of every folder after the sync
+        """
+        generations = {}
+        changed = False
+        for folder in folders:
+            manifest = self.read_manifest(folder)
+            files = scan_folder(folder, manifest["files"])
+            generation = manifest["generation"]
+            if changed_files(manifest["files"], files) or not os.path.exists(os.path.join(folder, MANIFEST_FILE)):
+                generation += 1
+                changed = True
+                with open(os.path.join(folder, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                    json.dump({"generation": generation, "files": files}, f)
+            generations[folder] = generation
+        if changed:
+            self.volume.commit()
+        return generations
@@ -0,0 +1,120 @@
+# warmup.py
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from inference import classify_batch, registry
+
+WARMUP_TEXT = "ma7leh el film"
+
+def memory_usage() -> Dict:
+    """Current and peak RSS of this process, memory still available on the machine, and resident adapter bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    usage = {"rss_bytes": peak, "peak_rss_bytes": peak, "available_bytes": None, "adapter_bytes": registry.resident_bytes()}
+    try:
+        with open("/proc/self/statm") as f:
+            usage["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    usage["available_bytes"] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return usage
+
+class Preloader:
+    """
+    Load a list of runs in a background thread when the serving process starts.
+
+    Each run is warmed up with one classification, so its weights are paged in
+    and its prefix cache is built before the first real request. Runs come
+    from PRELOAD_RUNS (comma separated) unless given. Requests for a run that
+    is still loading can wait on it with `wait()` and report `status()`.
+    """
+
+    def __init__(self, runs: Optional[List[str]] = None, warmup_fn: Optional[Callable[[str], object]] = None):
+        if runs is None:
+            runs = [run.strip() for run in os.environ.get("PRELOAD_RUNS", "").split(",") if run.strip()]
+        self.runs = runs
+        self.started_at: Optional[float] = None
+        self._warmup_fn = warmup_fn or (lambda run: classify_batch([WARMUP_TEXT], run))
+        self._status: Dict[str, Dict] = {run: {"state": "queued"} for run in runs}
+        self._done = {run: threading.Event() for run in runs}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start preloading; later calls do nothing."""
+        with self._lock:
+            if self._thread is None and self.runs:
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name="model-preloader", daemon=True)
+                self._thread.start()
+
+    def state(self, run: str) -> Optional[str]:
+        """"queued", "loading", "ready" or "failed" for a preloaded run, None for any other run."""
+        with self._lock:
+            return self._status[run]["state"] if run in self._status else None
+
+    def wait(self, run: str, timeout: Optional[float] = None) -> bool:
+        """Wait until a preloaded run is ready or failed; True right away for runs that are not preloaded."""
+        done = self._done.get(run)
+        return True if done is None else done.wait(timeout)
+
+    def ready(self) -> bool:
+        """Whether no run is queued or loading anymore."""
+        with self._lock:
+            return all(status["state"] in ("ready", "failed") for status in self._status.values())
+
+    def status(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            runs = {}
+            for run, status in self._status.items():
+                runs[run] = dict(status)
+                if status["state"] == "loading":
+                    runs[run]["elapsed_seconds"] = round(now - status["started"], 1)
+        return {
+            "ready": self.ready(),
+            "loaded": sum(status["state"] == "ready" for status in runs.values()),
+            "total": len(runs),
+            "uptime_seconds": round(now - self.started_at, 1) if self.started_at else 0.0,
+            "runs": runs,
+            "resident_runs": registry.resident_runs(),
+            "memory": memory_usage(),
+        }
+
+    def _update(self, run: str, **fields) -> None:
+        with self._lock:
+            self._status[run].update(fields)
+
+    def _run(self) -> None:
+        for run in self.runs:
+            self._update(run, state="loading", started=time.time())
+            started = time.perf_counter()
+            try:
+                self._warmup_fn(run)
+            except Exception as e:
+                self._update(run, state="failed", error=str(e), seconds=round(time.perf_counter() - started, 1))
+                print(f"Preloading {run} failed: {e}")
+            else:
+                self._update(run, state="ready", seconds=round(time.perf_counter() - started, 1))
+                print(f"Preloaded {run} in {time.perf_counter() - started:.1f}s.")
+            self._done[run].set()
+
+# Shared by the Streamlit sessions and the API of one process
+preloader = Preloader()
+
+if __name__ == "__main__":
+    # Streamlit only runs the app script once a session connects, so the serving
+    # container starts Streamlit through this module to begin loading right away.
+    # It is imported under its module name so app.py sees the same preloader.
+    from warmup import preloader as shared_preloader
+    from streamlit.web import cli
+
+    shared_preloader.start()
+    sys.argv = ["streamlit", "run", *sys.argv[1:]]
+    sys.exit(cli.main())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The training, serving and dataset scripts import their neighbours by module name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("src", "datasets"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from blob_store import BlobStore, file_digest, iter_compressed_chunks, upload_file
+
+class CountingStore:
+    """Forwards to a BlobStore like the remote client does, counting uploaded chunks."""
+
+    def __init__(self, store):
+        self.store = store
+        self.chunks = 0
+
+    def has(self, digest):
+        return self.store.has(digest)
+
+    def put_chunk(self, digest, index, data):
+        self.chunks += 1
+        self.store.put_chunk(digest, index, data)
+
+    def seal(self, digest, chunks, suffix):
+        return self.store.seal(digest, chunks, suffix)
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "data.jsonl"
+    path.write_text("".join(f'{{"InputText": "ma7leh el film {i}", "SentimentLabel": "1"}}\n' for i in range(2000)))
+    return str(path)
+
+def test_put_has_seal_round_trip(tmp_path, dataset):
+    store = BlobStore(str(tmp_path / ".blobs"))
+    digest = file_digest(dataset)
+    assert not store.has(digest)
+
+    chunks = list(iter_compressed_chunks(dataset, chunk_bytes=4096))
+    for index, data in chunks:
+        store.put_chunk(digest, index, data)
+    # Chunks alone do not make a blob
+    assert not store.has(digest)
+
+    manifest = store.seal(digest, len(chunks), ".jsonl")
+    assert store.has(digest)
+    assert manifest == store.manifest(digest)
+    assert manifest["size"] == os.path.getsize(dataset)
+    assert manifest["compressed_size"] < manifest["size"]
+    assert manifest["chunks"] == len(chunks) > 1
+    assert file_digest(store.data_path(digest)) == digest
+    assert not os.path.exists(os.path.join(store.blob_dir(digest), "chunks"))
+
+def test_seal_rejects_chunks_that_do_not_match_the_digest(tmp_path, dataset):
+    store = BlobStore(str(tmp_path / ".blobs"))
+    digest = "0" * 64
+    for index, data in iter_compressed_chunks(dataset):
+        store.put_chunk(digest, index, data)
+    with pytest.raises(ValueError):
+        store.seal(digest, 1, ".jsonl")
+    assert not store.has(digest)
+    assert not os.path.exists(store.blob_dir(digest))
+
+def test_identical_contents_are_uploaded_once(tmp_path, dataset):
+    store = CountingStore(BlobStore(str(tmp_path / ".blobs")))
+    digest = upload_file(dataset, store, chunk_bytes=4096)
+    uploaded = store.chunks
+    assert uploaded > 1
+
+    copy = tmp_path / "copy.jsonl"
+    copy.write_bytes(open(dataset, "rb").read())
+    assert upload_file(str(copy), store, chunk_bytes=4096) == digest
+    assert store.chunks == uploaded
+    assert os.listdir(str(tmp_path / ".blobs")) == [digest]
+
+def test_run_folders_link_the_blob(tmp_path, dataset):
+    store = BlobStore(str(tmp_path / ".blobs"))
+    digest = upload_file(dataset, store)
+    run_folder = tmp_path / "run"
+    run_folder.mkdir()
+    assert store.link(digest, str(run_folder / "data.jsonl")) in ("symlink", "copy")
+    assert (run_folder / "data.jsonl").read_bytes() == open(dataset, "rb").read()
@@ -0,0 +1,61 @@
+import csv
+import random
+
+from csv_to_jsonl import convert_csv_to_jsonl, convert_csv_to_jsonl_parallel, find_record_boundaries
+
+def write_csv(path, rows, lineterminator="\r\n"):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator=lineterminator)
+        writer.writerow(["id", "InputText", "SentimentLabel"])
+        writer.writerows(rows)
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def convert_both(tmp_path, chunk_bytes):
+    sequential = tmp_path / "sequential.jsonl"
+    parallel = tmp_path / "parallel.jsonl"
+    expected = convert_csv_to_jsonl(str(tmp_path / "in.csv"), str(sequential))
+    count = convert_csv_to_jsonl_parallel(str(tmp_path / "in.csv"), str(parallel), workers=2, chunk_bytes=chunk_bytes)
+    assert count == expected
+    return read(sequential), read(parallel)
+
+def test_line_breaks_inside_quoted_fields_match_across_workers(tmp_path):
+    rows = [(i, f"ligne {i}\r\nba3d\nwa\r{i}", i % 2) for i in range(200)]
+    write_csv(tmp_path / "in.csv", rows)
+    sequential, parallel = convert_both(tmp_path, chunk_bytes=64)
+    assert sequential == parallel
+    assert '"ligne 0\\r\\nba3d\\nwa\\r0"' in sequential
+
+def test_stray_quote_in_unquoted_field_matches_across_workers(tmp_path):
+    random.seed(0)
+    lines = ["id,InputText,SentimentLabel"]
+    for i in range(300):
+        if i in (17, 120):
+            lines.append(f'{i},mech 5"ayeb,1')
+        elif random.random() < 0.3:
+            lines.append(f'{i},"3ajbni\nbarcha ""{i}""",1')
+        else:
+            lines.append(f"{i},behi {i},0")
+    (tmp_path / "in.csv").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    # Misplaced boundaries are expected here and must be corrected during conversion
+    boundaries = find_record_boundaries(str(tmp_path / "in.csv"), len(lines[0]) + 1, 64)
+    assert len(boundaries) > 10
+    sequential, parallel = convert_both(tmp_path, chunk_bytes=64)
+    assert sequential == parallel
+    assert sequential.count("\n") == 300
+
+def test_invalid_labels_are_printed_row_by_row_with_the_skipped_total(tmp_path, capsys):
+    rows = [(i, f"text {i}", 7 if i % 3 == 0 else i % 2) for i in range(60)] + [(60, " ", 1)]
+    write_csv(tmp_path / "in.csv", rows)
+    convert_csv_to_jsonl_parallel(str(tmp_path / "in.csv"), str(tmp_path / "parallel.jsonl"), workers=2, chunk_bytes=64)
+    parallel = capsys.readouterr().out
+    convert_csv_to_jsonl(str(tmp_path / "in.csv"), str(tmp_path / "sequential.jsonl"))
+    sequential = capsys.readouterr().out
+
+    assert sequential.count("Invalid sentiment label value: 7") == 20
+    assert "Row 62: Empty text field" in sequential
+    assert "Skipped 21 rows (20 with an invalid sentiment label)" in sequential
+    assert parallel.splitlines() == sequential.splitlines()[:-1]
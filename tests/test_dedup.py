@@ -0,0 +1,71 @@
+import random
+import sys
+
+from dedup import NearDuplicateIndex, deduplicate, normalize_arabizi
+
+def entries(*rows):
+    return [{"InputText": text, "SentimentLabel": label} for text, label in rows]
+
+def reasons(rows, **kwargs):
+    return [reason for _, reason in deduplicate(entries(*rows), **kwargs)]
+
+def test_emoji_and_punctuation_texts_keep_distinct_keys():
+    assert normalize_arabizi("👎") == "👎"
+    assert reasons([("😂😂😂", "1"), ("👎", "0"), ("!!!", "1"), ("❤️", "1")]) == [None] * 4
+    assert reasons([("😂😂😂", "1"), (" 😂😂😂 ", "1")], near_duplicates=False) == [None, "Exact duplicate of entry 0"]
+
+def test_repeated_letters_are_only_collapsed_on_request():
+    assert normalize_arabizi("Cool") == "cool"
+    assert normalize_arabizi("cool", collapse_repeats=True) == "col"
+    rows = [("behi barcha", "1"), ("behiiii barcha", "1")]
+    assert reasons(rows, near_duplicates=False) == [None, None]
+    assert reasons(rows, near_duplicates=False, collapse_repeats=True) == [None, "Exact duplicate of entry 0"]
+
+def test_same_text_with_another_label_is_kept_and_reported():
+    conflicts = []
+    rows = [("ma7leh el film", "1"), ("MA7LEH el film!", "0"), ("ma7leh el film", "1"), ("ma7leh el film", "0")]
+    assert reasons(rows, conflicts=conflicts) == [
+        None, None, "Exact duplicate of entry 0", "Exact duplicate of entry 1",
+    ]
+    assert conflicts == [(1, 0)]
+
+def test_near_duplicates_are_matched_within_a_label():
+    text = "el film hedha behi barcha w el a7keya mte3ou mrigla"
+    rows = [(text, "1"), (text + " zeda", "1"), (text + " zeda", "0")]
+    assert reasons(rows) == [None, "Near duplicate of entry 0", None]
+
+def test_index_batches_match_one_at_a_time():
+    rng = random.Random(0)
+    words = ["behi", "barcha", "film", "mouch", "5ayeb", "3ajbetni", "el", "ya3tik", "sa7a", "tawa", "9a3da"]
+    base = [" ".join(rng.choices(words, k=12)) for _ in range(200)]
+    # Chains of edits: each variant is close to the previous one, not necessarily to the first
+    texts = []
+    for text in base:
+        texts.append(text)
+        for _ in range(3):
+            text = text + " " + rng.choice(words)
+            texts.append(text)
+    rng.shuffle(texts)
+
+    batched = NearDuplicateIndex()
+    single = NearDuplicateIndex()
+    in_batches = [match for i in range(0, len(texts), 128) for match in batched.add_batch(texts[i:i + 128])]
+    one_by_one = [single.add_batch([text])[0] for text in texts]
+    assert in_batches == one_by_one
+    assert sum(match is not None for match in in_batches) > 0
+    assert batched.size == sum(match is None for match in in_batches)
+
+def test_clean_dataset_runs_without_numpy_and_pyarrow(tmp_path, monkeypatch):
+    # A None entry makes the import fail; the dataset modules are imported afresh
+    for module in ("numpy", "pyarrow"):
+        monkeypatch.setitem(sys.modules, module, None)
+    for module in ("dedup", "columnar", "clean_dataset"):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    from clean_dataset import clean_dataset
+
+    source = tmp_path / "in.jsonl"
+    source.write_text("".join(f'{{"InputText": "{text}", "SentimentLabel": "1"}}\n' for text in ("behi", "behi", "")))
+    clean_dataset(str(source), str(tmp_path / "plain.jsonl"), dedup=False)
+    clean_dataset(str(source), str(tmp_path / "exact.jsonl"), near_duplicates=False)
+    assert len((tmp_path / "plain.jsonl").read_text().splitlines()) == 2
+    assert len((tmp_path / "exact.jsonl").read_text().splitlines()) == 1
@@ -0,0 +1,45 @@
+import json
+import math
+import random
+
+import pytest
+
+import inference
+from inference import apply_temperature, fit_temperature, run_label_settings
+
+def overconfident_scores(count, temperature, seed=0):
+    """Probabilities at temperature 1.0 whose logits are `temperature` times too sharp, with sampled labels."""
+    rng = random.Random(seed)
+    probabilities, targets = [], []
+    for _ in range(count):
+        margin = rng.gauss(0, 2)
+        true_p1 = 1 / (1 + math.exp(-margin))
+        targets.append("1" if rng.random() < true_p1 else "0")
+        p1 = 1 / (1 + math.exp(-margin * temperature))
+        probabilities.append({"0": 1 - p1, "1": p1})
+    return probabilities, targets
+
+def test_fitted_temperature_undoes_overconfidence():
+    probabilities, targets = overconfident_scores(4000, temperature=3.0)
+    temperature, before, after = fit_temperature(probabilities, targets)
+    assert temperature == pytest.approx(3.0, rel=0.1)
+    assert after < before
+    rescaled = apply_temperature(probabilities[:1], temperature)[0]
+    assert sum(rescaled.values()) == pytest.approx(1.0)
+    assert abs(rescaled["1"] - 0.5) < abs(probabilities[0]["1"] - 0.5)
+
+def test_serving_uses_the_calibration_of_the_current_adapter(tmp_path, monkeypatch):
+    monkeypatch.setattr(inference, "RUNS_DIR", str(tmp_path))
+    run = tmp_path / "run"
+    (run / inference.ADAPTER_DIR).mkdir(parents=True)
+    (run / inference.ADAPTER_DIR / "adapter_config.json").write_text(json.dumps({"r": 16}))
+    (run / "config.yml").write_text("sentiment_labels: ['0', '1']\nlabel_temperature: 1.5\ndatasets:\n  - path: data.jsonl\n")
+    assert run_label_settings("run") == (("0", "1"), 1.5)
+
+    fingerprint = inference.adapter_fingerprint(str(run / inference.ADAPTER_DIR))
+    (run / inference.LABEL_CALIBRATION_FILE).write_text(json.dumps({"adapter_fingerprint": fingerprint, "temperature": 2.5}))
+    assert run_label_settings("run") == (("0", "1"), 2.5)
+
+    # A retrained adapter falls back to the config until it is calibrated again
+    (run / inference.ADAPTER_DIR / "adapter_config.json").write_text(json.dumps({"r": 8}))
+    assert run_label_settings("run") == (("0", "1"), 1.5)
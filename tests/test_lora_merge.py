@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("peft")
+pytest.importorskip("transformers")
+
+from lora_merge import base_shards, merge_lora, verify_merge
+
+TARGET_MODULES = ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+
+@pytest.fixture(scope="module")
+def tiny_run(tmp_path_factory):
+    """A random fp16 Mistral saved in several shards and a LoRA adapter with resized, saved embeddings."""
+    from peft import LoraConfig, get_peft_model
+    from transformers import MistralConfig, MistralForCausalLM
+
+    root = tmp_path_factory.mktemp("tiny-mistral")
+    base_dir, adapter_dir = str(root / "base"), str(root / "lora-out")
+    torch.manual_seed(0)
+    model = MistralForCausalLM(MistralConfig(
+        vocab_size=128, hidden_size=64, intermediate_size=224, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=1, max_position_embeddings=256,
+    ))
+    model.to(torch.float16).save_pretrained(base_dir, max_shard_size="100KB")
+
+    model.resize_token_embeddings(130, mean_resizing=False)
+    lora = get_peft_model(model.float(), LoraConfig(
+        r=16, lora_alpha=32, target_modules=TARGET_MODULES, modules_to_save=["embed_tokens", "lm_head"],
+        init_lora_weights=False, task_type="CAUSAL_LM",
+    ))
+    lora.save_pretrained(adapter_dir)
+    return base_dir, adapter_dir, str(root / "merged")
+
+def test_streaming_merge_matches_peft(tiny_run):
+    base_dir, adapter_dir, merged_dir = tiny_run
+    assert len(base_shards(base_dir)) > 1
+
+    summary = merge_lora(base_dir, adapter_dir, merged_dir)
+    assert summary["merged"] == 2 * len(TARGET_MODULES)
+    assert summary["replaced"] == 2
+    assert os.path.exists(os.path.join(merged_dir, "model.safetensors.index.json"))
+
+    matches, largest = verify_merge(base_dir, adapter_dir, merged_dir)
+    assert matches, f"largest difference {largest}"
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+
+import torch
+import transformers
+
+import inference
+from prediction_cache import PredictionCache
+from volume_sync import LocalVolume
+
+class FileVolume(LocalVolume):
+    """Commits upload this container's files one by one, as Modal does, instead of replacing the whole volume."""
+
+    def commit(self):
+        self.commits += 1
+        for folder, _, files in os.walk(self.mount_dir):
+            target = os.path.join(self.remote_dir, os.path.relpath(folder, self.mount_dir))
+            os.makedirs(target, exist_ok=True)
+            for name in files:
+                shutil.copy2(os.path.join(folder, name), os.path.join(target, name))
+
+def write_run(runs_dir, run):
+    adapter = runs_dir / run / inference.ADAPTER_DIR
+    adapter.mkdir(parents=True)
+    (adapter / "adapter_config.json").write_text(json.dumps({"r": 16}))
+    (adapter / "adapter_model.safetensors").write_bytes(b"weights")
+    (runs_dir / run / "config.yml").write_text("sentiment_labels: ['0', '1']\ndatasets:\n  - path: data.jsonl\n")
+    return inference.adapter_fingerprint(str(adapter))
+
+def export(runs_dir, run, adapter_fingerprint, export_format):
+    serving = runs_dir / run / inference.SERVING_DIR
+    serving.mkdir(exist_ok=True)
+    manifest = {
+        "format": export_format, "adapter_fingerprint": adapter_fingerprint,
+        "torch_version": torch.__version__, "transformers_version": transformers.__version__,
+    }
+    (serving / inference.SERVING_MANIFEST_FILE).write_text(json.dumps(manifest))
+
+def cache_for(tmp_path, shard, volume=None):
+    cache = PredictionCache(
+        max_entries=10, persist=True, cache_dir=str(tmp_path / shard), volume=volume, sync_seconds=3600,
+    )
+    cache.shard = shard
+    return cache
+
+def test_serving_artifact_changes_the_cache_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(inference, "RUNS_DIR", str(tmp_path / "runs"))
+    fingerprint = write_run(tmp_path / "runs", "run")
+    cache = cache_for(tmp_path, "a")
+    cache.put_many("run", ["behi"], [("1", {"0": 0.1, "1": 0.9})])
+    assert cache.get("run", "behi") == ("1", {"0": 0.1, "1": 0.9})
+
+    export(tmp_path / "runs", "run", fingerprint, inference.INT8_FORMAT)
+    # The fingerprint is memoized until the next sync
+    assert cache.get("run", "behi") is not None
+    cache.sync()
+    assert cache.get("run", "behi") is None
+    cache.put_many("run", ["behi"], [("1", {"0": 0.2, "1": 0.8})])
+
+    export(tmp_path / "runs", "run", fingerprint, inference.SNAPSHOT_FORMAT)
+    cache.sync()
+    assert cache.get("run", "behi") is None
+    cache.sync()
+    cache._memory.clear()
+    # The int8 rows were purged from the shard when the fp16 artifact was first seen
+    assert cache.get("run", "behi") is None
+    assert cache.stats()["misses"] == 3
+
+def test_containers_share_hits_through_the_volume(tmp_path, monkeypatch):
+    monkeypatch.setattr(inference, "RUNS_DIR", str(tmp_path / "runs"))
+    write_run(tmp_path / "runs", "run")
+    remote = str(tmp_path / "remote")
+    first = cache_for(tmp_path, "first", FileVolume(remote, str(tmp_path / "first")))
+    second = cache_for(tmp_path, "second", FileVolume(remote, str(tmp_path / "second")))
+
+    first.put_many("run", ["behi", "mouch behi"], [("1", {"1": 0.9}), ("0", {"0": 0.8})])
+    assert second.get("run", "behi") is None
+    first.sync()
+    second.sync()
+    assert second.get("run", "behi") == ("1", {"1": 0.9})
+    assert second.stats()["shared_hits"] == 1
+
+    # Both shards survive each other's commits
+    second.put_many("run", ["3ajbni"], [("1", {"1": 0.7})])
+    second.close()
+    first.sync()
+    assert first.get("run", "3ajbni") == ("1", {"1": 0.7})
+    assert sorted(name for name in (tmp_path / "remote" / "run").iterdir()) == [
+        tmp_path / "remote" / "run" / "first.sqlite", tmp_path / "remote" / "run" / "second.sqlite",
+    ]
+    first.close()
@@ -0,0 +1,53 @@
+import os
+import time
+
+from preproc_cache import PreprocCache, preprocessing_key
+
+CONFIG = {
+    "base_model": "mistralai/Mistral-7B-v0.1",
+    "sequence_len": 512,
+    "sample_packing": True,
+    "datasets": [{"path": "data.jsonl", "type": {"format": "[INST] {instruction} [/INST]"}}],
+    "learning_rate": 0.0004,
+}
+
+def prepared_folder(path, contents):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "data.arrow"), "w") as f:
+        f.write(contents)
+    return str(path)
+
+def test_preprocessing_key_depends_on_data_and_relevant_config():
+    key = preprocessing_key(CONFIG, "a" * 64)
+    assert preprocessing_key(dict(CONFIG), "a" * 64) == key
+    assert preprocessing_key(CONFIG, "b" * 64) != key
+    assert preprocessing_key({**CONFIG, "sequence_len": 1024}, "a" * 64) != key
+    assert preprocessing_key({**CONFIG, "tokens": ["<pad>"]}, "a" * 64) != key
+    # Training-only settings do not invalidate the prepared dataset
+    assert preprocessing_key({**CONFIG, "learning_rate": 0.0001, "num_epochs": 3}, "a" * 64) == key
+
+def test_preproc_cache_hit_and_miss(tmp_path):
+    cache = PreprocCache(str(tmp_path / ".preprocessed"), max_entries=4)
+    key = preprocessing_key(CONFIG, "a" * 64)
+    restored = str(tmp_path / "run" / "last_run_prepared")
+    assert not cache.restore(key, restored)
+    assert not os.path.exists(restored)
+
+    cache.store(key, prepared_folder(tmp_path / "prepared", "tokens"))
+    assert cache.restore(key, restored)
+    with open(os.path.join(restored, "data.arrow")) as f:
+        assert f.read() == "tokens"
+    assert not cache.restore(preprocessing_key(CONFIG, "b" * 64), str(tmp_path / "other"))
+    assert not cache.restore(preprocessing_key({**CONFIG, "sequence_len": 1024}, "a" * 64), str(tmp_path / "other"))
+
+def test_preproc_cache_evicts_least_recently_used(tmp_path):
+    cache = PreprocCache(str(tmp_path / ".preprocessed"), max_entries=2)
+    for name in ("a", "b"):
+        cache.store(name, prepared_folder(tmp_path / name, name))
+        time.sleep(0.01)
+    # Using "a" makes "b" the least recently used entry
+    assert cache.restore("a", str(tmp_path / "restored"))
+    time.sleep(0.01)
+    cache.store("c", prepared_folder(tmp_path / "c", "c"))
+    assert [entry["key"] for entry in cache.entries()] == ["a", "c"]
+    assert not cache.restore("b", str(tmp_path / "restored-b"))
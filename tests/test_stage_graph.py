@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from stage_graph import Stage, run_stages, write_stage_timings
+
+def test_stages_run_after_their_dependencies_with_their_results():
+    order = []
+
+    def stage(name, value):
+        def fn(*deps):
+            order.append(name)
+            return value + sum(deps)
+        return fn
+
+    results, timings = run_stages([
+        Stage("train", stage("train", 100), ["preprocess", "download"]),
+        Stage("preprocess", stage("preprocess", 10), ["stage_data"]),
+        Stage("stage_data", stage("stage_data", 1)),
+        Stage("download", stage("download", 1000)),
+    ])
+    assert results == {"stage_data": 1, "download": 1000, "preprocess": 11, "train": 1111}
+    assert order.index("stage_data") < order.index("preprocess") < order.index("train")
+    assert order.index("download") < order.index("train")
+    assert all(timing["status"] == "ok" for timing in timings.values())
+    assert timings["train"]["deps"] == ["preprocess", "download"]
+    assert timings["train"]["start"] >= timings["preprocess"]["start"] + timings["preprocess"]["seconds"]
+
+def test_independent_stages_fan_out_concurrently():
+    # Both stages only finish once the other has started, which needs them to run at the same time
+    started = {name: threading.Event() for name in ("download", "stage_data")}
+
+    def stage(name, other):
+        def fn():
+            started[name].set()
+            assert started[other].wait(timeout=5)
+            return name
+        return fn
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results, timings = run_stages([
+            Stage("download", stage("download", "stage_data")),
+            Stage("stage_data", stage("stage_data", "download")),
+            Stage("train", lambda *deps: deps, ["download", "stage_data"]),
+        ], executor=executor)
+    assert results["train"] == ("download", "stage_data")
+
+def test_failure_skips_downstream_stages_and_keeps_timings():
+    ran = []
+
+    def fail():
+        time.sleep(0.05)
+        raise RuntimeError("preprocess failed")
+
+    def slow():
+        time.sleep(0.1)
+        ran.append("download")
+
+    timings = {}
+    with pytest.raises(RuntimeError, match="preprocess failed"):
+        run_stages([
+            Stage("download", slow),
+            Stage("preprocess", fail),
+            Stage("train", lambda *deps: ran.append("train"), ["download", "preprocess"]),
+            Stage("report", lambda *deps: ran.append("report"), ["train"]),
+        ], timings=timings)
+    # Stages already running finish; nothing downstream of the failure starts
+    assert ran == ["download"]
+    assert timings["preprocess"]["status"] == "failed: preprocess failed"
+    assert timings["download"]["status"] == "ok"
+    assert "train" not in timings and "report" not in timings
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError, match="unknown"):
+        run_stages([Stage("train", lambda x: x, ["preprocess"])])
+    with pytest.raises(ValueError, match="unique"):
+        run_stages([Stage("a", lambda: 1), Stage("a", lambda: 2)])
+    with pytest.raises(ValueError, match="cycle"):
+        run_stages([Stage("a", lambda x: x, ["b"]), Stage("b", lambda x: x, ["a"])])
+
+def test_timings_are_written_in_start_order(tmp_path):
+    _, timings = run_stages([Stage("b", lambda a: a, ["a"]), Stage("a", lambda: 1)])
+    path = tmp_path / "stage_timings.json"
+    write_stage_timings(str(path), timings)
+    assert list(json.loads(path.read_text())) == ["a", "b"]
@@ -0,0 +1,38 @@
+import sys
+
+from telemetry import LAUNCH_METRICS_FILE, call_with_peak_rss, load_metrics, measure, record_metric, summarize
+
+MB = 1024 * 1024
+
+def test_peak_rss_belongs_to_each_block(tmp_path):
+    with measure(str(tmp_path), "train", "large"):
+        data = b"x" * (400 * MB)
+    del data
+    with measure(str(tmp_path), "train", "small"):
+        data = b"x" * (40 * MB)
+    del data
+
+    large, small = load_metrics(str(tmp_path))
+    assert large["peak_rss_bytes"] > small["peak_rss_bytes"] + 200 * MB
+    assert small["ok"] and large["ok"]
+
+def test_subprocess_peak_is_its_own(tmp_path):
+    with measure(str(tmp_path), "preproc", "subprocess") as fields:
+        code = "import sys, time; data = b'x' * (300 * 1024 * 1024); time.sleep(0.5); sys.exit(3)"
+        fields["exit_code"], fields["child_peak_rss_bytes"] = call_with_peak_rss([sys.executable, "-c", code])
+    with measure(str(tmp_path), "train", "subprocess") as fields:
+        fields["exit_code"], fields["child_peak_rss_bytes"] = call_with_peak_rss([sys.executable, "-c", "pass"])
+
+    preproc, train = load_metrics(str(tmp_path))
+    assert preproc["exit_code"] == 3 and train["exit_code"] == 0
+    assert preproc["child_peak_rss_bytes"] > 300 * MB > train["child_peak_rss_bytes"]
+    summary = summarize([preproc, train])["preproc/subprocess"]
+    assert summary["peak_rss_bytes"] == max(preproc["peak_rss_bytes"], preproc["child_peak_rss_bytes"])
+
+def test_launch_metrics_are_loaded_with_the_stage_metrics(tmp_path):
+    record_metric(str(tmp_path), "train", "volume_commit", seconds=1.0)
+    record_metric(str(tmp_path), "launch", "train", LAUNCH_METRICS_FILE, seconds=2.0)
+
+    assert [line["step"] for line in load_metrics(str(tmp_path))] == ["volume_commit", "train"]
+    with open(tmp_path / LAUNCH_METRICS_FILE) as f:
+        assert len(f.readlines()) == 1
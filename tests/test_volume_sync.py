@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from volume_sync import MANIFEST_FILE, LocalVolume, VolumeSync, changed_files, scan_folder
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+@pytest.fixture
+def volume(tmp_path):
+    return LocalVolume(str(tmp_path / "remote"), str(tmp_path / "mount"))
+
+def test_manifest_diff_reports_added_modified_and_removed_files(tmp_path):
+    folder = str(tmp_path / "run")
+    write(f"{folder}/config.yml", "a: 1")
+    write(f"{folder}/data.jsonl", "{}")
+    before = scan_folder(folder)
+
+    write(f"{folder}/config.yml", "a: 2")
+    os.remove(f"{folder}/data.jsonl")
+    write(f"{folder}/lora-out/adapter_config.json", "{}")
+    assert changed_files(before, scan_folder(folder, before)) == [
+        "config.yml", "data.jsonl", os.path.join("lora-out", "adapter_config.json"),
+    ]
+
+def test_touched_file_with_same_contents_is_unchanged(tmp_path):
+    folder = str(tmp_path / "run")
+    write(f"{folder}/config.yml", "a: 1")
+    before = scan_folder(folder)
+    stat = os.stat(f"{folder}/config.yml")
+    os.utime(f"{folder}/config.yml", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert changed_files(before, scan_folder(folder, before)) == []
+
+def test_commit_is_skipped_when_nothing_changed(volume):
+    sync = VolumeSync(volume)
+    folder = os.path.join(volume.mount_dir, "run")
+    write(f"{folder}/config.yml", "a: 1")
+
+    assert sync.commit(folder) == {folder: 1}
+    assert volume.commits == 1
+    assert os.path.exists(os.path.join(volume.remote_dir, "run", MANIFEST_FILE))
+
+    assert sync.commit(folder) == {folder: 1}
+    assert volume.commits == 1
+
+    write(f"{folder}/config.yml", "a: 2")
+    assert sync.commit(folder) == {folder: 2}
+    assert volume.commits == 2
+
+def test_reload_is_skipped_when_the_mount_has_the_generation(volume, tmp_path):
+    folder = os.path.join(volume.mount_dir, "run")
+    write(f"{folder}/config.yml", "a: 1")
+    generation = VolumeSync(volume).commit(folder)[folder]
+
+    # Another container with the same remote
+    other = LocalVolume(volume.remote_dir, str(tmp_path / "other"))
+    other_sync = VolumeSync(other)
+    other_folder = os.path.join(other.mount_dir, "run")
+    assert not other_sync.reload(other_folder, generation)
+    assert other.reloads == 0
+
+    write(f"{folder}/config.yml", "a: 2")
+    generation = VolumeSync(volume).commit(folder)[folder]
+    assert other_sync.reload(other_folder, generation)
+    with open(f"{other_folder}/config.yml") as f:
+        assert f.read() == "a: 2"
+
+def test_reload_with_required_paths(volume):
+    sync = VolumeSync(volume)
+    present = os.path.join(volume.mount_dir, "present")
+    write(present, "x")
+    assert not sync.reload(required=[present])
+    assert sync.reload(required=[present, os.path.join(volume.mount_dir, "missing")])
+    assert sync.reload()
+
+def test_deletes_are_committed_and_reach_other_containers(volume, tmp_path):
+    sync = VolumeSync(volume)
+    folder = os.path.join(volume.mount_dir, "run")
+    write(f"{folder}/checkpoint-500/model.bin", "weights")
+    write(f"{folder}/config.yml", "a: 1")
+    sync.commit(folder)
+
+    os.remove(f"{folder}/checkpoint-500/model.bin")
+    assert sync.commit(folder) == {folder: 2}
+    assert volume.commits == 2
+    assert "checkpoint-500/model.bin" not in VolumeSync.read_manifest(folder)["files"]
+
+    other = LocalVolume(volume.remote_dir, str(tmp_path / "other"))
+    assert not os.path.exists(os.path.join(other.mount_dir, "run", "checkpoint-500", "model.bin"))
+    assert os.path.exists(os.path.join(other.mount_dir, "run", "config.yml"))